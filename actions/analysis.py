@@ -0,0 +1,142 @@
+"""Per-turn message analysis shared by the actions that run in the same turn
+
+Stories run ``action_extract_context`` and then ``action_intelligent_response``
+or ``action_compare_products`` on the same user message. The first action to
+look at a message scans it and stores the result here; the others reuse it.
+
+Entries are keyed by (sender_id, message_id), falling back to a hash of the
+text when the channel sends no message id. The cache is a bounded LRU with a
+TTL, so memory stays flat however many senders are active. Size and TTL come
+from ``VASPX_ANALYSIS_CACHE_SIZE`` and ``VASPX_ANALYSIS_CACHE_TTL`` (seconds).
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, NamedTuple, Optional, Text, Tuple
+
+from rasa_sdk import Tracker
+
+from .matcher import MatchResult, scan
+from .recommender import rank_industries
+
+DEFAULT_MAX_SIZE = int(os.environ.get('VASPX_ANALYSIS_CACHE_SIZE', 4096))
+DEFAULT_TTL = float(os.environ.get('VASPX_ANALYSIS_CACHE_TTL', 60))
+
+INSTITUTE_TYPES = ('school', 'college', 'university')
+
+
+class MessageAnalysis(NamedTuple):
+    """Everything the actions derive from the text of one user message
+
+    Shared between actions, so treat it as read-only.
+    """
+    text: Text
+    match: MatchResult
+    products: Tuple[Text, ...]
+    product_mask: int
+    industries: Tuple[Text, ...]
+    institute_type: Optional[Text]
+
+
+def analyze_text(text: Text) -> MessageAnalysis:
+    """Scan `text` once and derive products, ranked industries and institute type"""
+    match = scan(text)
+    return MessageAnalysis(
+        text=match.text,
+        match=match,
+        products=tuple(match.products()),
+        product_mask=match.product_mask(),
+        industries=rank_industries(match.text),
+        institute_type=match.first_of('institute', INSTITUTE_TYPES),
+    )
+
+
+class AnalysisCache:
+    """Bounded LRU of message analyses with TTL eviction and hit/miss counters"""
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE, ttl: float = DEFAULT_TTL,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: 'OrderedDict[Tuple[Text, Text], Tuple[float, MessageAnalysis]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def key_for(tracker: Tracker) -> Tuple[Text, Text]:
+        """Cache key for the latest user message on `tracker`"""
+        message = tracker.latest_message or {}
+        message_id = message.get('message_id')
+        if not message_id:
+            text = message.get('text') or ''
+            message_id = hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+        return tracker.sender_id, message_id
+
+    def get(self, tracker: Tracker) -> MessageAnalysis:
+        """Analysis of the latest user message, computed on first use in a turn"""
+        key = self.key_for(tracker)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+
+        analysis = analyze_text(tracker.latest_message.get('text', ''))
+
+        with self._lock:
+            self._entries[key] = (now + self.ttl, analysis)
+            self._entries.move_to_end(key)
+            self._evict(now)
+        return analysis
+
+    def _evict(self, now: float) -> None:
+        # Least recently used entries sit at the front; drop expired ones
+        # there first, then whatever is still over the size bound.
+        while self._entries:
+            key, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_size:
+                break
+            del self._entries[key]
+            if expires_at <= now:
+                self.expirations += 1
+            else:
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[Text, Any]:
+        """Counters for monitoring the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+ANALYSIS_CACHE = AnalysisCache()
+
+
+def analyze(tracker: Tracker) -> MessageAnalysis:
+    """Shared analysis of the latest user message on `tracker`"""
+    return ANALYSIS_CACHE.get(tracker)
@@ -0,0 +1,404 @@
+"""Product catalog and response templates for the custom actions
+
+Product facts (phone numbers, experience, client counts, aliases) and the
+response texts built from them live in ``catalog.yml`` next to this module, or
+in the file named by the ``VASPX_CATALOG`` environment variable. Changing a
+phone number means editing that file and restarting the action server; no code
+change or model retrain is needed.
+
+The file is loaded and validated once at import. Templates are compiled once
+and every response is rendered at import for each product set and each
+output format (see ``formatting.py``), so producing a response on the hot
+path is a dictionary hit keyed by the channel's format.
+"""
+import itertools
+import os
+import re
+from typing import Any, Dict, FrozenSet, Iterable, List, Mapping, Optional, Sequence, Text, Tuple
+
+import yaml
+
+from .formatting import FORMATS, channel_format, render_format
+
+CATALOG_PATH = os.environ.get(
+    'VASPX_CATALOG', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalog.yml')
+)
+
+# Response kind that selects the comparison for a product set
+COMPARISON = 'comparison'
+
+# Placeholders that depend on the product set being rendered
+DYNAMIC_FIELDS = frozenset(['products', 'products_upper'])
+
+PRODUCT_FIELDS = ('label', 'industry', 'summary', 'phone', 'aliases')
+
+INDUSTRY_FIELDS = ('label', 'phone', 'keywords', 'text')
+
+FALLBACK_FIELDS = ('template', 'keywords')
+
+COMPARISON_FIELDS = ('products', 'text')
+
+
+class CatalogError(ValueError):
+    """Raised when the catalog file is malformed or references unknown names"""
+
+
+class CompiledTemplate:
+    """A response template pre-split into literal text and placeholder names
+
+    Placeholders are written ``$name`` or ``${name}``.
+    """
+
+    _PLACEHOLDER = re.compile(r'\$(?:(\w+)|\{(\w+)\})')
+
+    __slots__ = ('source', 'fields', '_literals', '_names')
+
+    def __init__(self, source: Text) -> None:
+        self.source = source
+        literals: List[Text] = []
+        names: List[Text] = []
+        position = 0
+        for match in self._PLACEHOLDER.finditer(source):
+            literals.append(source[position:match.start()])
+            names.append(match.group(1) or match.group(2))
+            position = match.end()
+        literals.append(source[position:])
+        self._literals = tuple(literals)
+        self._names = tuple(names)
+        self.fields: FrozenSet[Text] = frozenset(names)
+
+    def render(self, context: Mapping[Text, Text]) -> Text:
+        """Fill every placeholder from `context`"""
+        parts = [self._literals[0]]
+        for name, literal in zip(self._names, self._literals[1:]):
+            parts.append(context[name])
+            parts.append(literal)
+        return ''.join(parts)
+
+
+class Catalog:
+    """Validated product facts plus compiled templates for every response kind"""
+
+    def __init__(self, data: Any, source: Text = '<catalog>') -> None:
+        self.source = source
+        if not isinstance(data, dict):
+            raise CatalogError(f"{source}: expected a mapping at the top level")
+
+        phones = self._section(data, 'phones')
+        emails = self._section(data, 'emails')
+        products = self._section(data, 'products')
+
+        self.products: Tuple[Text, ...] = tuple(products)
+        self.product_bits: Dict[Text, int] = {
+            product: 1 << index for index, product in enumerate(self.products)
+        }
+        self.labels: Dict[Text, Text] = {}
+        self.aliases: Dict[Text, Tuple[Text, ...]] = {}
+        self.facts: Dict[Text, Dict[Text, Any]] = {}
+
+        # Placeholders that are the same for every product set
+        self.context: Dict[Text, Text] = {}
+        for key, number in phones.items():
+            self.context[f'{key}_phone'] = str(number)
+        for key, address in emails.items():
+            self.context[f'{key}_email'] = str(address)
+
+        for product, facts in products.items():
+            if not isinstance(facts, dict):
+                raise CatalogError(f"{source}: product '{product}' must be a mapping")
+            missing = [field for field in PRODUCT_FIELDS if field not in facts]
+            if missing:
+                raise CatalogError(
+                    f"{source}: product '{product}' is missing {', '.join(missing)}"
+                )
+            if facts['phone'] not in phones:
+                raise CatalogError(
+                    f"{source}: product '{product}' uses unknown phone '{facts['phone']}'"
+                )
+            self.labels[product] = str(facts['label'])
+            self.aliases[product] = tuple(str(alias).lower() for alias in facts['aliases'])
+            self.facts[product] = facts
+            for field, value in facts.items():
+                if field == 'aliases':
+                    continue
+                if field == 'phone':
+                    value = phones[value]
+                self.context[f'{product}_{field}'] = str(value)
+
+        self.templates: Dict[Text, CompiledTemplate] = {
+            str(name): CompiledTemplate(str(text))
+            for name, text in self._section(data, 'templates').items()
+        }
+        # Where each comparison came from: overview, suggestion, authored or generated
+        self.comparison_sources: Dict[int, Text] = {}
+        self.comparisons = self._build_comparisons(self._section(data, 'comparisons'))
+
+        recommendations = self._section(data, 'recommendations')
+        self.min_industry_score = float(recommendations.get('min_score', 0.5))
+        self.max_industries = int(recommendations.get('max_industries', 3))
+        bonus = recommendations.get('extra_keyword_bonus')
+        self.extra_keyword_bonus = None if bonus is None else float(bonus)
+        self.industries: Tuple[Text, ...] = ()
+        self.industry_keywords: Dict[Text, Dict[Text, float]] = {}
+        self.recommendations = self._build_recommendations(
+            self._section(recommendations, 'industries'), phones
+        )
+
+        fallback = self._section(data, 'fallback')
+        self.min_fallback_score = float(fallback.get('min_score', 0.5))
+        self.fallback_routes: Tuple[Text, ...] = ()
+        self.fallback_keywords: Dict[Text, Dict[Text, float]] = {}
+        self.fallback_templates: Dict[Text, Text] = {}
+        self.off_topic_routes: FrozenSet[Text] = frozenset()
+        self._build_fallback(self._section(fallback, 'routes'))
+
+        for name, template in list(self.templates.items()) + [
+            (f'{COMPARISON}[{mask}]', template) for mask, template in self.comparisons.items()
+        ] + [
+            (f"recommendation[{'+'.join(industries)}]", template)
+            for industries, template in self.recommendations.items()
+        ]:
+            unknown = template.fields - set(self.context) - DYNAMIC_FIELDS
+            if unknown:
+                raise CatalogError(
+                    f"{source}: template '{name}' uses unknown placeholder(s) "
+                    f"{', '.join(sorted(unknown))}"
+                )
+
+    def _section(self, data: Dict[Text, Any], name: Text) -> Dict[Any, Any]:
+        section = data.get(name)
+        if not isinstance(section, dict) or not section:
+            raise CatalogError(f"{self.source}: missing or empty '{name}' section")
+        return section
+
+    def _build_comparisons(self, section: Dict[Text, Any]) -> Dict[int, CompiledTemplate]:
+        """Compile a comparison for every subset of the product catalog"""
+        if 'overview' not in section:
+            raise CatalogError(f"{self.source}: comparisons need an 'overview'")
+        comparisons = {0: CompiledTemplate(str(section['overview']))}
+        self.comparison_sources[0] = 'overview'
+
+        for product, text in (section.get('suggestions') or {}).items():
+            mask = self.product_mask([product])
+            comparisons[mask] = CompiledTemplate(str(text))
+            self.comparison_sources[mask] = 'suggestion'
+
+        for number, entry in enumerate(section.get('authored') or [], 1):
+            name = f"authored comparison #{number}"
+            if not isinstance(entry, dict):
+                raise CatalogError(f"{self.source}: {name} must be a mapping")
+            if isinstance(entry.get('products'), list):
+                name += f" ({', '.join(map(str, entry['products']))})"
+            missing = [field for field in COMPARISON_FIELDS if not entry.get(field)]
+            if missing:
+                raise CatalogError(f"{self.source}: {name} is missing {', '.join(missing)}")
+            if not isinstance(entry['products'], list):
+                raise CatalogError(f"{self.source}: {name} needs a list of products")
+            mask = self.product_mask(entry['products'])
+            comparisons[mask] = CompiledTemplate(str(entry['text']))
+            self.comparison_sources[mask] = 'authored'
+
+        # Anything nobody has written by hand gets a generated comparison
+        for mask in range(1, 1 << len(self.products)):
+            if mask not in comparisons:
+                comparisons[mask] = CompiledTemplate(
+                    self._generated_comparison(self.products_from_mask(mask))
+                )
+                self.comparison_sources[mask] = 'generated'
+        return comparisons
+
+    def _generated_comparison(self, products: List[Text]) -> Text:
+        """Template source for a product combination without an authored comparison"""
+        lines = [f"**{' | '.join(self.labels[product] for product in products)}:**", ""]
+        phones: Dict[Text, List[Text]] = {}
+        for product in products:
+            lines.append(
+                f"**{self.labels[product].upper()} ({self.facts[product]['industry']}):** "
+                f"${product}_summary"
+            )
+            phones.setdefault(self.facts[product]['phone'], []).append(self.labels[product])
+        lines.append("")
+        lines.append("📞 " + " | ".join(
+            f"{'/'.join(labels)}: ${key}_phone" for key, labels in phones.items()
+        ))
+        return "\n".join(lines)
+
+    def _keywords(self, kind: Text, name: Text, keywords: Any) -> Dict[Text, float]:
+        if not isinstance(keywords, dict) or not keywords or not all(
+                isinstance(weight, (int, float)) and weight > 0 for weight in keywords.values()):
+            raise CatalogError(
+                f"{self.source}: {kind} '{name}' needs keywords with positive weights"
+            )
+        return {str(keyword).lower(): float(weight) for keyword, weight in keywords.items()}
+
+    def _build_fallback(self, section: Dict[Text, Any]) -> None:
+        off_topic = set()
+        for route, entry in section.items():
+            if not isinstance(entry, dict):
+                raise CatalogError(f"{self.source}: fallback route '{route}' must be a mapping")
+            missing = [field for field in FALLBACK_FIELDS if field not in entry]
+            if missing:
+                raise CatalogError(
+                    f"{self.source}: fallback route '{route}' is missing {', '.join(missing)}"
+                )
+            if entry['template'] not in self.templates:
+                raise CatalogError(
+                    f"{self.source}: fallback route '{route}' uses unknown template "
+                    f"'{entry['template']}'"
+                )
+            self.fallback_keywords[route] = self._keywords('fallback route', route, entry['keywords'])
+            self.fallback_templates[route] = str(entry['template'])
+            if entry.get('off_topic_only'):
+                off_topic.add(route)
+        self.fallback_routes = tuple(section)
+        self.off_topic_routes = frozenset(off_topic)
+
+    def _build_recommendations(self, section: Dict[Text, Any],
+                               phones: Dict[Text, Any]) -> Dict[Tuple[Text, ...], CompiledTemplate]:
+        """Compile a recommendation for every ranking of up to `max_industries` industries"""
+        labels: Dict[Text, Text] = {}
+        texts: Dict[Text, Text] = {}
+        industry_phones: Dict[Text, Text] = {}
+        for industry, entry in section.items():
+            if not isinstance(entry, dict):
+                raise CatalogError(f"{self.source}: industry '{industry}' must be a mapping")
+            missing = [field for field in INDUSTRY_FIELDS if field not in entry]
+            if missing:
+                raise CatalogError(
+                    f"{self.source}: industry '{industry}' is missing {', '.join(missing)}"
+                )
+            if entry['phone'] not in phones:
+                raise CatalogError(
+                    f"{self.source}: industry '{industry}' uses unknown phone '{entry['phone']}'"
+                )
+            self.industry_keywords[industry] = self._keywords('industry', industry, entry['keywords'])
+            labels[industry] = str(entry['label'])
+            texts[industry] = str(entry['text']).rstrip()
+            industry_phones[industry] = entry['phone']
+        self.industries = tuple(section)
+
+        recommendations = {}
+        for size in range(1, min(self.max_industries, len(self.industries)) + 1):
+            for ranking in itertools.permutations(self.industries, size):
+                by_phone: Dict[Text, List[Text]] = {}
+                for industry in ranking:
+                    by_phone.setdefault(industry_phones[industry], []).append(labels[industry])
+                if len(by_phone) == 1:
+                    contact = f"📞 Demo: ${next(iter(by_phone))}_phone"
+                else:
+                    contact = "📞 Demo: " + " | ".join(
+                        f"{'/'.join(names)}: ${key}_phone" for key, names in by_phone.items()
+                    )
+                recommendations[ranking] = CompiledTemplate(
+                    "\n\n".join([texts[industry] for industry in ranking] + [contact])
+                )
+        return recommendations
+
+    def product_mask(self, products: Iterable[Text]) -> int:
+        """Bitmask for a collection of canonical product names"""
+        mask = 0
+        for product in products:
+            try:
+                mask |= self.product_bits[product]
+            except KeyError:
+                raise CatalogError(f"{self.source}: unknown product '{product}'") from None
+        return mask
+
+    def products_from_mask(self, mask: int) -> List[Text]:
+        """Canonical product names set in `mask`, in catalog order"""
+        return [product for product in self.products if mask & self.product_bits[product]]
+
+    def fill(self, text: Text, name: Text = 'text') -> Text:
+        """`text` with its placeholders filled from the facts shared by every product set"""
+        template = CompiledTemplate(text)
+        unknown = template.fields - set(self.context)
+        if unknown:
+            raise CatalogError(
+                f"{self.source}: {name} uses unknown placeholder(s) {', '.join(sorted(unknown))}"
+            )
+        return template.render(self.context)
+
+    def context_for(self, mask: int) -> Dict[Text, Text]:
+        """Placeholder values for rendering against the products in `mask`"""
+        labels = [self.labels[product] for product in self.products_from_mask(mask)]
+        context = dict(self.context)
+        context['products'] = ', '.join(labels)
+        context['products_upper'] = ', '.join(labels).upper()
+        return context
+
+
+class ResponseRenderer:
+    """Renders catalog templates, caching each (product set, kind, output format)
+
+    Recommendations are cached the same way per ranking of industries.
+    :meth:`prerender` fills the cache for every kind, product set, ranking and
+    format up front; the channel of a message only selects the format.
+    """
+
+    def __init__(self, catalog: Catalog) -> None:
+        self.catalog = catalog
+        self._cache: Dict[Tuple[int, Text, Text], Text] = {}
+        self._recommendations: Dict[Tuple[Tuple[Text, ...], Text], Text] = {}
+
+    def render(self, kind: Text, mask: int = 0, channel: Optional[Text] = None) -> Text:
+        """Response text of `kind` for the products in `mask` on `channel`"""
+        if kind != COMPARISON and not self.catalog.templates[kind].fields & DYNAMIC_FIELDS:
+            # Same text for every product set
+            mask = 0
+        key = (mask, kind, channel_format(channel))
+        try:
+            return self._cache[key]
+        except KeyError:
+            return self._render(*key)
+
+    def render_recommendation(self, industries: Sequence[Text],
+                              channel: Optional[Text] = None) -> Text:
+        """Recommendation for `industries`, best match first, on `channel`"""
+        key = (tuple(industries), channel_format(channel))
+        try:
+            return self._recommendations[key]
+        except KeyError:
+            return self._render_recommendation(*key)
+
+    def _render_recommendation(self, industries: Tuple[Text, ...], output_format: Text) -> Text:
+        template = self.catalog.recommendations[industries]
+        text = render_format(template.render(self.catalog.context), output_format)
+        self._recommendations[(industries, output_format)] = text
+        return text
+
+    def _render(self, mask: int, kind: Text, output_format: Text) -> Text:
+        if kind == COMPARISON:
+            template = self.catalog.comparisons[mask]
+        else:
+            template = self.catalog.templates[kind]
+        text = render_format(template.render(self.catalog.context_for(mask)), output_format)
+        self._cache[(mask, kind, output_format)] = text
+        return text
+
+    def prerender(self) -> int:
+        """Render every kind for every product set in every format; returns the count"""
+        masks = range(1 << len(self.catalog.products))
+        for output_format in FORMATS:
+            for mask in masks:
+                self._render(mask, COMPARISON, output_format)
+            for kind, template in self.catalog.templates.items():
+                for mask in (masks if template.fields & DYNAMIC_FIELDS else (0,)):
+                    self._render(mask, kind, output_format)
+            for industries in self.catalog.recommendations:
+                self._render_recommendation(industries, output_format)
+        return len(self._cache) + len(self._recommendations)
+
+
+def load_catalog(path: Text = CATALOG_PATH) -> Catalog:
+    """Load and validate the catalog file at `path`"""
+    try:
+        with open(path, encoding='utf-8') as catalog_file:
+            data = yaml.safe_load(catalog_file)
+    except (OSError, yaml.YAMLError) as error:
+        raise CatalogError(f"{path}: cannot load catalog: {error}") from error
+    return Catalog(data, source=path)
+
+
+CATALOG = load_catalog()
+RENDERER = ResponseRenderer(CATALOG)
+RENDERER.prerender()
@@ -0,0 +1,238 @@
+"""Conversation context kept per sender and updated incrementally
+
+``action_extract_context`` used to look at the latest message only, so a
+product named two turns earlier was forgotten. Each sender now has a small
+``SenderContext``: the products seen with the turn they were last mentioned,
+the institute type, the industry and size hints such as "1200 students" or
+"40 buses". When the action runs it reads only the tracker events that
+arrived after the newest event it has already seen (walking back from the
+end of the event list), folds the new user messages into the context and
+returns ``SlotSet`` events for the slots whose value changed, with None for
+a slot whose value the context no longer has (after a restart or a new
+session, say).
+
+The contexts sit in a bounded LRU with a TTL (``VASPX_CONTEXT_CACHE_SIZE``,
+``VASPX_CONTEXT_CACHE_TTL`` seconds). A sender whose context was evicted, or
+who reaches another action server process, starts again from the slots on
+the tracker and the events since the action last ran, so the work per turn
+stays the same however long the conversation is.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Text, Tuple
+
+from rasa_sdk import Tracker
+
+from .analysis import MessageAnalysis, analyze, analyze_text
+from .catalog import CATALOG
+
+DEFAULT_MAX_SIZE = int(os.environ.get('VASPX_CONTEXT_CACHE_SIZE', 10000))
+DEFAULT_TTL = float(os.environ.get('VASPX_CONTEXT_CACHE_TTL', 1800))
+
+# Most events read back when a sender has no context in memory
+MAX_REBUILD_EVENTS = 200
+
+# Events after which a conversation starts from an empty context
+RESET_EVENTS = ('session_started', 'restart')
+
+# Counted things, as written by users, mapped onto one unit each
+SIZE_UNITS = {
+    'student': 'students', 'pupil': 'students',
+    'staff': 'staff', 'teacher': 'staff', 'employee': 'staff',
+    'branch': 'branches', 'campus': 'branches', 'school': 'branches',
+    'bus': 'vehicles', 'vehicle': 'vehicles', 'truck': 'vehicles',
+    'warehouse': 'warehouses',
+    'ton': 'tonnes', 'tonne': 'tonnes', 'pallet': 'pallets',
+}
+UNIT_ORDER = tuple(dict.fromkeys(SIZE_UNITS.values()))
+_SIZE = re.compile(
+    r'(\d[\d,]*)\s*\+?\s*(' + '|'.join(sorted(SIZE_UNITS, key=len, reverse=True)) + r')(?:e?s)?\b'
+)
+
+
+class SenderContext:
+    """What one conversation has told us so far"""
+
+    __slots__ = ('cursor', 'turn', 'products', 'institute_type', 'industry', 'size_hints')
+
+    def __init__(self) -> None:
+        # Timestamp of the newest event already folded in
+        self.cursor = 0.0
+        self.turn = 0
+        # product -> turn it was last mentioned in
+        self.products: Dict[Text, int] = {}
+        self.institute_type: Optional[Text] = None
+        self.industry: Optional[Text] = None
+        # unit -> latest count
+        self.size_hints: Dict[Text, int] = {}
+
+    @classmethod
+    def from_slots(cls, tracker: Tracker) -> 'SenderContext':
+        """Context seeded from the slots a previous run left on `tracker`"""
+        context = cls()
+        recent = tracker.get_slot('products_mentioned') or []
+        # Most recent first, so older products get lower turns
+        for age, product in enumerate(reversed(recent)):
+            if product in CATALOG.product_bits:
+                context.products[product] = age - len(recent)
+        product = tracker.get_slot('product_name')
+        if product in CATALOG.product_bits and product not in context.products:
+            context.products[product] = -len(recent) - 1
+        context.institute_type = tracker.get_slot('institute_type')
+        context.industry = tracker.get_slot('industry')
+        for count, unit in _SIZE.findall(tracker.get_slot('size_hint') or ''):
+            context.size_hints[SIZE_UNITS[unit]] = int(count.replace(',', ''))
+        return context
+
+    def update(self, analysis: MessageAnalysis, entities: List[Dict[Text, Any]]) -> None:
+        """Fold one user message into the context"""
+        self.turn += 1
+        products = list(analysis.products)
+        for entity in entities:
+            value = str(entity.get('value') or '').lower()
+            if entity.get('entity') == 'product_name' and value in CATALOG.product_bits:
+                products.append(value)
+            elif entity.get('entity') == 'institute_type' and not analysis.institute_type:
+                self.institute_type = value or self.institute_type
+        for product in products:
+            self.products[product] = self.turn
+        if analysis.institute_type:
+            self.institute_type = analysis.institute_type
+        if analysis.industries:
+            self.industry = analysis.industries[0]
+        for count, unit in _SIZE.findall(analysis.text):
+            self.size_hints[SIZE_UNITS[unit]] = int(count.replace(',', ''))
+
+    def slot_values(self) -> Dict[Text, Any]:
+        """Value of every context slot; None where nothing is known"""
+        order = {product: index for index, product in enumerate(CATALOG.products)}
+        # Latest mention first; within a message, catalog order
+        recent = sorted(self.products, key=lambda product: (-self.products[product], order[product]))
+        units = sorted(self.size_hints, key=UNIT_ORDER.index)
+        return {
+            'product_name': recent[0] if recent else None,
+            'products_mentioned': recent or None,
+            'institute_type': self.institute_type,
+            'industry': self.industry,
+            'size_hint': ', '.join(f'{self.size_hints[unit]} {unit}' for unit in units) or None,
+        }
+
+
+def _newest_first(events: List[Dict[Text, Any]], limit: int) -> Iterator[Dict[Text, Any]]:
+    for index in range(len(events) - 1, max(-1, len(events) - 1 - limit), -1):
+        yield events[index]
+
+
+def new_events(events: List[Dict[Text, Any]], cursor: float,
+               stop_action: Optional[Text] = None,
+               limit: int = MAX_REBUILD_EVENTS) -> Tuple[List[Dict[Text, Any]], float]:
+    """User and reset events newer than `cursor`, oldest first, and the newest timestamp seen
+
+    Walks back from the end of `events` and stops at the first event not newer
+    than `cursor`, at an execution of `stop_action`, or after `limit` events.
+    """
+    found = []
+    newest = cursor
+    for event in _newest_first(events, limit):
+        timestamp = event.get('timestamp') or 0.0
+        if timestamp <= cursor:
+            break
+        if stop_action and event.get('event') == 'action' and event.get('name') == stop_action:
+            break
+        newest = max(newest, timestamp)
+        if event.get('event') == 'user' or event.get('event') in RESET_EVENTS:
+            found.append(event)
+    found.reverse()
+    return found, newest
+
+
+class ContextStore:
+    """Bounded LRU of sender contexts with TTL eviction and hit/miss counters"""
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE, ttl: float = DEFAULT_TTL,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: 'OrderedDict[Text, Tuple[float, SenderContext]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.events_read = 0
+
+    def _take(self, sender_id: Text) -> Optional[SenderContext]:
+        with self._lock:
+            entry = self._entries.pop(sender_id, None)
+            if entry is not None and entry[0] > self._clock():
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def _put(self, sender_id: Text, context: SenderContext) -> None:
+        with self._lock:
+            self._entries[sender_id] = (self._clock() + self.ttl, context)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def extract(self, tracker: Tracker, action_name: Text) -> Dict[Text, Any]:
+        """Context slots of `tracker`'s sender whose value differs from the tracker's
+
+        A slot set on the tracker that the context has no value for comes
+        back as None, so it is cleared.
+        """
+        context = self._take(tracker.sender_id)
+        stop_action = None
+        if context is None:
+            context = SenderContext.from_slots(tracker)
+            # The slots cover everything up to the action's previous run
+            stop_action = action_name
+
+        events, cursor = new_events(tracker.events, context.cursor, stop_action)
+        context.cursor = cursor
+        latest_id = (tracker.latest_message or {}).get('message_id')
+        for event in events:
+            if event.get('event') in RESET_EVENTS:
+                context = SenderContext()
+                context.cursor = cursor
+                continue
+            parse_data = event.get('parse_data') or {}
+            if latest_id and event.get('message_id') == latest_id:
+                # Shared with the other actions of this turn
+                analysis = analyze(tracker)
+            else:
+                analysis = analyze_text(event.get('text') or '')
+            context.update(analysis, parse_data.get('entities') or [])
+        self._put(tracker.sender_id, context)
+        with self._lock:
+            self.events_read += len(events)
+
+        # An empty slot value ([] or '') counts as unset
+        return {
+            slot: value for slot, value in context.slot_values().items()
+            if value != (tracker.get_slot(slot) or None)
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[Text, Any]:
+        """Counters for monitoring the store"""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'events_read': self.events_read,
+            }
+
+
+CONTEXT_STORE = ContextStore()
@@ -0,0 +1,250 @@
+"""Routing and logging for action_fallback_with_context
+
+``FallbackClassifier`` and the core fallback threshold send every message
+the models are unsure about to ``action_fallback_with_context``. The
+``FallbackRouter`` scores all the routes in the ``fallback`` section of
+``catalog.yml`` in one pass over the message (see scoring.py) and answers
+with the best one's template. Messages no route reaches get ``product_help``
+when they name a product and ``help_menu`` otherwise.
+
+Every fallback message is also kept in a ``FallbackLog``: a ring buffer of
+the last ``VASPX_FALLBACK_BUFFER`` messages (default 10000) that a
+background thread appends every ``VASPX_FALLBACK_FLUSH_INTERVAL`` seconds
+(default 30) to ``fallback-<UTC date>-<pid>.jsonl`` in
+``VASPX_FALLBACK_DIR`` (default ``fallbacks``; empty keeps them in memory
+only). If the disk falls behind, the oldest unwritten messages are dropped
+and counted rather than growing memory. Mine the files for new NLU examples
+with
+
+    python -m actions.fallback fallbacks/ --top 30
+
+which prints the most frequent fallback messages, most frequent first,
+grouped by the intent the model guessed, in the format of ``data/nlu.yml``.
+"""
+import argparse
+import atexit
+import glob
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence, Text
+
+from rasa_sdk import Tracker
+
+from .analysis import MessageAnalysis
+from .catalog import CATALOG
+from .scoring import KeywordScorer
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_DIR = os.environ.get('VASPX_FALLBACK_DIR', 'fallbacks')
+BUFFER_SIZE = int(os.environ.get('VASPX_FALLBACK_BUFFER', 10000))
+FLUSH_INTERVAL = float(os.environ.get('VASPX_FALLBACK_FLUSH_INTERVAL', 30))
+
+FILE_PREFIX = 'fallback-'
+FILE_SUFFIX = '.jsonl'
+
+# Routes for messages no keyword route reaches; also their template names
+PRODUCT_HELP = 'product_help'
+HELP_MENU = 'help_menu'
+
+
+class FallbackRouter:
+    """Picks the fallback route for a message from one scoring pass"""
+
+    def __init__(self, scorer: KeywordScorer, templates: Dict[Text, Text],
+                 off_topic_routes: Sequence[Text] = ()) -> None:
+        self.scorer = scorer
+        self.templates = templates
+        self.off_topic_routes = frozenset(off_topic_routes)
+
+    def route(self, analysis: MessageAnalysis) -> Text:
+        """Best route for the message in `analysis`"""
+        on_topic = bool(analysis.product_mask) or analysis.match.has('company')
+        for route in self.scorer.rank(analysis.text):
+            if on_topic and route in self.off_topic_routes:
+                continue
+            return route
+        return PRODUCT_HELP if analysis.product_mask else HELP_MENU
+
+    def template(self, route: Text) -> Text:
+        """Name of the catalog template answering `route`"""
+        return self.templates.get(route, route)
+
+
+ROUTER = FallbackRouter(
+    # Every route is ranked, so an off-topic route can give way to the next one
+    KeywordScorer(CATALOG.fallback_keywords, CATALOG.fallback_routes,
+                  CATALOG.min_fallback_score, len(CATALOG.fallback_routes)),
+    CATALOG.fallback_templates,
+    CATALOG.off_topic_routes,
+)
+
+
+class FallbackLog:
+    """Ring buffer of fallback messages, appended to daily JSONL files in the background"""
+
+    def __init__(self, directory: Text = FALLBACK_DIR, capacity: int = BUFFER_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL) -> None:
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._buffer: Deque[Dict[Text, Any]] = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        # Buffered entries not written yet; the newest ones in the buffer
+        self._unwritten = 0
+        self._writer: Optional[threading.Thread] = None
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.write_errors = 0
+
+    def record(self, tracker: Tracker, route: Text) -> None:
+        """Keep the latest message of `tracker`, answered with `route`"""
+        message = tracker.latest_message or {}
+        intent = message.get('intent') or {}
+        entry = {
+            'timestamp': time.time(),
+            'sender_id': tracker.sender_id,
+            'message_id': message.get('message_id'),
+            'channel': tracker.get_latest_input_channel(),
+            'text': message.get('text') or '',
+            'intent': intent.get('name'),
+            'confidence': intent.get('confidence'),
+            'ranking': [
+                [ranked.get('name'), ranked.get('confidence')]
+                for ranked in (message.get('intent_ranking') or [])[:3]
+            ],
+            'route': route,
+        }
+        with self._lock:
+            if self._unwritten == self._buffer.maxlen:
+                # The oldest unwritten entry is about to be overwritten
+                self.dropped += 1
+            else:
+                self._unwritten += 1
+            self._buffer.append(entry)
+            self.recorded += 1
+        if self.directory and self._writer is None:
+            self._start()
+
+    def recent(self, count: Optional[int] = None) -> List[Dict[Text, Any]]:
+        """The last `count` fallback messages (all buffered ones by default), oldest first"""
+        with self._lock:
+            entries = list(self._buffer)
+        return entries if count is None else entries[-count:]
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._writer is not None:
+                return
+            self._writer = threading.Thread(target=self._write_loop, name='vaspx-fallback-log',
+                                            daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    def _write_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self) -> int:
+        """Append the unwritten entries to today's file; returns how many were written"""
+        with self._lock:
+            if not self._unwritten or not self.directory:
+                return 0
+            entries = list(self._buffer)[-self._unwritten:]
+            self._unwritten = 0
+        stamp = time.strftime('%Y%m%d', time.gmtime())
+        path = os.path.join(self.directory, f'{FILE_PREFIX}{stamp}-{os.getpid()}{FILE_SUFFIX}')
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as log_file:
+                log_file.write(''.join(
+                    json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries
+                ))
+        except OSError as error:
+            with self._lock:
+                self.write_errors += 1
+                self.dropped += len(entries)
+            logger.warning(f"Could not write {len(entries)} fallback messages to '{path}': {error}")
+            return 0
+        with self._lock:
+            self.written += len(entries)
+        return len(entries)
+
+    def stats(self) -> Dict[Text, Any]:
+        """Counters for monitoring the log"""
+        with self._lock:
+            return {
+                'buffered': len(self._buffer),
+                'capacity': self._buffer.maxlen,
+                'unwritten': self._unwritten,
+                'recorded': self.recorded,
+                'written': self.written,
+                'dropped': self.dropped,
+                'write_errors': self.write_errors,
+            }
+
+
+FALLBACK_LOG = FallbackLog()
+
+
+def log_files(directory: Text) -> List[Text]:
+    """Fallback log files in `directory`, oldest first"""
+    return sorted(glob.glob(os.path.join(directory, f'{FILE_PREFIX}*{FILE_SUFFIX}')))
+
+
+def read_entries(paths: Sequence[Text]) -> Iterator[Dict[Text, Any]]:
+    """Entries of the log files at `paths`, skipping a truncated last line"""
+    for path in paths:
+        with open(path, encoding='utf-8') as log_file:
+            for line in log_file:
+                if line.endswith('\n'):
+                    yield json.loads(line)
+
+
+_SPACES = re.compile(r'\s+')
+
+
+def main(argv: Optional[Sequence[Text]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Most frequent fallback messages, as NLU examples')
+    parser.add_argument('directory', nargs='?', default=FALLBACK_DIR or 'fallbacks')
+    parser.add_argument('--top', type=int, default=20,
+                        help='messages listed per guessed intent (default: 20)')
+    parser.add_argument('--route', help='only messages answered with this route')
+    args = parser.parse_args(argv)
+
+    paths = log_files(args.directory)
+    if not paths:
+        print(f"No fallback logs in '{args.directory}'.", file=sys.stderr)
+        return 1
+    by_intent: Dict[Text, Counter] = {}
+    routes: Counter = Counter()
+    for entry in read_entries(paths):
+        if args.route and entry.get('route') != args.route:
+            continue
+        routes[entry.get('route')] += 1
+        text = _SPACES.sub(' ', entry.get('text') or '').strip().lower()
+        if text:
+            by_intent.setdefault(entry.get('intent') or 'nlu_fallback', Counter())[text] += 1
+
+    print(f"# {sum(routes.values())} fallback messages: " + ', '.join(
+        f'{route} {count}' for route, count in routes.most_common()
+    ))
+    print('nlu:')
+    for intent, texts in sorted(by_intent.items(), key=lambda item: -sum(item[1].values())):
+        print(f'# guessed {sum(texts.values())} times; review before adding')
+        print(f'- intent: {intent}')
+        print('  examples: |')
+        for text, _ in texts.most_common(args.top):
+            print(f'    - {text}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""Output formats for response texts, chosen per input channel
+
+Responses are written in Markdown with ``**bold**``, bullets and emoji. Some
+channels cannot show that: SMS and Messenger clients get ``plain`` text with
+markers and pictographs removed, and clients that render markup can be
+given ``html``. The action server (see ``catalog.py``) and the Rasa server's
+response generator (``addons/nlg.py``) both pre-render every response once
+per format at startup and look up the variant by channel name.
+
+Channels not listed in ``DEFAULT_CHANNEL_FORMATS`` get Markdown. Override or
+extend the mapping with ``VASPX_CHANNEL_FORMATS``, e.g.
+``VASPX_CHANNEL_FORMATS=rest=plain,socketio=html``.
+
+This module only needs the standard library, so both servers can import it.
+"""
+import html
+import os
+import re
+from typing import Dict, Optional, Text
+
+MARKDOWN = 'markdown'
+PLAIN = 'plain'
+HTML = 'html'
+FORMATS = (MARKDOWN, PLAIN, HTML)
+
+DEFAULT_CHANNEL_FORMATS = {
+    'twilio': PLAIN,
+    'facebook': PLAIN,
+}
+
+_BOLD = re.compile(r'\*\*(.+?)\*\*', re.DOTALL)
+_BULLET = re.compile(r'^[ \t]*[•✓✔✅▶→][ \t]*', re.MULTILINE)
+_KEYCAP = re.compile('(\\d)\ufe0f?\u20e3')
+# Pictographs, dingbats and the joiners and selectors that combine them
+_PICTOGRAPH = re.compile('[\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF\ufe0f\u200d]')
+_LINE_INDENT = re.compile(r'^[ \t]+', re.MULTILINE)
+_SPACES = re.compile(r'[ \t]{2,}')
+
+
+def parse_channel_formats(spec: Text) -> Dict[Text, Text]:
+    """Mapping from a ``channel=format,...`` specification"""
+    formats = {}
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        channel, _, output_format = item.partition('=')
+        output_format = output_format.strip().lower()
+        if output_format not in FORMATS:
+            raise ValueError(
+                f"Unknown output format '{output_format}' for channel '{channel.strip()}'; "
+                f"use one of {', '.join(FORMATS)}"
+            )
+        formats[channel.strip()] = output_format
+    return formats
+
+
+CHANNEL_FORMATS = {
+    **DEFAULT_CHANNEL_FORMATS,
+    **parse_channel_formats(os.environ.get('VASPX_CHANNEL_FORMATS', '')),
+}
+
+
+def channel_format(channel: Optional[Text]) -> Text:
+    """Output format for messages sent back on `channel`"""
+    return CHANNEL_FORMATS.get(channel or '', MARKDOWN)
+
+
+def to_plain(text: Text) -> Text:
+    text = _BOLD.sub(r'\1', text)
+    text = _BULLET.sub('- ', text)
+    text = _KEYCAP.sub(r'\1.', text)
+    text = _PICTOGRAPH.sub('', text)
+    text = _LINE_INDENT.sub('', text)
+    return _SPACES.sub(' ', text).strip()
+
+
+def to_html(text: Text) -> Text:
+    text = html.escape(text, quote=False)
+    text = _BOLD.sub(r'<strong>\1</strong>', text)
+    text = _LINE_INDENT.sub('', text)
+    return text.strip().replace('\n', '<br>')
+
+
+def render_format(text: Text, output_format: Text) -> Text:
+    """`text`, written in Markdown, converted to `output_format`"""
+    if output_format == PLAIN:
+        return to_plain(text)
+    if output_format == HTML:
+        return to_html(text)
+    return text
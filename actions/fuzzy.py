@@ -0,0 +1,128 @@
+"""Typo-tolerant lookup of product names
+
+A SymSpell-style deletion dictionary: every indexed spelling is stored under
+all strings reachable from it by deleting up to ``max_distance`` characters.
+A token is resolved by generating its own deletes and verifying the few
+candidates they point at, so lookup cost depends on the token length and not
+on how many spellings are indexed.
+"""
+import functools
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Text, Tuple
+
+DEFAULT_MAX_DISTANCE = 2
+
+# Tokens shorter than this are only matched exactly; 'all' or 'get' are one
+# edit away from too many things to be worth correcting.
+DEFAULT_MIN_LENGTH = 4
+
+# Tokens at least this long may be two edits away; shorter ones only one
+TWO_EDIT_LENGTH = 9
+
+# Shortest start of a term that counts as the first half of a split name ('ice bx')
+MIN_PREFIX_LENGTH = 3
+
+
+class FuzzyMatch(NamedTuple):
+    """The indexed spelling a token resolved to"""
+    value: Text
+    term: Text
+    distance: int
+
+
+def deletes(word: Text, distance: int) -> Set[Text]:
+    """`word` plus every string reachable by deleting up to `distance` characters"""
+    result = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {
+            candidate[:index] + candidate[index + 1:]
+            for candidate in frontier
+            for index in range(len(candidate))
+        }
+        result |= frontier
+    return result
+
+
+def edit_distance(source: Text, target: Text, limit: int) -> int:
+    """Optimal string alignment distance, or `limit + 1` once it exceeds `limit`"""
+    if abs(len(source) - len(target)) > limit:
+        return limit + 1
+    previous_previous: List[int] = []
+    previous = list(range(len(target) + 1))
+    for i in range(1, len(source) + 1):
+        current = [i] + [0] * len(target)
+        for j in range(1, len(target) + 1):
+            cost = 0 if source[i - 1] == target[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (i > 1 and j > 1 and source[i - 1] == target[j - 2]
+                    and source[i - 2] == target[j - 1]):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+class FuzzyIndex:
+    """Deletion-dictionary index from spellings to the values they stand for"""
+
+    def __init__(self, terms: Dict[Text, Text], max_distance: int = DEFAULT_MAX_DISTANCE,
+                 min_length: int = DEFAULT_MIN_LENGTH, cache_size: int = 8192) -> None:
+        self.max_distance = max_distance
+        self.min_length = min_length
+        self._terms = dict(terms)
+        buckets: Dict[Text, List[Text]] = {}
+        for term in self._terms:
+            for deleted in deletes(term, max_distance):
+                buckets.setdefault(deleted, []).append(term)
+        self._deletes: Dict[Text, Tuple[Text, ...]] = {
+            key: tuple(spellings) for key, spellings in buckets.items()
+        }
+        self._prefixes: Set[Text] = {
+            term[:end] for term in self._terms for end in range(MIN_PREFIX_LENGTH, len(term))
+        }
+        # Users repeat the same few misspellings; remember the answers
+        self.lookup = functools.lru_cache(maxsize=cache_size)(self._lookup)
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def starts_term(self, token: Text) -> bool:
+        """Whether `token` is the beginning of an indexed spelling"""
+        return token in self._prefixes
+
+    def allowed_distance(self, token: Text) -> int:
+        """How many edits a token of this length may be away from a term"""
+        if len(token) < self.min_length:
+            return 0
+        if len(token) < TWO_EDIT_LENGTH:
+            return min(1, self.max_distance)
+        return self.max_distance
+
+    def _lookup(self, token: Text) -> Optional[FuzzyMatch]:
+        if token in self._terms:
+            return FuzzyMatch(self._terms[token], token, 0)
+        limit = self.allowed_distance(token)
+        if not limit:
+            return None
+
+        best: Optional[FuzzyMatch] = None
+        seen: Set[Text] = set()
+        for deleted in deletes(token, limit):
+            for term in self._deletes.get(deleted, ()):
+                if term in seen:
+                    continue
+                seen.add(term)
+                distance = edit_distance(token, term, limit)
+                if distance <= limit and (best is None or distance < best.distance):
+                    best = FuzzyMatch(self._terms[term], term, distance)
+        return best
+
+    @classmethod
+    def from_aliases(cls, aliases: Dict[Text, Iterable[Text]], **kwargs) -> 'FuzzyIndex':
+        """Index every alias of every value, with multi-word aliases also run together"""
+        terms: Dict[Text, Text] = {}
+        for value, spellings in aliases.items():
+            for spelling in spellings:
+                terms.setdefault(spelling.replace(' ', ''), value)
+        return cls(terms, **kwargs)
@@ -0,0 +1,183 @@
+"""Shared keyword matcher used by every custom action
+
+All product aliases, typo variants, institution words and intent-ish keywords are
+compiled into a single alternation at import time, so a user message is
+lowercased and scanned exactly once per call instead of once per keyword.
+Words the alternation does not cover are then looked up in a fuzzy index of
+product spellings, so 'ednekt', 'transtrak' or 'ice bx' still count.
+"""
+import re
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Pattern, Text, Tuple
+
+from .catalog import CATALOG
+from .fuzzy import FuzzyIndex
+
+# Canonical product order, used wherever the actions list products back
+PRODUCTS = CATALOG.products
+
+# One bit per product, so any set of products is a small integer key
+PRODUCT_BITS = CATALOG.product_bits
+
+PRODUCT_LABELS = CATALOG.labels
+
+# (category, value) -> keywords that map onto it. A keyword may appear under
+# several categories. Industry words and fallback routes are scored
+# separately, with weights, by recommender.py and fallback.py.
+KEYWORDS: Dict[Tuple[Text, Text], Tuple[Text, ...]] = {
+    # Products, including the spellings users actually type (from the catalog)
+    **{('product', product): aliases for product, aliases in CATALOG.aliases.items()},
+    ('company', 'vasp'): ('vasp',),
+
+    # Institution types
+    ('institute', 'school'): ('school',),
+    ('institute', 'college'): ('college',),
+    ('institute', 'university'): ('university',),
+    ('institute', 'institution'): ('institution',),
+
+    # Intent-ish keywords
+    ('intent', 'features'): ('feature', 'module'),
+    ('intent', 'all_products'): ('all', 'every', 'which products', 'what products'),
+}
+
+
+product_mask = CATALOG.product_mask
+products_from_mask = CATALOG.products_from_mask
+
+
+class Hit(NamedTuple):
+    """A single keyword occurrence in a message
+
+    `distance` is the number of edits between the text and the keyword for
+    hits found by the fuzzy index, and 0 for exact ones.
+    """
+    start: int
+    end: int
+    category: Text
+    value: Text
+    keyword: Text
+    distance: int = 0
+
+
+class MatchResult:
+    """All keyword hits for one message, with helpers for the common lookups"""
+
+    __slots__ = ('text', 'hits', '_tags')
+
+    def __init__(self, text: Text, hits: List[Hit]) -> None:
+        self.text = text
+        self.hits = hits
+        self._tags: FrozenSet[Tuple[Text, Text]] = frozenset(
+            (hit.category, hit.value) for hit in hits
+        )
+
+    def has(self, category: Text, value: Optional[Text] = None) -> bool:
+        """Whether any hit falls into `category` (and `value`, if given)"""
+        if value is not None:
+            return (category, value) in self._tags
+        return any(tag_category == category for tag_category, _ in self._tags)
+
+    def values(self, category: Text) -> List[Text]:
+        """Distinct values of `category` in order of first appearance"""
+        seen: List[Text] = []
+        for hit in self.hits:
+            if hit.category == category and hit.value not in seen:
+                seen.append(hit.value)
+        return seen
+
+    def products(self) -> List[Text]:
+        """Products mentioned, in canonical catalog order"""
+        return [product for product in PRODUCTS if ('product', product) in self._tags]
+
+    def product_mask(self) -> int:
+        """Bitmask of the products mentioned"""
+        return product_mask(self.products())
+
+    def first_of(self, category: Text, priority: Iterable[Text]) -> Optional[Text]:
+        """First value from `priority` that was hit under `category`"""
+        for value in priority:
+            if (category, value) in self._tags:
+                return value
+        return None
+
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+
+class KeywordMatcher:
+    """Single-pass matcher over a compiled alternation of all keywords"""
+
+    def __init__(self, keywords: Dict[Tuple[Text, Text], Tuple[Text, ...]],
+                 fuzzy: Optional[FuzzyIndex] = None, fuzzy_category: Text = 'product') -> None:
+        self._fuzzy = fuzzy
+        self._fuzzy_category = fuzzy_category
+        self._tags: Dict[Text, List[Tuple[Text, Text]]] = {}
+        for tag, words in keywords.items():
+            for word in words:
+                self._tags.setdefault(word, []).append(tag)
+
+        # Longest first so 'desalite connect' wins over 'desalite' at the same
+        # position; a leading word boundary keeps 'get' out of 'budget' while
+        # still matching plurals such as 'schools' or 'features'.
+        alternation = '|'.join(
+            re.escape(word) for word in sorted(self._tags, key=len, reverse=True)
+        )
+        self._pattern: Pattern[Text] = re.compile(r'\b(?:' + alternation + ')')
+
+    def scan(self, text: Text) -> MatchResult:
+        """Lowercase `text` once and return every keyword hit in it"""
+        text = (text or '').lower()
+        hits = [
+            Hit(match.start(), match.end(), category, value, match.group())
+            for match in self._pattern.finditer(text)
+            for category, value in self._tags[match.group()]
+        ]
+        if self._fuzzy is not None:
+            fuzzy_hits = self._fuzzy_hits(text, hits)
+            if fuzzy_hits:
+                hits = sorted(hits + fuzzy_hits)
+        return MatchResult(text, hits)
+
+    def _fuzzy_hits(self, text: Text, hits: List[Hit]) -> List[Hit]:
+        """Misspelled product names among the words no keyword matched"""
+        covered = [(hit.start, hit.end) for hit in hits]
+        tokens = [
+            token for token in _TOKEN.finditer(text)
+            if not any(start < token.end() and token.start() < end for start, end in covered)
+        ]
+        found = []
+        skip_next = False
+        for index, token in enumerate(tokens):
+            if skip_next:
+                skip_next = False
+                continue
+            match = self._fuzzy.lookup(token.group())
+            end = token.end()
+            if match is None and index + 1 < len(tokens):
+                # Names typed as two words: 'ice bx', 'trans trak'. Only a
+                # word that starts a name may be joined with the next one, or
+                # 'nice box' would be one edit away from 'icebox'.
+                following = tokens[index + 1]
+                if text[end:following.start()].isspace():
+                    joined = token.group() + following.group()
+                    match = self._fuzzy.lookup(joined)
+                    if (match is not None and match.distance
+                            and not self._fuzzy.starts_term(token.group())):
+                        match = None
+                    if match is not None:
+                        end = following.end()
+                        skip_next = True
+            if match is not None:
+                found.append(Hit(token.start(), end, self._fuzzy_category, match.value,
+                                 text[token.start():end], match.distance))
+        return found
+
+
+# Product spellings for typo-tolerant lookup, built once at startup
+FUZZY_INDEX = FuzzyIndex.from_aliases(CATALOG.aliases)
+
+MATCHER = KeywordMatcher(KEYWORDS, FUZZY_INDEX)
+
+
+def scan(text: Text) -> MatchResult:
+    """Scan `text` with the shared matcher"""
+    return MATCHER.scan(text)
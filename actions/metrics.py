@@ -0,0 +1,235 @@
+"""Lightweight Prometheus-style metrics for the custom actions
+
+Every action class decorated with :func:`instrumented` records call counts,
+errors, a latency histogram and the size of the messages it dispatched.
+Actions mark which branch they took with :func:`count_branch`. Everything is
+kept in plain dictionaries in process and exposed in the Prometheus text
+format on ``http://0.0.0.0:$VASPX_METRICS_PORT/metrics`` (default 5056, next to
+the action server on 5055; set it to 0 to disable the endpoint). The endpoint
+is started by the action server entry point, ``python -m actions.server``,
+not when the actions are imported.
+"""
+import bisect
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Sequence, Text, Tuple, Type
+
+from rasa_sdk import Action
+
+logger = logging.getLogger(__name__)
+
+METRICS_PORT = int(os.environ.get('VASPX_METRICS_PORT', 5056))
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+Labels = Tuple[Tuple[Text, Text], ...]
+
+
+class Histogram:
+    """Cumulative-bucket histogram for one label set"""
+
+    __slots__ = ('buckets', 'counts', 'total', 'count')
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Counters, histograms and callback gauges, rendered on demand"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._help: Dict[Text, Tuple[Text, Text]] = {}
+        self._counters: Dict[Text, Dict[Labels, float]] = {}
+        self._histograms: Dict[Text, Dict[Labels, Histogram]] = {}
+        self._histogram_buckets: Dict[Text, Sequence[float]] = {}
+        self._gauges: Dict[Text, Callable[[], Dict[Labels, float]]] = {}
+
+    def counter(self, name: Text, help_text: Text) -> None:
+        self._help[name] = ('counter', help_text)
+        self._counters.setdefault(name, {})
+
+    def histogram(self, name: Text, help_text: Text, buckets: Sequence[float]) -> None:
+        self._help[name] = ('histogram', help_text)
+        self._histograms.setdefault(name, {})
+        self._histogram_buckets[name] = buckets
+
+    def gauge(self, name: Text, help_text: Text, collect: Callable[[], Dict[Labels, float]]) -> None:
+        """Gauge whose values are read from `collect` at scrape time"""
+        self._help[name] = ('gauge', help_text)
+        self._gauges[name] = collect
+
+    def inc(self, name: Text, labels: Labels = (), value: float = 1) -> None:
+        with self._lock:
+            series = self._counters[name]
+            series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name: Text, labels: Labels, value: float) -> None:
+        with self._lock:
+            series = self._histograms[name]
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram(self._histogram_buckets[name])
+            histogram.observe(value)
+
+    def value(self, name: Text, labels: Labels = ()) -> float:
+        """Current value of a counter series (0 if never incremented)"""
+        with self._lock:
+            return self._counters.get(name, {}).get(labels, 0)
+
+    def render(self) -> Text:
+        """All metrics in the Prometheus text exposition format"""
+        lines: List[Text] = []
+        with self._lock:
+            for name, (kind, help_text) in sorted(self._help.items()):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                if kind == 'counter':
+                    for labels, value in sorted(self._counters[name].items()):
+                        lines.append(f'{name}{_format_labels(labels)} {value:g}')
+                elif kind == 'histogram':
+                    for labels, histogram in sorted(self._histograms[name].items()):
+                        cumulative = 0
+                        for bound, count in zip(histogram.buckets, histogram.counts):
+                            cumulative += count
+                            bucket_labels = labels + (('le', f'{bound:g}'),)
+                            lines.append(f'{name}_bucket{_format_labels(bucket_labels)} {cumulative}')
+                        bucket_labels = labels + (('le', '+Inf'),)
+                        lines.append(f'{name}_bucket{_format_labels(bucket_labels)} {histogram.count}')
+                        lines.append(f'{name}_sum{_format_labels(labels)} {histogram.total:g}')
+                        lines.append(f'{name}_count{_format_labels(labels)} {histogram.count}')
+                else:
+                    try:
+                        values = self._gauges[name]()
+                    except Exception:
+                        logger.exception(f"Collecting gauge '{name}' failed")
+                        continue
+                    for labels, value in sorted(values.items()):
+                        lines.append(f'{name}{_format_labels(labels)} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels: Labels) -> Text:
+    if not labels:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+REGISTRY = MetricsRegistry()
+REGISTRY.counter('vaspx_action_calls_total', 'Custom action runs.')
+REGISTRY.counter('vaspx_action_errors_total', 'Custom action runs that raised.')
+REGISTRY.counter('vaspx_action_branch_total', 'Branches taken inside custom actions.')
+REGISTRY.histogram('vaspx_action_latency_seconds', 'Custom action run time.', LATENCY_BUCKETS)
+REGISTRY.histogram(
+    'vaspx_action_response_bytes', 'UTF-8 size of the messages one run dispatched.', SIZE_BUCKETS
+)
+
+
+def count_branch(action: Text, branch: Text) -> None:
+    """Record that `action` took `branch` on this run"""
+    REGISTRY.inc('vaspx_action_branch_total', (('action', action), ('branch', branch)))
+
+
+def _dispatched_bytes(dispatcher: Any, first: int) -> int:
+    messages = getattr(dispatcher, 'messages', None) or []
+    return sum(len((message.get('text') or '').encode('utf-8')) for message in messages[first:])
+
+
+def instrumented(action_class: Type[Action]) -> Type[Action]:
+    """Class decorator that times and counts every run of a custom action"""
+    run = action_class.run
+    action_name = action_class().name()
+    labels: Labels = (('action', action_name),)
+
+    def record(dispatcher: Any, first_message: int, started: float, failed: bool) -> None:
+        REGISTRY.observe('vaspx_action_latency_seconds', labels, time.perf_counter() - started)
+        REGISTRY.inc('vaspx_action_calls_total', labels)
+        if failed:
+            REGISTRY.inc('vaspx_action_errors_total', labels)
+        else:
+            REGISTRY.observe(
+                'vaspx_action_response_bytes', labels, _dispatched_bytes(dispatcher, first_message)
+            )
+
+    if inspect.iscoroutinefunction(run):
+        @functools.wraps(run)
+        async def async_wrapper(self, dispatcher, tracker, domain):
+            first_message = len(getattr(dispatcher, 'messages', ()))
+            started = time.perf_counter()
+            failed = True
+            try:
+                result = await run(self, dispatcher, tracker, domain)
+                failed = False
+                return result
+            finally:
+                record(dispatcher, first_message, started, failed)
+
+        action_class.run = async_wrapper
+    else:
+        @functools.wraps(run)
+        def wrapper(self, dispatcher, tracker, domain):
+            first_message = len(getattr(dispatcher, 'messages', ()))
+            started = time.perf_counter()
+            failed = True
+            try:
+                result = run(self, dispatcher, tracker, domain)
+                failed = False
+                return result
+            finally:
+                record(dispatcher, first_message, started, failed)
+
+        action_class.run = wrapper
+    return action_class
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: Text, *args: Any) -> None:
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: Text = '0.0.0.0') -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics from a daemon thread; safe to call more than once"""
+    global _server
+    if _server is not None or not port:
+        return _server
+    try:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as error:
+        logger.warning(f"Not serving action metrics on port {port}: {error}")
+        return None
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name='vaspx-metrics', daemon=True).start()
+    logger.info(f"Serving action metrics on http://{host}:{port}/metrics")
+    return _server
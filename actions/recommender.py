@@ -0,0 +1,23 @@
+"""Weighted industry scoring for action_provide_recommendation
+
+Every industry in the ``recommendations`` section of ``catalog.yml`` lists
+keywords with a weight, scored in one pass over the message by the
+``KeywordScorer`` in scoring.py. An industry scores its best keyword plus a
+small bonus for each further one, so several minor keywords cannot outrank
+the one the message is about. Industries reaching the minimum score come
+back best first, which lets one reply cover a school that also runs a bus
+fleet and a cold store.
+"""
+from typing import Text, Tuple
+
+from .catalog import CATALOG
+from .scoring import KeywordScorer
+
+SCORER = KeywordScorer(CATALOG.industry_keywords, CATALOG.industries,
+                       CATALOG.min_industry_score, CATALOG.max_industries,
+                       CATALOG.extra_keyword_bonus)
+
+
+def rank_industries(text: Text) -> Tuple[Text, ...]:
+    """Rank industries in `text` with the shared scorer"""
+    return SCORER.rank(text)
@@ -0,0 +1,81 @@
+"""Weighted keyword scoring shared by the recommender and the fallback router
+
+Each label (an industry, a fallback route) lists keywords with a weight. At
+startup they are compiled into an inverted index from a keyword's first
+token to the (keyword, label, weight) entries that start with it, so a
+message is tokenized once and every label is scored in the same pass.
+
+A label's score is the sum of its matched keywords' weights, or, with
+``extra_keyword_bonus`` set, its best matched weight plus that bonus for
+each further keyword, so a label that is only mentioned in passing with
+several small keywords cannot outscore the one the message is about.
+"""
+import re
+from typing import Dict, List, Optional, Sequence, Text, Tuple
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+# (keyword tokens, label, weight)
+Entry = Tuple[Tuple[Text, ...], Text, float]
+
+
+class KeywordScorer:
+    """Scores every label on one pass over a message's tokens"""
+
+    def __init__(self, lexicon: Dict[Text, Dict[Text, float]], labels: Sequence[Text],
+                 min_score: float = 0.5, max_labels: int = 3,
+                 extra_keyword_bonus: Optional[float] = None) -> None:
+        self.min_score = min_score
+        self.max_labels = max_labels
+        self.extra_keyword_bonus = extra_keyword_bonus
+        # Ties go to the label listed first in the catalog
+        self._order = {label: index for index, label in enumerate(labels)}
+        self._index: Dict[Text, List[Entry]] = {}
+        for label, keywords in lexicon.items():
+            for keyword, weight in keywords.items():
+                tokens = tuple(_TOKEN.findall(keyword))
+                self._index.setdefault(tokens[0], []).append((tokens, label, weight))
+        for entries in self._index.values():
+            # Longest first, so 'cold storage' wins over 'cold' at the same position
+            entries.sort(key=lambda entry: len(entry[0]), reverse=True)
+        self._vocabulary = {token for entries in self._index.values()
+                            for tokens, _, _ in entries for token in tokens}
+
+    def _normalize(self, token: Text) -> Text:
+        # Plain plurals ('schools', 'warehouses') count as the keyword
+        if token not in self._vocabulary and token.endswith('s') and token[:-1] in self._vocabulary:
+            return token[:-1]
+        return token
+
+    def scores(self, text: Text) -> Dict[Text, float]:
+        """Score of every label with at least one keyword in `text`
+
+        Each keyword counts once however often it appears, and the tokens of
+        a matched phrase are not matched again on their own.
+        """
+        tokens = [self._normalize(token) for token in _TOKEN.findall(text.lower())]
+        matched: Dict[Text, List[float]] = {}
+        seen = set()
+        position = 0
+        while position < len(tokens):
+            step = 0
+            for keyword, label, weight in self._index.get(tokens[position], ()):
+                if len(keyword) < step or tuple(tokens[position:position + len(keyword)]) != keyword:
+                    continue
+                step = len(keyword)
+                if (keyword, label) not in seen:
+                    seen.add((keyword, label))
+                    matched.setdefault(label, []).append(weight)
+            position += step or 1
+        if self.extra_keyword_bonus is None:
+            return {label: sum(weights) for label, weights in matched.items()}
+        return {label: max(weights) + self.extra_keyword_bonus * (len(weights) - 1)
+                for label, weights in matched.items()}
+
+    def rank(self, text: Text) -> Tuple[Text, ...]:
+        """Labels reaching the minimum score in `text`, best first"""
+        ranked = sorted(
+            (item for item in self.scores(text).items() if item[1] >= self.min_score),
+            key=lambda item: (-item[1], self._order[item[0]]),
+        )
+        return tuple(label for label, _ in ranked[:self.max_labels])
@@ -0,0 +1,30 @@
+"""Action server entry point that also serves the custom action metrics
+
+Takes the same arguments as ``rasa run actions``, with ``--actions``
+defaulting to this package, and starts the /metrics endpoint (see
+``metrics.py``) before the action server:
+
+    python -m actions.server --port 5055
+
+Importing the actions elsewhere (benchmarks, tests, tooling) records metrics
+in process without binding the metrics port.
+"""
+from rasa_sdk.endpoint import create_argument_parser
+
+from .metrics import start_metrics_server
+
+
+def main() -> None:
+    parser = create_argument_parser()
+    # rasa_sdk leaves it unset, which would start a server without actions
+    parser.set_defaults(actions='actions')
+    args = parser.parse_args()
+    start_metrics_server()
+
+    from rasa_sdk.__main__ import main_from_args
+
+    main_from_args(args)
+
+
+if __name__ == '__main__':
+    main()
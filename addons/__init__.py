@@ -0,0 +1 @@
+"""Rasa server extensions: custom NLU components, policies and stores"""
@@ -0,0 +1,249 @@
+"""Micro-batched NLU inference for concurrent messages
+
+By default the Rasa server runs the whole NLU graph, DIET forward pass
+included, once per incoming message. With batching enabled, messages that
+arrive within ``VASPX_NLU_BATCH_WINDOW_MS`` milliseconds of each other (or
+until ``VASPX_NLU_BATCH_SIZE`` are waiting) are sent through the graph together
+in one run on a worker thread, and each caller gets its own parse result back.
+``BatchedDIETClassifier`` classifies such a batch in a single padded forward
+pass instead of one pass per message.
+
+Batching is off unless ``VASPX_NLU_BATCH_WINDOW_MS`` is set above 0. It is
+switched on when this module is first imported, which happens when a model
+using the ``addons.parse_cache`` components is loaded:
+
+    VASPX_NLU_BATCH_WINDOW_MS=5 rasa run --enable-api --port 5005
+
+It pays off under concurrent load only. On one CPU core with 32 clients
+(``benchmarks/nlu_batch_bench.py``), a 5 ms window and batches of up to 32
+took throughput from 90 to 222 parses/s and p95 latency from 433 to 194 ms.
+With a single client every parse waits out the window instead (p50 10 ms
+became 17 ms), so leave it off for low traffic.
+
+Messages with an explicit intent (``/greet``) and servers using an HTTP
+interpreter keep the one-message-at-a-time path.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Generic, List, Optional, Text, Tuple, TypeVar
+
+from rasa.core.channels.channel import UserMessage
+from rasa.core.processor import MessageProcessor
+from rasa.engine.constants import PLACEHOLDER_MESSAGE
+from rasa.nlu.classifiers.diet_classifier import DIETClassifier
+from rasa.nlu.constants import TOKENS_NAMES
+from rasa.shared.constants import INTENT_MESSAGE_PREFIX
+from rasa.shared.nlu.constants import (
+    ENTITIES, INTENT, INTENT_NAME_KEY, INTENT_RANKING_KEY, PREDICTED_CONFIDENCE_KEY, TEXT,
+)
+from rasa.shared.nlu.training_data.message import Message
+from rasa.utils.tensorflow.constants import ENTITY_RECOGNITION, INTENT_CLASSIFICATION
+
+logger = logging.getLogger(__name__)
+
+BATCH_WINDOW_MS = float(os.environ.get('VASPX_NLU_BATCH_WINDOW_MS', 0))
+BATCH_SIZE = int(os.environ.get('VASPX_NLU_BATCH_SIZE', 32))
+
+Item = TypeVar('Item')
+Result = TypeVar('Result')
+
+
+class MicroBatcher(Generic[Item, Result]):
+    """Collects items submitted from one event loop and processes them in batches
+
+    The first waiting item opens a window of `window` seconds; the batch is
+    run when the window closes or `max_size` items are waiting, whichever
+    comes first. Batches run one at a time on a worker thread, so requests
+    arriving meanwhile queue up for the next batch. A batch runs in a copy
+    of the context variables of the item that opened it, so per-request
+    state such as the current trace reaches the worker thread.
+    """
+
+    def __init__(self, run_batch: Callable[[List[Item]], List[Result]],
+                 window: float, max_size: int) -> None:
+        self.run_batch = run_batch
+        self.window = window
+        self.max_size = max(1, max_size)
+        self._queue: Optional[
+            'asyncio.Queue[Tuple[Item, asyncio.Future, contextvars.Context]]'
+        ] = None
+        self._worker: Optional['asyncio.Task[None]'] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='vaspx-nlu-batch')
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item: Item) -> Result:
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._work())
+        future = loop.create_future()
+        self._queue.put_nowait((item, future, contextvars.copy_context()))
+        return await future
+
+    async def _work(self) -> None:
+        loop = asyncio.get_running_loop()
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self._run(loop, batch)
+
+    async def _run(self, loop: asyncio.AbstractEventLoop,
+                   batch: List[Tuple[Item, asyncio.Future, contextvars.Context]]) -> None:
+        items = [item for item, _, _ in batch]
+        context = batch[0][2]
+        try:
+            results = await loop.run_in_executor(self._executor, context.run, self.run_batch, items)
+        except Exception as error:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        self.batches += 1
+        self.items += len(items)
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict[Text, Any]:
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'mean_batch_size': self.items / self.batches if self.batches else 0.0,
+        }
+
+
+def parse_batch(processor: MessageProcessor, messages: List[UserMessage]) -> List[Message]:
+    """Run the NLU graph of `processor` once for all of `messages`"""
+    target = processor.model_metadata.nlu_target
+    results = processor.graph_runner.run(inputs={PLACEHOLDER_MESSAGE: messages}, targets=[target])
+    return results[target]
+
+
+def _parse_data(parsed: Message, only_output_properties: bool) -> Dict[Text, Any]:
+    parse_data = {
+        TEXT: '',
+        INTENT: {INTENT_NAME_KEY: None, PREDICTED_CONFIDENCE_KEY: 0.0},
+        ENTITIES: [],
+    }
+    parse_data.update(parsed.as_dict(only_output_properties=only_output_properties))
+    return parse_data
+
+
+# One batcher per loaded model; a replaced model's batcher goes with it
+_batchers: 'weakref.WeakKeyDictionary[MessageProcessor, MicroBatcher]' = weakref.WeakKeyDictionary()
+
+# The batched result for the message the current task is parsing
+_prepared: contextvars.ContextVar[Optional[Tuple[UserMessage, Message]]] = contextvars.ContextVar(
+    'vaspx_prepared_parse', default=None
+)
+
+_original_parse_message = MessageProcessor.parse_message
+_original_parse_message_with_graph = MessageProcessor._parse_message_with_graph
+
+
+def _batcher_for(processor: MessageProcessor) -> MicroBatcher:
+    batcher = _batchers.get(processor)
+    if batcher is None:
+        # A proxy, so the batcher does not keep its processor alive
+        batcher = _batchers[processor] = MicroBatcher(
+            functools.partial(parse_batch, weakref.proxy(processor)),
+            BATCH_WINDOW_MS / 1000, BATCH_SIZE,
+        )
+    return batcher
+
+
+async def _parse_message(self: MessageProcessor, message: UserMessage,
+                         tracker: Any = None, only_output_properties: bool = True) -> Dict[Text, Any]:
+    if (getattr(self, 'http_interpreter', None) is not None
+            or (message.text or '').startswith(INTENT_MESSAGE_PREFIX)):
+        return await _original_parse_message(self, message, tracker, only_output_properties)
+
+    parsed = await _batcher_for(self).submit(message)
+    # Everything around the graph run (retrieval intents, logging, checks for
+    # unseen features) stays Rasa's own code
+    token = _prepared.set((message, parsed))
+    try:
+        return await _original_parse_message(self, message, tracker, only_output_properties)
+    finally:
+        _prepared.reset(token)
+
+
+def _parse_message_with_graph(self: MessageProcessor, message: UserMessage, tracker: Any = None,
+                              only_output_properties: bool = True) -> Dict[Text, Any]:
+    prepared = _prepared.get()
+    if prepared is not None and prepared[0] is message:
+        return _parse_data(prepared[1], only_output_properties)
+    return _original_parse_message_with_graph(self, message, tracker, only_output_properties)
+
+
+def install() -> None:
+    """Route NLU parsing of the Rasa server through per-model micro-batchers"""
+    if MessageProcessor.parse_message is _parse_message:
+        return
+    MessageProcessor.parse_message = _parse_message
+    MessageProcessor._parse_message_with_graph = _parse_message_with_graph
+    logger.info(
+        f"Micro-batching NLU inference: window {BATCH_WINDOW_MS:g} ms, "
+        f"up to {BATCH_SIZE} messages per batch"
+    )
+
+
+def batching_stats() -> List[Dict[Text, Any]]:
+    """Batch counters of every live model's batcher"""
+    return [batcher.stats() for batcher in list(_batchers.values())]
+
+
+class BatchedDIETClassifier(DIETClassifier):
+    """DIETClassifier that classifies all messages of one graph run in a single forward pass"""
+
+    def process(self, messages: List[Message]) -> List[Message]:
+        batch = [message for message in messages if message.get(TOKENS_NAMES[TEXT])]
+        if (len(batch) < 2 or self.model is None
+                or self._execution_context.should_add_diagnostic_data):
+            return super().process(messages)
+
+        model_data = self._create_model_data(batch, training=False)
+        if model_data.is_empty():
+            return super().process(messages)
+        outputs = self.model.run_inference(model_data, batch_size=len(batch))
+
+        for index, message in enumerate(batch):
+            out = _slice_outputs(outputs, index)
+            if self.component_config[INTENT_CLASSIFICATION]:
+                label, label_ranking = self._predict_label(out)
+                message.set(INTENT, label, add_to_output=True)
+                message.set(INTENT_RANKING_KEY, label_ranking, add_to_output=True)
+            if self.component_config[ENTITY_RECOGNITION]:
+                message.set(ENTITIES, self._predict_entities(out, message), add_to_output=True)
+
+        rest = [message for message in messages if not message.get(TOKENS_NAMES[TEXT])]
+        if rest:
+            super().process(rest)
+        return messages
+
+
+def _slice_outputs(outputs: Dict[Text, Any], index: int) -> Dict[Text, Any]:
+    """The outputs of one example from a batched inference, as a batch of one"""
+    return {
+        key: _slice_outputs(value, index) if isinstance(value, dict) else value[index:index + 1]
+        for key, value in outputs.items()
+    }
+
+
+if BATCH_WINDOW_MS > 0:
+    install()
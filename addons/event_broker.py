@@ -0,0 +1,203 @@
+"""Append-only event broker writing compressed newline-delimited JSON files
+
+``LocalEventBroker`` takes every conversation event the tracker store
+streams, holds it in an in-memory buffer and returns immediately. A
+background thread writes the buffer in batches to gzip-compressed NDJSON
+files in ``directory``, starting a new file once the current one reaches
+``max_file_bytes``. Publishing never waits: when the buffer holds
+``max_buffer`` events, or the writer has stopped, the event is dropped and
+counted, so a stalled disk neither blocks the event loop nor grows memory
+without bound. A batch that fails to write is retried in a fresh file, with
+the wait between attempts doubling up to ``max_retry_delay`` seconds.
+
+    event_broker:
+      type: addons.event_broker.LocalEventBroker
+      directory: events
+
+Read the files back with ``python -m addons.event_reader``.
+"""
+import atexit
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Text
+
+from rasa.core.brokers.broker import EventBroker
+from rasa.utils.endpoints import EndpointConfig
+
+from .event_reader import FILE_PREFIX, FILE_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+# First wait before writing a failed batch again, in seconds
+RETRY_DELAY = 0.1
+
+# Drops are logged once at first and then every this many
+DROP_LOG_INTERVAL = 1000
+
+
+class LocalEventBroker(EventBroker):
+    """Buffers events in memory and appends them in batches to rotated gzip NDJSON files"""
+
+    def __init__(self, directory: Text = 'events', max_file_bytes: int = 64 * 1024 * 1024,
+                 batch_size: int = 1000, flush_interval: float = 1.0,
+                 max_buffer: int = 100000, max_retry_delay: float = 30.0,
+                 compresslevel: int = 6) -> None:
+        self.directory = directory
+        self.max_file_bytes = max_file_bytes
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.max_retry_delay = max_retry_delay
+        self.compresslevel = compresslevel
+
+        self._buffer: Deque[Dict[Text, Any]] = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._file: Optional[gzip.GzipFile] = None
+        self._raw = None
+        self._sequence = 0
+        self.published = 0
+        self.written = 0
+        self.dropped = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._writer = threading.Thread(target=self._write_loop, name='vaspx-event-broker',
+                                        daemon=True)
+        self._writer.start()
+        atexit.register(self._stop)
+
+    @classmethod
+    async def from_endpoint_config(cls, broker_config: EndpointConfig,
+                                   event_loop: Any = None) -> 'LocalEventBroker':
+        return cls(**broker_config.kwargs)
+
+    def publish(self, event: Dict[Text, Any]) -> None:
+        # Called on the event loop, so this only ever appends or drops
+        with self._condition:
+            if self._closed or not self._writer.is_alive():
+                self._drop(event, 'the event writer has stopped')
+                return
+            if len(self._buffer) >= self.max_buffer:
+                self._condition.notify_all()
+                self._drop(event, f'the event buffer is full ({self.max_buffer} events)')
+                return
+            self._buffer.append(event)
+            self.published += 1
+            if len(self._buffer) >= self.batch_size:
+                self._condition.notify_all()
+
+    def _drop(self, event: Dict[Text, Any], reason: Text) -> None:
+        self.dropped += 1
+        if (self.dropped - 1) % DROP_LOG_INTERVAL == 0:
+            logger.error(f"Dropped an event for '{event.get('sender_id')}': {reason}; "
+                         f"{self.dropped} dropped so far.")
+
+    def is_ready(self) -> bool:
+        return self._writer.is_alive()
+
+    async def close(self) -> None:
+        self._stop()
+
+    def _stop(self) -> None:
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._writer.join()
+
+    def _take_batch(self) -> List[Dict[Text, Any]]:
+        with self._condition:
+            if len(self._buffer) < self.batch_size and not self._closed:
+                self._condition.wait(self.flush_interval)
+            batch = [
+                self._buffer.popleft()
+                for _ in range(min(self.batch_size, len(self._buffer)))
+            ]
+            return batch
+
+    def _write_loop(self) -> None:
+        try:
+            while True:
+                batch = self._take_batch()
+                if batch:
+                    self._write_with_retry(batch)
+                elif self._closed:
+                    return
+        except Exception:
+            logger.exception(f"Event writer for '{self.directory}' stopped.")
+        finally:
+            self._close_file()
+
+    def _write_with_retry(self, batch: List[Dict[Text, Any]]) -> None:
+        """Write `batch`, reopening the file and backing off while writes fail"""
+        delay = RETRY_DELAY
+        while True:
+            try:
+                self._write(batch)
+                return
+            except Exception as error:
+                # The file may hold part of the batch; the retry starts a new one
+                self._discard_file()
+                with self._condition:
+                    if self._closed:
+                        self.dropped += len(batch)
+                        logger.error(f"Could not write {len(batch)} events to "
+                                     f"'{self.directory}' on shutdown ({error}); dropped them.")
+                        return
+                    logger.error(f"Could not write {len(batch)} events to '{self.directory}' "
+                                 f"({error}); retrying in {delay:.1f}s.")
+                    # Shutting down cuts the wait short for one last attempt
+                    self._condition.wait_for(lambda: self._closed, delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+    def _write(self, batch: List[Dict[Text, Any]]) -> None:
+        data = ''.join(
+            json.dumps(event, ensure_ascii=False, separators=(',', ':'), default=str) + '\n'
+            for event in batch
+        ).encode('utf-8')
+        if self._file is None:
+            self._open_file()
+        self._file.write(data)
+        # Everything up to here becomes readable without closing the file
+        self._file.flush()
+        self.written += len(batch)
+        if self._raw.tell() >= self.max_file_bytes:
+            self._close_file()
+
+    def _open_file(self) -> None:
+        self._sequence += 1
+        stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime())
+        name = f'{FILE_PREFIX}{stamp}-{os.getpid()}-{self._sequence:04d}{FILE_SUFFIX}'
+        self._raw = open(os.path.join(self.directory, name), 'ab')
+        self._file = gzip.GzipFile(fileobj=self._raw, mode='ab', compresslevel=self.compresslevel)
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._raw.close()
+            self._file = self._raw = None
+
+    def _discard_file(self) -> None:
+        """Close the current file after a failed write, ignoring further errors"""
+        for stream in (self._file, self._raw):
+            try:
+                if stream is not None:
+                    stream.close()
+            except Exception:
+                pass
+        self._file = self._raw = None
+
+    def stats(self) -> Dict[Text, Any]:
+        with self._condition:
+            return {
+                'buffered': len(self._buffer),
+                'published': self.published,
+                'written': self.written,
+                'dropped': self.dropped,
+            }
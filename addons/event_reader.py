@@ -0,0 +1,112 @@
+"""Stream the event files written by ``addons.event_broker.LocalEventBroker``
+
+Only the standard library is needed, so the files can be copied to another
+machine and aggregated there without installing Rasa:
+
+    python -m addons.event_reader events/ --summary
+    python -m addons.event_reader events/ --type slot --name product_name
+
+Without ``--summary`` the matching events are printed one JSON object per
+line, ready for ``jq`` or a notebook. The file still being written is read
+up to its last complete line.
+"""
+import argparse
+import glob
+import gzip
+import json
+import os
+import sys
+import zlib
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Text
+
+FILE_PREFIX = 'events-'
+FILE_SUFFIX = '.ndjson.gz'
+
+
+def event_files(directory: Text) -> List[Text]:
+    """Event files in `directory`, oldest first"""
+    # Names start with the UTC time the file was opened, so they sort by age
+    return sorted(glob.glob(os.path.join(directory, f'{FILE_PREFIX}*{FILE_SUFFIX}')))
+
+
+def read_file(path: Text) -> Iterator[Dict[Text, Any]]:
+    """Events in one file, stopping quietly at a truncated end"""
+    with gzip.open(path, 'rt', encoding='utf-8') as events_file:
+        try:
+            for line in events_file:
+                if not line.endswith('\n'):
+                    return
+                yield json.loads(line)
+        except (EOFError, zlib.error):
+            # Still open for writing, or cut off by a crash
+            return
+
+
+def iter_events(directory: Text, types: Optional[Sequence[Text]] = None,
+                names: Optional[Sequence[Text]] = None,
+                sender_id: Optional[Text] = None) -> Iterator[Dict[Text, Any]]:
+    """Every event in `directory` in the order written, optionally filtered
+
+    `names` matches the action name of ``action`` events and the slot name of
+    ``slot`` events.
+    """
+    for path in event_files(directory):
+        for event in read_file(path):
+            if types and event.get('event') not in types:
+                continue
+            if names and event.get('name') not in names:
+                continue
+            if sender_id is not None and event.get('sender_id') != sender_id:
+                continue
+            yield event
+
+
+def summarize(events: Iterator[Dict[Text, Any]]) -> Dict[Text, Any]:
+    """Counts of event types, executed actions, intents and slot values"""
+    event_types: Counter = Counter()
+    actions: Counter = Counter()
+    intents: Counter = Counter()
+    slots: Dict[Text, Counter] = {}
+    senders = set()
+    for event in events:
+        event_types[event.get('event')] += 1
+        senders.add(event.get('sender_id'))
+        if event.get('event') == 'action':
+            actions[event.get('name')] += 1
+        elif event.get('event') == 'user':
+            intents[((event.get('parse_data') or {}).get('intent') or {}).get('name')] += 1
+        elif event.get('event') == 'slot':
+            value = event.get('value')
+            key = value if isinstance(value, str) else json.dumps(value)
+            slots.setdefault(event.get('name'), Counter())[key] += 1
+    return {
+        'events': sum(event_types.values()),
+        'conversations': len(senders),
+        'event_types': dict(event_types.most_common()),
+        'actions': dict(actions.most_common()),
+        'intents': dict(intents.most_common()),
+        'slots': {name: dict(values.most_common()) for name, values in sorted(slots.items())},
+    }
+
+
+def main(argv: Optional[Sequence[Text]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('directory', help='directory the event broker writes to')
+    parser.add_argument('--type', nargs='*', dest='types', help="event types, e.g. 'action' 'slot'")
+    parser.add_argument('--name', nargs='*', dest='names', help='action or slot names')
+    parser.add_argument('--sender', help='only this conversation')
+    parser.add_argument('--summary', action='store_true', help='print counts instead of events')
+    args = parser.parse_args(argv)
+
+    events = iter_events(args.directory, args.types, args.names, args.sender)
+    if args.summary:
+        print(json.dumps(summarize(events), indent=2))
+        return 0
+    for event in events:
+        sys.stdout.write(json.dumps(event, ensure_ascii=False) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
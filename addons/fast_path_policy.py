@@ -0,0 +1,251 @@
+"""TEDPolicy with a compiled lookup table for single-turn rules
+
+Most rules in ``data/rules.yml`` map one intent straight to one or more
+responses. RulePolicy already predicts those turns with full confidence, but
+every policy in the ensemble still runs, so TED's model ran on each of them
+too. ``FastPathTEDPolicy`` is TEDPolicy, except that at training time it
+compiles every rule of the form
+
+    - intent: ask_contact_info
+    - action: utter_contact_info
+
+(one user message, only ``utter_`` actions, no conditions, slots, loops or
+``conversation_start``, and no other rule sending the same intent elsewhere)
+into a table from intent to its responses, stored with the model. Rules
+with ``wait_for_user_input: false`` are left to the model, since the table
+would predict ``action_listen`` where they go on; training logs every such
+rule and every intent dropped for being ambiguous. When a
+turn is covered by the table the next response, or ``action_listen`` after
+the last one, is predicted from it with confidence 1.0 and the model is not
+run. Everything else goes to TED as before.
+
+    policies:
+      - name: addons.fast_path_policy.FastPathTEDPolicy
+        max_history: 5
+        epochs: 200
+
+The policy counts predictions and their time on both paths and logs a
+summary every ``VASPX_FAST_PATH_REPORT_EVERY`` predictions (default 1000; 0
+turns the log off). ``VASPX_FAST_PATH=0`` sends every turn to the model, to
+compare. ``python -m benchmarks.fast_path_bench`` reports both side by side.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Text, Tuple
+
+from rasa.core.policies.policy import PolicyPrediction, confidence_scores_for
+from rasa.core.policies.ted_policy import TEDPolicy
+from rasa.engine.graph import ExecutionContext
+from rasa.engine.recipes.default_recipe import DefaultV1Recipe
+from rasa.engine.storage.resource import Resource
+from rasa.engine.storage.storage import ModelStorage
+from rasa.shared.core.constants import ACTION_LISTEN_NAME, RULE_SNIPPET_ACTION_NAME
+from rasa.shared.core.domain import Domain
+from rasa.shared.core.events import ActionExecuted, UserUttered
+from rasa.shared.core.generator import TrackerWithCachedStates
+from rasa.shared.core.trackers import DialogueStateTracker
+from rasa.shared.nlu.constants import INTENT_NAME_KEY
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get('VASPX_FAST_PATH', '1') != '0'
+REPORT_EVERY = int(os.environ.get('VASPX_FAST_PATH_REPORT_EVERY', 1000))
+
+FAST_PATH_FILE = 'fast_path.json'
+
+RESPONSE_PREFIX = 'utter_'
+
+
+def _single_turn_rule(tracker: TrackerWithCachedStates) -> Optional[Tuple[Text, Tuple[Text, ...]]]:
+    """(intent, responses) if `tracker` is a rule the table can answer"""
+    intent = None
+    responses: List[Text] = []
+    snippet_start = False
+    for event in tracker.events:
+        if isinstance(event, UserUttered):
+            if intent is not None or not event.intent_name or event.entities:
+                return None
+            intent = event.intent_name
+        elif isinstance(event, ActionExecuted):
+            if event.action_name == RULE_SNIPPET_ACTION_NAME:
+                if intent is not None:
+                    # Continues without waiting for the user
+                    return None
+                snippet_start = True
+            elif event.action_name == ACTION_LISTEN_NAME:
+                continue
+            elif intent is None or not (event.action_name or '').startswith(RESPONSE_PREFIX):
+                return None
+            else:
+                responses.append(event.action_name)
+        else:
+            # Slot conditions, active loops and anything else the rule depends on
+            return None
+    if intent is None or not responses or not snippet_start:
+        return None
+    return intent, tuple(responses)
+
+
+def _continues_without_user_input(tracker: TrackerWithCachedStates) -> bool:
+    """Whether `tracker` is a rule ending in ``wait_for_user_input: false``"""
+    actions = [event for event in tracker.events if isinstance(event, ActionExecuted)]
+    return (
+        bool(actions) and actions[-1].action_name == RULE_SNIPPET_ACTION_NAME
+        and any(isinstance(event, UserUttered) for event in tracker.events)
+    )
+
+
+def compile_rules(trackers: List[TrackerWithCachedStates]) -> Dict[Text, List[Text]]:
+    """Intent -> responses for every unambiguous single-turn rule"""
+    table: Dict[Text, Tuple[Text, ...]] = {}
+    ambiguous = set()
+    for tracker in trackers:
+        if not tracker.is_rule_tracker:
+            continue
+        if _continues_without_user_input(tracker):
+            logger.info(f"Rule '{tracker.sender_id}' does not wait for user input; "
+                        f"leaving it out of the fast path.")
+            continue
+        rule = _single_turn_rule(tracker)
+        if rule is None:
+            continue
+        intent, responses = rule
+        if table.setdefault(intent, responses) != responses:
+            ambiguous.add(intent)
+    for intent in sorted(ambiguous):
+        logger.info(f"Rules send intent '{intent}' to different responses; "
+                    f"leaving it out of the fast path.")
+    return {intent: list(responses) for intent, responses in table.items()
+            if intent not in ambiguous}
+
+
+class FastPathStats:
+    """Prediction counts and time on the fast path and in the model"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.fast_path = 0
+        self.model = 0
+        self.fast_path_s = 0.0
+        self.model_s = 0.0
+
+    def record(self, fast: bool, seconds: float) -> None:
+        with self._lock:
+            if fast:
+                self.fast_path += 1
+                self.fast_path_s += seconds
+            else:
+                self.model += 1
+                self.model_s += seconds
+            total = self.fast_path + self.model
+        if REPORT_EVERY and total % REPORT_EVERY == 0:
+            logger.info(self.summary())
+
+    def as_dict(self) -> Dict[Text, Any]:
+        with self._lock:
+            total = self.fast_path + self.model
+            fast_ms = 1000 * self.fast_path_s / self.fast_path if self.fast_path else 0.0
+            model_ms = 1000 * self.model_s / self.model if self.model else 0.0
+            return {
+                'predictions': total,
+                'fast_path': self.fast_path,
+                'fast_path_fraction': self.fast_path / total if total else 0.0,
+                'fast_path_mean_ms': fast_ms,
+                'model_mean_ms': model_ms,
+                # What the fast-path predictions would have cost in the model
+                'saved_ms': self.fast_path * max(0.0, model_ms - fast_ms),
+            }
+
+    def summary(self) -> Text:
+        stats = self.as_dict()
+        return (
+            f"Fast path answered {stats['fast_path']} of {stats['predictions']} policy "
+            f"predictions ({stats['fast_path_fraction']:.1%}) in {stats['fast_path_mean_ms']:.3f}ms "
+            f"each against {stats['model_mean_ms']:.2f}ms in TED, saving "
+            f"{stats['saved_ms'] / 1000:.1f}s."
+        )
+
+
+STATS = FastPathStats()
+
+
+@DefaultV1Recipe.register(
+    DefaultV1Recipe.ComponentType.POLICY_WITH_END_TO_END_SUPPORT, is_trainable=True
+)
+class FastPathTEDPolicy(TEDPolicy):
+    """TEDPolicy that answers single-turn rule intents from a lookup table"""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.fast_path: Dict[Text, List[Text]] = {}
+
+    def train(self, training_trackers: List[TrackerWithCachedStates], domain: Domain,
+              **kwargs: Any) -> Resource:
+        # Before TED drops the rule trackers it does not train on
+        self.fast_path = compile_rules(training_trackers)
+        logger.info(f"Compiled {len(self.fast_path)} single-turn rules into the fast path.")
+        resource = super().train(training_trackers, domain, **kwargs)
+        with self._model_storage.write_to(self._resource) as directory:
+            (directory / FAST_PATH_FILE).write_text(json.dumps(self.fast_path), encoding='utf-8')
+        return resource
+
+    @classmethod
+    def load(cls, config: Dict[Text, Any], model_storage: ModelStorage, resource: Resource,
+             execution_context: ExecutionContext, *args: Any,
+             **kwargs: Any) -> 'FastPathTEDPolicy':
+        policy = super().load(config, model_storage, resource, execution_context, *args, **kwargs)
+        try:
+            with model_storage.read_from(resource) as directory:
+                policy.fast_path = json.loads(
+                    (directory / FAST_PATH_FILE).read_text(encoding='utf-8')
+                )
+        except (ValueError, FileNotFoundError):
+            logger.debug(f"No fast-path table stored for '{resource.name}'.")
+        return policy
+
+    def fast_path_action(self, tracker: DialogueStateTracker) -> Optional[Text]:
+        """Next action from the table, or None when the turn is not covered"""
+        if not self.fast_path or tracker.active_loop_name:
+            return None
+        responses = self.fast_path.get(tracker.latest_message.intent.get(INTENT_NAME_KEY))
+        if responses is None:
+            return None
+        executed = []
+        for event in reversed(tracker.events):
+            if isinstance(event, UserUttered):
+                break
+            if isinstance(event, ActionExecuted):
+                if len(executed) == len(responses):
+                    return None
+                executed.append(event.action_name)
+        else:
+            return None
+        executed.reverse()
+        if executed != responses[:len(executed)]:
+            return None
+        return responses[len(executed)] if len(executed) < len(responses) else ACTION_LISTEN_NAME
+
+    def predict_action_probabilities(self, tracker: DialogueStateTracker, domain: Domain,
+                                     rule_only_data: Optional[Dict[Text, Any]] = None,
+                                     **kwargs: Any) -> PolicyPrediction:
+        started = time.perf_counter()
+        action = self.fast_path_action(tracker) if ENABLED else None
+        if action is not None:
+            prediction = self._prediction(confidence_scores_for(action, 1.0, domain))
+        else:
+            prediction = super().predict_action_probabilities(
+                tracker, domain, rule_only_data=rule_only_data, **kwargs
+            )
+        STATS.record(action is not None, time.perf_counter() - started)
+        return prediction
+
+
+def fast_path_stats() -> Dict[Text, Any]:
+    """Counts and timings of fast-path and model predictions in this process"""
+    return STATS.as_dict()
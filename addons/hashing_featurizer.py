@@ -0,0 +1,127 @@
+"""Sparse n-gram features hashed into a fixed number of buckets
+
+``HashingFeaturizer`` is a drop-in replacement for a ``CountVectorsFeaturizer``
+with ``analyzer: char_wb``. Instead of learning a vocabulary from the training
+data it hashes every n-gram of every token into ``n_features`` columns, so the
+feature width, DIET's input layer and the stored model no longer grow with the
+training data, nothing needs to be trained or persisted, and featurizing a
+message needs no vocabulary lookups.
+
+    pipeline:
+      - name: addons.hashing_featurizer.HashingFeaturizer
+        analyzer: char_wb
+        min_ngram: 1
+        max_ngram: 4
+        n_features: 4096
+
+The width only pays off once it is well below the vocabulary it replaces:
+buckets beyond that make DIET's input layer, and the model, bigger than the
+vocabulary did. With the current data (about 3k char_wb n-grams) 4096 keeps
+the model the same size but loses intent F1 to collisions, so config.yml
+keeps the vocabulary for now.
+
+With ``alternate_sign: true`` half of the n-grams count negatively, so
+colliding n-grams tend to cancel out instead of adding up. Accuracy, model
+size and latency against the vocabulary-based featurizer are compared by
+
+    python -m benchmarks.pipeline_bench --variants baseline hashing_4096 hashing_8192
+"""
+from typing import Any, Dict, List, Optional, Text, Tuple, Type
+
+import numpy as np
+import scipy.sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from rasa.engine.graph import ExecutionContext, GraphComponent
+from rasa.engine.recipes.default_recipe import DefaultV1Recipe
+from rasa.engine.storage.resource import Resource
+from rasa.engine.storage.storage import ModelStorage
+from rasa.nlu.constants import DENSE_FEATURIZABLE_ATTRIBUTES, TOKENS_NAMES
+from rasa.nlu.featurizers.sparse_featurizer.sparse_featurizer import SparseFeaturizer
+from rasa.nlu.tokenizers.tokenizer import Tokenizer
+from rasa.shared.exceptions import InvalidConfigException
+from rasa.shared.nlu.training_data.message import Message
+from rasa.shared.nlu.training_data.training_data import TrainingData
+
+ANALYZERS = ('char_wb', 'char', 'word')
+
+
+@DefaultV1Recipe.register(
+    DefaultV1Recipe.ComponentType.MESSAGE_FEATURIZER, is_trainable=False
+)
+class HashingFeaturizer(SparseFeaturizer, GraphComponent):
+    """Creates sparse n-gram features with the hashing trick instead of a vocabulary"""
+
+    @classmethod
+    def required_components(cls) -> List[Type]:
+        return [Tokenizer]
+
+    @staticmethod
+    def get_default_config() -> Dict[Text, Any]:
+        return {
+            **SparseFeaturizer.get_default_config(),
+            # 'char_wb' (n-grams inside word boundaries), 'char' or 'word'
+            'analyzer': 'char_wb',
+            'min_ngram': 1,
+            'max_ngram': 4,
+            # Number of hash buckets, i.e. the width of the feature vectors
+            'n_features': 4096,
+            # Give half of the n-grams a negative sign to offset collisions
+            'alternate_sign': False,
+            'lowercase': True,
+        }
+
+    @classmethod
+    def validate_config(cls, config: Dict[Text, Any]) -> None:
+        if config['analyzer'] not in ANALYZERS:
+            raise InvalidConfigException(
+                f"{cls.__name__}: 'analyzer' must be one of {', '.join(ANALYZERS)}, "
+                f"not '{config['analyzer']}'."
+            )
+        if not 1 <= config['min_ngram'] <= config['max_ngram']:
+            raise InvalidConfigException(
+                f"{cls.__name__}: need 1 <= 'min_ngram' <= 'max_ngram'."
+            )
+        if config['n_features'] < 1:
+            raise InvalidConfigException(f"{cls.__name__}: 'n_features' must be positive.")
+
+    def __init__(self, config: Dict[Text, Any], execution_context: ExecutionContext) -> None:
+        super().__init__(execution_context.node_name, config)
+        self.validate_config(self._config)
+        self._vectorizer = HashingVectorizer(
+            analyzer=self._config['analyzer'],
+            ngram_range=(self._config['min_ngram'], self._config['max_ngram']),
+            n_features=self._config['n_features'],
+            alternate_sign=self._config['alternate_sign'],
+            lowercase=self._config['lowercase'],
+            norm=None,
+            dtype=np.float32,
+        )
+
+    @classmethod
+    def create(cls, config: Dict[Text, Any], model_storage: ModelStorage,
+               resource: Resource, execution_context: ExecutionContext) -> 'HashingFeaturizer':
+        return cls(config, execution_context)
+
+    def process_training_data(self, training_data: TrainingData) -> TrainingData:
+        self.process(training_data.training_examples)
+        return training_data
+
+    def process(self, messages: List[Message]) -> List[Message]:
+        for message in messages:
+            for attribute in DENSE_FEATURIZABLE_ATTRIBUTES:
+                features = self._features(message, attribute)
+                if features is not None:
+                    sequence, sentence = features
+                    self.add_features_to_message(sequence, sentence, attribute, message)
+        return messages
+
+    def _features(self, message: Message,
+                  attribute: Text) -> Optional[Tuple[scipy.sparse.spmatrix, scipy.sparse.spmatrix]]:
+        """One row per token, plus their sum as the sentence features"""
+        tokens = message.get(TOKENS_NAMES[attribute])
+        if not tokens:
+            return None
+        sequence = self._vectorizer.transform([token.text for token in tokens])
+        sentence = scipy.sparse.csr_matrix(sequence.sum(axis=0, dtype=np.float32))
+        return sequence, sentence
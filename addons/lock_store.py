@@ -0,0 +1,264 @@
+"""Lock store shared by the Rasa server processes on one host
+
+Rasa handles one message per conversation at a time by taking a ticket lock
+on the sender id. The default in-memory lock store only covers a single
+process, so with several server workers two messages of one sender can be
+handled at once and one turn's events overwrite the other's.
+``LocalLockStore`` keeps the ticket locks in a SQLite file instead, which
+every process on the host opens:
+
+* issuing, checking and returning a ticket each run in one ``BEGIN
+  IMMEDIATE`` transaction, so no two processes read-modify-write a lock at
+  the same time,
+* every ticket expires after ``lock_lifetime`` seconds (Rasa's
+  ``TICKET_LOCK_LIFETIME``, default 60), so a worker that dies holding a
+  lock holds up its conversation for at most that long, and rows of
+  conversations that never come back are purged,
+* a waiting message checks its ticket after 1 ms, backing off to every
+  ``poll_interval`` seconds instead of Rasa's fixed one second; checking is
+  a read, so waiters do not queue up for the database's write lock,
+* ``lock()`` runs every database call on the event loop's default executor,
+  so a transaction waiting out another process's write lock (up to
+  ``busy_timeout`` seconds) never holds up the loop.
+
+Run several workers with the shared stores from ``endpoints.yml``:
+
+    lock_store:
+      type: addons.lock_store.LocalLockStore
+      path: locks.db
+
+    SANIC_WORKERS=4 python -m addons.warm_start run --enable-api --port 5005
+
+Rasa only starts more than one worker when the lock store is not the
+in-memory one. The workers accept connections on the same port; the
+``LocalTrackerStore`` notices ``SANIC_WORKERS`` and reads and writes
+trackers straight through to its file, since the next message of a
+conversation may land on another worker. Across hosts use Redis and a
+shared tracker store instead.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import (
+    Any, AsyncGenerator, Callable, Dict, Iterator, Optional, Text, Tuple, TypeVar,
+)
+
+from rasa.core.lock import TicketLock
+from rasa.core.lock_store import LOCK_LIFETIME, LockError, LockStore
+from rasa.utils.endpoints import EndpointConfig
+
+logger = logging.getLogger(__name__)
+
+Result = TypeVar('Result')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS locks (
+    conversation_id TEXT PRIMARY KEY,
+    lock TEXT NOT NULL,
+    expires_at REAL NOT NULL
+)
+'''
+
+# How often abandoned locks are purged, in seconds
+PURGE_INTERVAL = 60.0
+
+# Jittered waits for another process's write transaction, in seconds
+BUSY_RETRY = 0.0002
+MAX_BUSY_RETRY = 0.005
+
+# First wait for a held lock, in seconds; it doubles up to the poll interval
+FIRST_POLL = 0.001
+
+
+class LocalLockStore(LockStore):
+    """Ticket locks in a SQLite file, shared by all server processes on the host"""
+
+    def __init__(self, endpoint_config: Optional[EndpointConfig] = None, path: Text = 'locks.db',
+                 poll_interval: float = 0.02, busy_timeout: float = 10.0,
+                 **kwargs: Any) -> None:
+        settings = dict(endpoint_config.kwargs) if endpoint_config is not None else {}
+        self.path = settings.get('path', path)
+        self.poll_interval = float(settings.get('poll_interval', poll_interval))
+        self.busy_timeout = float(settings.get('busy_timeout', busy_timeout))
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid = 0
+        self._purged_at = 0.0
+        self.issued = 0
+        self.waits = 0
+        self.expired = 0
+        with self._transaction() as connection:
+            connection.execute(SCHEMA)
+        self._purge()
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection must not cross a fork; each worker opens its own
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout,
+                                         check_same_thread=False, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            # Locks are worthless after a crash anyway: every ticket has expired
+            connection.execute('PRAGMA synchronous=OFF')
+            # From here on _execute retries; SQLite's own busy handler
+            # sleeps up to 100 ms at a time, far longer than a lock transaction
+            connection.execute('PRAGMA busy_timeout=0')
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """One write transaction, holding the database lock from the first statement"""
+        with self._lock:
+            connection = self._connect()
+            self._execute(connection, 'BEGIN IMMEDIATE')
+            try:
+                yield connection
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+
+    def _execute(self, connection: sqlite3.Connection, statement: Text,
+                 parameters: Tuple[Any, ...] = ()) -> sqlite3.Cursor:
+        """Run `statement`, retrying with short jittered sleeps while the database is busy"""
+        deadline = time.monotonic() + self.busy_timeout
+        delay = BUSY_RETRY
+        while True:
+            try:
+                return connection.execute(statement, parameters)
+            except sqlite3.OperationalError as error:
+                if 'locked' not in str(error) or time.monotonic() > deadline:
+                    raise
+            time.sleep(delay * random.random())
+            delay = min(delay * 2, MAX_BUSY_RETRY)
+
+    def _read(self, connection: sqlite3.Connection, conversation_id: Text) -> Optional[TicketLock]:
+        row = self._execute(
+            connection, 'SELECT lock FROM locks WHERE conversation_id = ?', (conversation_id,)
+        ).fetchone()
+        return TicketLock.from_dict(json.loads(row[0])) if row else None
+
+    @staticmethod
+    def _write(connection: sqlite3.Connection, lock: TicketLock) -> None:
+        if not lock.tickets:
+            connection.execute('DELETE FROM locks WHERE conversation_id = ?',
+                               (lock.conversation_id,))
+            return
+        connection.execute(
+            'INSERT OR REPLACE INTO locks (conversation_id, lock, expires_at) VALUES (?, ?, ?)',
+            (lock.conversation_id, lock.dumps(), max(ticket.expires for ticket in lock.tickets)),
+        )
+
+    def get_lock(self, conversation_id: Text) -> Optional[TicketLock]:
+        with self._lock:
+            return self._read(self._connect(), conversation_id)
+
+    def delete_lock(self, conversation_id: Text) -> None:
+        with self._transaction() as connection:
+            deleted = connection.execute(
+                'DELETE FROM locks WHERE conversation_id = ?', (conversation_id,)
+            ).rowcount
+        if deleted:
+            logger.debug(f"Deleted lock for conversation '{conversation_id}'.")
+
+    def save_lock(self, lock: TicketLock) -> None:
+        with self._transaction() as connection:
+            self._write(connection, lock)
+
+    def issue_ticket(self, conversation_id: Text, lock_lifetime: float = LOCK_LIFETIME) -> int:
+        with self._transaction() as connection:
+            lock = self._read(connection, conversation_id) or self.create_lock(conversation_id)
+            # TicketLock.issue_ticket drops expired tickets first
+            ticket = lock.issue_ticket(lock_lifetime)
+            self._write(connection, lock)
+        self.issued += 1
+        if time.time() - self._purged_at > PURGE_INTERVAL:
+            self._purge()
+        return ticket
+
+    def update_lock(self, conversation_id: Text) -> None:
+        with self._transaction() as connection:
+            lock = self._read(connection, conversation_id)
+            if lock is not None:
+                before = len(lock.tickets)
+                lock.remove_expired_tickets()
+                self.expired += before - len(lock.tickets)
+                self._write(connection, lock)
+
+    def finish_serving(self, conversation_id: Text, ticket_number: int) -> None:
+        with self._transaction() as connection:
+            lock = self._read(connection, conversation_id)
+            if lock is not None:
+                lock.remove_ticket_for(ticket_number)
+                self._write(connection, lock)
+
+    def cleanup(self, conversation_id: Text, ticket_number: int) -> None:
+        # Returning the last ticket deletes the row in the same transaction
+        self.finish_serving(conversation_id, ticket_number)
+
+    def _purge(self) -> None:
+        """Delete locks whose tickets have all expired"""
+        self._purged_at = time.time()
+        with self._transaction() as connection:
+            purged = connection.execute(
+                'DELETE FROM locks WHERE expires_at < ?', (self._purged_at,)
+            ).rowcount
+        if purged:
+            logger.debug(f"Purged {purged} expired conversation locks from '{self.path}'.")
+
+    @asynccontextmanager
+    async def lock(
+        self, conversation_id: Text, lock_lifetime: float = LOCK_LIFETIME,
+        wait_time_in_seconds: Optional[float] = None,
+    ) -> AsyncGenerator[TicketLock, None]:
+        ticket = await self._off_loop(self.issue_ticket, conversation_id, lock_lifetime)
+        try:
+            yield await self._acquire_lock(
+                conversation_id, ticket,
+                self.poll_interval if wait_time_in_seconds is None else wait_time_in_seconds,
+            )
+        finally:
+            await self._off_loop(self.cleanup, conversation_id, ticket)
+
+    @staticmethod
+    async def _off_loop(function: Callable[..., Result], *args: Any) -> Result:
+        """Run a database call on the default executor; retries while busy sleep"""
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    async def _acquire_lock(self, conversation_id: Text, ticket: int,
+                            wait_time_in_seconds: float) -> TicketLock:
+        delay = min(FIRST_POLL, wait_time_in_seconds)
+        waited = False
+        while True:
+            lock = await self._off_loop(self.get_lock, conversation_id)
+            if lock is None:
+                break
+            if not lock.is_locked(ticket):
+                return lock
+            if not waited:
+                waited = True
+                self.waits += 1
+            if lock.tickets[0].has_expired():
+                # The holder died or overran its lifetime; checking is a read,
+                # so only then does the poll take the write lock
+                await self._off_loop(self.update_lock, conversation_id)
+                continue
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, wait_time_in_seconds)
+        raise LockError(
+            f"Could not acquire lock for conversation_id '{conversation_id}'; "
+            f"ticket {ticket} expired while waiting."
+        )
+
+    def stats(self) -> Dict[Text, Any]:
+        with self._lock:
+            held = self._connect().execute('SELECT COUNT(*) FROM locks').fetchone()[0]
+        return {'held': held, 'issued': self.issued, 'waits': self.waits,
+                'expired': self.expired}
@@ -0,0 +1,93 @@
+"""Domain responses pre-rendered once per channel output format
+
+``ChannelFormatNLG`` is the stock response generator, except that at startup
+it fills the ``$name`` contact placeholders of every response variation in
+the domain from ``actions/catalog.yml`` (see ``Catalog.fill``) and converts
+the text into each output format from ``actions/formatting.py`` (Markdown as
+written, plain text, HTML). A response is then chosen, and its slots filled, from the
+variant for the format of the channel the conversation is on, so nothing is
+reformatted per message. Slot values filled into an HTML variant are escaped
+first, since they come from users and the variant is already markup.
+
+    nlg:
+      type: addons.nlg.ChannelFormatNLG
+"""
+import copy
+import html
+import logging
+from typing import Any, Dict, List, Optional, Text
+
+from rasa.core.nlg.response import TemplatedNaturalLanguageGenerator
+from rasa.shared.core.domain import Domain
+from rasa.shared.core.trackers import DialogueStateTracker
+from rasa.utils.endpoints import EndpointConfig
+
+from actions.catalog import CATALOG
+from actions.formatting import FORMATS, HTML, MARKDOWN, channel_format, render_format
+
+logger = logging.getLogger(__name__)
+
+Responses = Dict[Text, List[Dict[Text, Any]]]
+
+
+def fill_responses(responses: Responses) -> Responses:
+    """Copy of `responses` with the catalog's phone numbers and emails filled in"""
+    filled = copy.deepcopy(responses)
+    for name, variations in filled.items():
+        for variation in variations:
+            if isinstance(variation.get('text'), str):
+                variation['text'] = CATALOG.fill(variation['text'], f"response '{name}'")
+    return filled
+
+
+def render_responses(responses: Responses, output_format: Text) -> Responses:
+    """Copy of `responses` with every variation's text converted to `output_format`"""
+    rendered = copy.deepcopy(responses)
+    for variations in rendered.values():
+        for variation in variations:
+            if isinstance(variation.get('text'), str):
+                variation['text'] = render_format(variation['text'], output_format)
+    return rendered
+
+
+def _escape(value: Any) -> Any:
+    if isinstance(value, str):
+        return html.escape(value)
+    if isinstance(value, (list, tuple)):
+        return [_escape(item) for item in value]
+    return value
+
+
+class HTMLResponseGenerator(TemplatedNaturalLanguageGenerator):
+    """Generator for the HTML variants, escaping slot and keyword values before filling them in"""
+
+    @staticmethod
+    def _response_variables(filled_slots: Optional[Dict[Text, Any]],
+                            kwargs: Dict[Text, Any]) -> Dict[Text, Any]:
+        variables = TemplatedNaturalLanguageGenerator._response_variables(filled_slots, kwargs)
+        return {name: _escape(value) for name, value in variables.items()}
+
+
+class ChannelFormatNLG(TemplatedNaturalLanguageGenerator):
+    """Generates domain responses from variants pre-rendered for each channel format"""
+
+    def __init__(self, endpoint_config: Optional[EndpointConfig] = None,
+                 domain: Optional[Domain] = None) -> None:
+        responses = fill_responses((domain or Domain.empty()).responses)
+        super().__init__(responses)
+        self._generators: Dict[Text, TemplatedNaturalLanguageGenerator] = {MARKDOWN: self}
+        for output_format in FORMATS:
+            if output_format != MARKDOWN:
+                generator_class = (HTMLResponseGenerator if output_format == HTML
+                                   else TemplatedNaturalLanguageGenerator)
+                self._generators[output_format] = generator_class(
+                    render_responses(responses, output_format)
+                )
+        logger.debug(f"Pre-rendered {len(responses)} responses in {', '.join(FORMATS)}.")
+
+    async def generate(self, utter_action: Text, tracker: DialogueStateTracker,
+                       output_channel: Text, **kwargs: Any) -> Optional[Dict[Text, Any]]:
+        generator = self._generators[channel_format(output_channel)]
+        if generator is self:
+            return await super().generate(utter_action, tracker, output_channel, **kwargs)
+        return await generator.generate(utter_action, tracker, output_channel, **kwargs)
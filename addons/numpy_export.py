@@ -0,0 +1,377 @@
+"""Export a trained model's intent classification for ``addons.numpy_nlu``
+
+Loads a trained model with Rasa and writes everything intent classification
+needs at inference into one memory-mappable array file: the
+WhitespaceTokenizer settings, the vocabularies and settings of the
+lexical-syntactic, count-vector and hashing featurizers, DIETClassifier's
+input, transformer and embedding weights with its label embeddings, and
+the FallbackClassifier thresholds.
+
+    python -m addons.numpy_export --model models/20251003-152049.tar.gz --output models/nlu.vxnp
+
+TensorFlow is needed here, but not where the file is used. Components the
+NumPy runtime does not implement (dense featurizers, regex patterns,
+relative attention, entity tags) stop the export with an error instead of
+producing a model that answers differently. Each transformer is also run
+on random input in both implementations and compared before anything is
+written.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence, Text, Tuple
+
+import numpy as np
+
+from .numpy_nlu import ACTIVATIONS, NumpyIntentClassifier, write_arrays
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTPUT = os.path.join('models', 'nlu.vxnp')
+
+# Largest difference allowed between the TensorFlow and NumPy transformers
+ENCODER_TOLERANCE = 1e-3
+
+
+class ExportError(Exception):
+    """The model uses something the NumPy runtime cannot reproduce"""
+
+
+def nlu_components(agent: Any) -> List[Any]:
+    """The NLU components of `agent`'s model that run on a message, in pipeline order"""
+    from rasa.nlu.classifiers.classifier import IntentClassifier
+    from rasa.nlu.extractors.extractor import EntityExtractorMixin
+    from rasa.nlu.featurizers.featurizer import Featurizer
+    from rasa.nlu.tokenizers.tokenizer import Tokenizer
+
+    nodes = getattr(agent.processor.graph_runner, '_instantiated_nodes', {}) or {}
+    return [
+        node._component for node in nodes.values()
+        if isinstance(getattr(node, '_component', None),
+                      (Tokenizer, Featurizer, IntentClassifier, EntityExtractorMixin))
+    ]
+
+
+def _config_of(component: Any) -> Dict[Text, Any]:
+    return getattr(component, 'component_config', None) or getattr(component, '_config', None) or {}
+
+
+def _activation(function: Any) -> Optional[Text]:
+    """Name in ``numpy_nlu.ACTIVATIONS`` of a Keras activation, identified by evaluating it"""
+    import tensorflow as tf
+
+    if function is None or getattr(function, '__name__', '') == 'linear':
+        return None
+    probe = np.linspace(-4, 4, 161, dtype=np.float32)
+    actual = np.asarray(function(tf.constant(probe)))
+    for name, candidate in ACTIVATIONS.items():
+        if np.allclose(candidate(probe), actual, atol=1e-5):
+            return name
+    raise ExportError(f"Unsupported activation {getattr(function, '__name__', function)!r}")
+
+
+class _Weights:
+    """Arrays and layer settings collected for the array file"""
+
+    def __init__(self) -> None:
+        self.arrays: Dict[Text, np.ndarray] = {}
+        self.layers: Dict[Text, Dict[Text, Any]] = {}
+
+    def dense(self, name: Text, layer: Any) -> None:
+        kernel = np.asarray(layer.kernel, dtype=np.float32)
+        # RandomlyConnectedDense keeps a fixed mask of the connections it uses
+        mask = getattr(layer, 'kernel_mask', None)
+        if mask is not None:
+            kernel = kernel * np.asarray(mask, dtype=np.float32)
+        self.arrays[f'{name}.kernel'] = kernel
+        bias = layer.bias if getattr(layer, 'use_bias', False) else None
+        if bias is not None:
+            self.arrays[f'{name}.bias'] = np.asarray(bias, dtype=np.float32)
+        self.layers[name] = {
+            'type': 'dense',
+            'bias': bias is not None,
+            'activation': _activation(getattr(layer, 'activation', None)),
+        }
+
+    def norm(self, name: Text, layer: Any) -> None:
+        self.arrays[f'{name}.gamma'] = np.asarray(layer.gamma, dtype=np.float32)
+        self.arrays[f'{name}.beta'] = np.asarray(layer.beta, dtype=np.float32)
+        self.layers[name] = {'type': 'norm', 'epsilon': float(layer.epsilon)}
+
+
+def _children(layer: Any) -> Dict[Text, Any]:
+    return dict(getattr(layer, '_tf_layers', None) or {})
+
+
+def _find(layers: Dict[Text, Any], class_name: Text, required: bool = True) -> Any:
+    found = [layer for layer in layers.values() if type(layer).__name__ == class_name]
+    if len(found) > 1 or (required and not found):
+        raise ExportError(
+            f"Expected one {class_name} in DIET, found {len(found)} among {', '.join(layers)}"
+        )
+    return found[0] if found else None
+
+
+def _export_tokenizer(component: Any) -> None:
+    from rasa.nlu.tokenizers.whitespace_tokenizer import WhitespaceTokenizer
+
+    if not isinstance(component, WhitespaceTokenizer):
+        raise ExportError(f"Only WhitespaceTokenizer is supported, not {type(component).__name__}")
+    if _config_of(component).get('token_pattern'):
+        raise ExportError("WhitespaceTokenizer 'token_pattern' is not supported")
+
+
+def _export_featurizer(component: Any) -> Optional[Dict[Text, Any]]:
+    from rasa.nlu.featurizers.sparse_featurizer.count_vectors_featurizer import (
+        CountVectorsFeaturizer,
+    )
+    from rasa.nlu.featurizers.sparse_featurizer.lexical_syntactic_featurizer import (
+        LexicalSyntacticFeaturizer,
+    )
+    from rasa.nlu.featurizers.sparse_featurizer.regex_featurizer import RegexFeaturizer
+    from rasa.shared.nlu.constants import TEXT
+
+    from .hashing_featurizer import HashingFeaturizer
+
+    config = _config_of(component)
+    if isinstance(component, RegexFeaturizer):
+        if getattr(component, 'known_patterns', None):
+            raise ExportError('RegexFeaturizer patterns are not supported')
+        # Without patterns it adds no features
+        return None
+    if isinstance(component, LexicalSyntacticFeaturizer):
+        feature_config = config['features']
+        half_window = len(feature_config) // 2
+        features = []
+        size = 0
+        for (window_position, name), columns in sorted(component._feature_to_idx_dict.items()):
+            columns = {str(value): int(column) for value, column in columns.items()}
+            features.append([int(window_position) - half_window, name, columns])
+            size = max([size] + [column + 1 for column in columns.values()])
+        size = int(getattr(component, '_number_of_features', None) or size)
+        return {'type': 'lexical_syntactic', 'size': size, 'features': features}
+    if isinstance(component, CountVectorsFeaturizer):
+        vectorizer = (getattr(component, 'vectorizers', None) or {}).get(TEXT)
+        if vectorizer is None:
+            return None
+        if config.get('strip_accents') or config.get('stop_words'):
+            raise ExportError("CountVectorsFeaturizer 'strip_accents' and 'stop_words' are not supported")
+        vocabulary = {str(ngram): int(column) for ngram, column in vectorizer.vocabulary_.items()}
+        return {
+            'type': 'count_vectors', 'size': len(vocabulary), 'vocabulary': vocabulary,
+            'analyzer': config['analyzer'], 'min_ngram': config['min_ngram'],
+            'max_ngram': config['max_ngram'], 'lowercase': config['lowercase'],
+            'oov_token': config.get('OOV_token'),
+        }
+    if isinstance(component, HashingFeaturizer):
+        return {
+            'type': 'hashing', 'size': config['n_features'], 'analyzer': config['analyzer'],
+            'min_ngram': config['min_ngram'], 'max_ngram': config['max_ngram'],
+            'lowercase': config['lowercase'], 'alternate_sign': config['alternate_sign'],
+        }
+    raise ExportError(f"Unsupported featurizer {type(component).__name__}")
+
+
+def _export_transformer(encoder: Any, weights: _Weights, heads: int) -> Dict[Text, Any]:
+    import tensorflow as tf
+
+    weights.dense('transformer.embedding', encoder._embedding)
+    feed_forward: List[Text] = []
+    for index, layer in enumerate(encoder._enc_layers):
+        prefix = f'transformer.{index}'
+        attention = layer._mha
+        if (getattr(attention, 'use_key_relative_position', False)
+                or getattr(attention, 'use_value_relative_position', False)
+                or getattr(attention, 'unidirectional', False)):
+            raise ExportError('Relative or unidirectional attention is not supported')
+        weights.norm(f'{prefix}.norm', layer._layer_norm)
+        weights.dense(f'{prefix}.query', attention._query_dense_layer)
+        weights.dense(f'{prefix}.key', attention._key_dense_layer)
+        weights.dense(f'{prefix}.value', attention._value_dense_layer)
+        weights.dense(f'{prefix}.output', attention._output_dense_layer)
+        steps = []
+        for step, sublayer in enumerate(layer._ffn_layers):
+            name = f'ff{step}'
+            if isinstance(sublayer, tf.keras.layers.LayerNormalization):
+                weights.norm(f'{prefix}.{name}', sublayer)
+            elif isinstance(sublayer, tf.keras.layers.Dense):
+                weights.dense(f'{prefix}.{name}', sublayer)
+            elif isinstance(sublayer, tf.keras.layers.Dropout):
+                continue
+            else:
+                raise ExportError(f"Unsupported transformer layer {type(sublayer).__name__}")
+            steps.append(name)
+        if feed_forward and steps != feed_forward:
+            raise ExportError('Transformer layers differ in structure')
+        feed_forward = steps
+    weights.norm('transformer.norm', encoder._layer_norm)
+    return {
+        'layers': len(encoder._enc_layers),
+        'units': int(getattr(encoder, 'units', None) or encoder._units),
+        'heads': int(getattr(encoder._enc_layers[0]._mha, 'num_heads', heads)),
+        'feed_forward': feed_forward,
+    }
+
+
+def _check_transformer(encoder: Any, classifier: NumpyIntentClassifier) -> float:
+    """Largest difference between both transformers on random input; raises above tolerance"""
+    import tensorflow as tf
+
+    input_size = classifier.arrays['transformer.embedding.kernel'].shape[0]
+    probe = np.random.default_rng(0).normal(size=(1, 9, input_size)).astype(np.float32)
+    expected = encoder(tf.constant(probe), tf.zeros((1, 9, 1)), training=False)
+    if isinstance(expected, (tuple, list)):
+        expected = expected[0]
+    # RasaSequenceLayer applies GELU to the transformer output
+    expected = np.asarray(tf.nn.gelu(expected))[0]
+    difference = float(np.abs(classifier._encode(probe[0]) - expected).max())
+    if difference > ENCODER_TOLERANCE:
+        raise ExportError(
+            f"NumPy transformer differs from TensorFlow by {difference:.2e} on random input"
+        )
+    return difference
+
+
+def _export_diet(component: Any, weights: _Weights) -> Tuple[Dict[Text, Any], List[Text], Any]:
+    from rasa.shared.nlu.constants import TEXT
+
+    model = component.model
+    config = _config_of(component)
+    if model is None:
+        raise ExportError('DIETClassifier has no trained model')
+    if not config.get('intent_classification', True):
+        raise ExportError('DIETClassifier does not classify intents')
+    tag_specs = getattr(component, '_entity_tag_specs', None) or []
+    if config.get('entity_recognition') and any(spec.num_tags > 1 for spec in tag_specs):
+        raise ExportError('Entity extraction is not supported; the training data has entity tags')
+    for feature_type in ('sequence', 'sentence'):
+        signatures = ((getattr(model, 'data_signature', None) or {}).get(TEXT) or {}).get(feature_type) or []
+        if any(not signature.is_sparse for signature in signatures):
+            raise ExportError('Dense featurizers are not supported')
+
+    layers = model._tf_layers
+    sequence_layer = _children(layers[f'sequence_layer.{TEXT}'])
+    combining = _find(sequence_layer, 'RasaFeatureCombiningLayer')
+    for key, layer in _children(combining).items():
+        feature_type = 'sentence' if 'sentence' in key else 'sequence'
+        if type(layer).__name__ == 'ConcatenateSparseDenseFeatures':
+            weights.dense(feature_type, _find(_children(layer), 'DenseForSparse'))
+        elif 'unify' in key:
+            weights.dense(f'unify.{feature_type}', layer)
+    if 'sequence' not in weights.layers or 'sentence' not in weights.layers:
+        raise ExportError('DIET needs both sequence and sentence features of the text')
+
+    ffnn = []
+    for layer in getattr(_find(sequence_layer, 'Ffnn'), '_ffn_layers', []):
+        if hasattr(layer, 'kernel'):
+            name = f'ffnn.{len(ffnn)}'
+            weights.dense(name, layer)
+            ffnn.append(name)
+
+    encoder = _find(sequence_layer, 'TransformerEncoder', required=False)
+    transformer = None
+    if encoder is not None:
+        transformer = _export_transformer(encoder, weights, config.get('number_of_attention_heads', 4))
+
+    embed = layers[f'embed.{TEXT}']
+    weights.dense('embed', getattr(embed, '_dense', embed))
+
+    label_embeddings = getattr(model, 'all_labels_embed', None)
+    if label_embeddings is None:
+        _, label_embeddings = model._create_all_labels()
+    label_embeddings = np.asarray(label_embeddings, dtype=np.float32)
+    label_embeddings = label_embeddings.reshape(-1, label_embeddings.shape[-1])
+    weights.arrays['label_embeddings'] = label_embeddings
+    labels = [component.index_label_id_mapping[index] for index in range(len(label_embeddings))]
+
+    loss = layers.get('loss.label')
+    diet = {
+        'layers': weights.layers,
+        'ffnn': ffnn,
+        'transformer': transformer,
+        'similarity': getattr(loss, 'similarity_type', None) or config.get('similarity_type'),
+        'model_confidence': getattr(loss, 'model_confidence', None) or config.get('model_confidence'),
+        'ranking_length': config.get('ranking_length', 10),
+        'renormalize': config.get('renormalize_confidences', False),
+    }
+    return diet, labels, encoder
+
+
+def export(model_path: Text, output: Text) -> Dict[Text, Any]:
+    """Write the NLU part of the model at `model_path` to `output`; returns a summary"""
+    import rasa
+    from rasa.core.agent import Agent
+    from rasa.nlu.classifiers.diet_classifier import DIETClassifier
+    from rasa.nlu.classifiers.fallback_classifier import FallbackClassifier
+    from rasa.nlu.featurizers.featurizer import Featurizer
+    from rasa.nlu.tokenizers.tokenizer import Tokenizer
+
+    agent = Agent.load(model_path)
+    weights = _Weights()
+    featurizers = []
+    diet = labels = encoder = fallback = None
+    for component in nlu_components(agent):
+        if isinstance(component, Tokenizer):
+            _export_tokenizer(component)
+        elif isinstance(component, Featurizer):
+            featurizer = _export_featurizer(component)
+            if featurizer is not None:
+                featurizers.append(featurizer)
+        elif isinstance(component, DIETClassifier):
+            if diet is not None:
+                raise ExportError('Only one DIETClassifier is supported')
+            diet, labels, encoder = _export_diet(component, weights)
+        elif isinstance(component, FallbackClassifier):
+            config = _config_of(component)
+            fallback = {'threshold': float(config['threshold']),
+                        'ambiguity_threshold': float(config['ambiguity_threshold'])}
+        else:
+            # Entity synonyms and the parse cache do not change the intent
+            logger.info(f"Not exporting {type(component).__name__}.")
+    if diet is None:
+        raise ExportError('The model has no DIETClassifier')
+
+    meta = {
+        'source_model': os.path.basename(model_path),
+        'rasa_version': rasa.__version__,
+        'exported_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'featurizers': featurizers,
+        'diet': diet,
+        'labels': labels,
+        'fallback': fallback,
+    }
+    summary = {'labels': len(labels), 'arrays': len(weights.arrays)}
+    if encoder is not None:
+        classifier = NumpyIntentClassifier(weights.arrays, meta)
+        summary['transformer_max_difference'] = _check_transformer(encoder, classifier)
+    summary['bytes'] = write_arrays(output, weights.arrays, meta)
+    return summary
+
+
+def main(argv: Optional[Sequence[Text]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--model', help='model to export (default: latest in models/)')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT,
+                        help=f'array file to write (default: {DEFAULT_OUTPUT})')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    from rasa.model import get_latest_model
+
+    model = args.model or get_latest_model('models')
+    try:
+        summary = export(model, args.output)
+    except ExportError as error:
+        logger.error(f"Cannot export {model}: {error}")
+        return 1
+    logger.info(
+        f"Exported {summary['labels']} intents from {model} to {args.output} "
+        f"({summary['bytes'] / (1024 * 1024):.1f} MB)."
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
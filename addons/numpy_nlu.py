@@ -0,0 +1,602 @@
+"""Intent classification from an exported model with NumPy only
+
+``addons.numpy_export`` writes the tokenizer settings, featurizer
+vocabularies and DIETClassifier weights of a trained model into one array
+file. This module reads it back and classifies intents without Rasa or
+TensorFlow: the whitespace tokenizer, the lexical-syntactic, count-vector
+and hashing featurizers, DIET's sparse input layers, transformer and
+similarity head and the FallbackClassifier are reimplemented on NumPy
+arrays that are memory-mapped from the file, so a process needs only the
+pages it touches and several processes share them.
+
+    python -m addons.numpy_nlu parse models/nlu.vxnp "what does ednect cost"
+    python -m addons.numpy_nlu serve models/nlu.vxnp --port 5002
+
+``serve`` answers ``POST /model/parse`` like ``rasa run --enable-api``, so a
+Rasa server can use it as its NLU server:
+
+    nlu:
+      url: http://localhost:5002
+
+The file layout is an 8-byte magic, the length of a JSON header, the header
+(array names, dtypes, shapes and offsets, plus the component settings) and
+the arrays, each aligned to 64 bytes. ``benchmarks/numpy_nlu_bench.py``
+checks the intent ranking against the original model on ``data/nlu.yml``.
+Entity extraction is not exported; parse results have no entities.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Sequence, Text, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'VXNP\x00\x01\r\n'
+ALIGNMENT = 64
+FORMAT_VERSION = 1
+
+NLU_FALLBACK = 'nlu_fallback'
+
+# One sparse row: column -> value
+SparseRow = Dict[int, float]
+
+
+class ExportFormatError(ValueError):
+    """The array file is missing, truncated or of another format version"""
+
+
+def write_arrays(path: Text, arrays: Dict[Text, np.ndarray], meta: Dict[Text, Any]) -> int:
+    """Write `arrays` and the JSON-serializable `meta` to `path`; returns the file size"""
+    index = {}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        arrays[name] = array
+        index[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header = json.dumps({'version': FORMAT_VERSION, 'arrays': index, 'meta': meta}).encode('utf-8')
+    data_start = -(-(len(MAGIC) + 8 + len(header)) // ALIGNMENT) * ALIGNMENT
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'wb') as array_file:
+        array_file.write(MAGIC)
+        array_file.write(len(header).to_bytes(8, 'little'))
+        array_file.write(header)
+        array_file.write(b'\x00' * (data_start - array_file.tell()))
+        for name, array in arrays.items():
+            array_file.seek(data_start + index[name]['offset'])
+            array_file.write(array.tobytes())
+        array_file.truncate(data_start + offset)
+        return array_file.tell()
+
+
+def read_arrays(path: Text) -> Tuple[Dict[Text, np.ndarray], Dict[Text, Any]]:
+    """Memory-mapped, read-only arrays and the metadata written by :func:`write_arrays`"""
+    with open(path, 'rb') as array_file:
+        if array_file.read(len(MAGIC)) != MAGIC:
+            raise ExportFormatError(f"{path} is not an exported NLU model")
+        length = int.from_bytes(array_file.read(8), 'little')
+        header = json.loads(array_file.read(length).decode('utf-8'))
+    if header.get('version') != FORMAT_VERSION:
+        raise ExportFormatError(
+            f"{path} has format version {header.get('version')}, expected {FORMAT_VERSION}"
+        )
+    data_start = -(-(len(MAGIC) + 8 + length) // ALIGNMENT) * ALIGNMENT
+    mapped = np.memmap(path, dtype=np.uint8, mode='r')
+    arrays = {}
+    for name, entry in header['arrays'].items():
+        dtype = np.dtype(entry['dtype'])
+        count = int(np.prod(entry['shape'], dtype=np.int64))
+        arrays[name] = np.frombuffer(
+            mapped, dtype=dtype, count=count, offset=data_start + entry['offset']
+        ).reshape(entry['shape'])
+    return arrays, header['meta']
+
+
+# WhitespaceTokenizer: punctuation that is removed before splitting on spaces
+_PUNCTUATION = re.compile(
+    # at the end of a word
+    r'[^\w#@&]+(?=\s|$)|'
+    # at the start of a word, not followed by a number
+    r'(\s|^)[^\w#@&]+(?=[^0-9\s])|'
+    # inside a word, except between numbers and in e-mail addresses and URLs
+    r'(?<=[^0-9\s])[^\w._~:/?#\[\]()@!$&*+,;=-]+(?=[^0-9\s])'
+)
+_EMOJI = re.compile(
+    '['
+    '\U0001F600-\U0001F64F'
+    '\U0001F300-\U0001F5FF'
+    '\U0001F680-\U0001F6FF'
+    '\U0001F1E0-\U0001F1FF'
+    '\U00002702-\U000027B0'
+    '\U000024C2-\U0001F251'
+    '\u200d'
+    '\u200c'
+    ']+'
+)
+
+
+def tokenize(text: Text) -> List[Text]:
+    """Tokens of `text` as Rasa's WhitespaceTokenizer splits them"""
+    words = [word for word in _PUNCTUATION.sub(' ', text).split() if not _EMOJI.fullmatch(word)]
+    return words or [text]
+
+
+def _word_ngrams(text: Text, min_n: int, max_n: int) -> List[Text]:
+    words = re.findall(r'(?u)\b\w+\b', text)
+    if max_n == 1:
+        return words
+    ngrams = []
+    for n in range(min_n, max_n + 1):
+        ngrams.extend(' '.join(words[start:start + n]) for start in range(len(words) - n + 1))
+    return ngrams
+
+
+_WHITE_SPACES = re.compile(r'\s\s+')
+
+
+def _char_wb_ngrams(text: Text, min_n: int, max_n: int) -> List[Text]:
+    # scikit-learn's char_wb analyzer
+    ngrams = []
+    for word in _WHITE_SPACES.sub(' ', text).split():
+        word = f' {word} '
+        for n in range(min_n, max_n + 1):
+            offset = 0
+            ngrams.append(word[offset:offset + n])
+            while offset + n < len(word):
+                offset += 1
+                ngrams.append(word[offset:offset + n])
+            if offset == 0:
+                break
+    return ngrams
+
+
+def _char_ngrams(text: Text, min_n: int, max_n: int) -> List[Text]:
+    text = _WHITE_SPACES.sub(' ', text)
+    return [text[start:start + n] for n in range(min_n, min(max_n, len(text)) + 1)
+            for start in range(len(text) - n + 1)]
+
+
+ANALYZERS = {'word': _word_ngrams, 'char_wb': _char_wb_ngrams, 'char': _char_ngrams}
+
+
+def murmurhash3_32(data: bytes, seed: int = 0) -> int:
+    """Signed 32-bit MurmurHash3 (x86), as scikit-learn's feature hashing uses it"""
+    c1, c2 = 0xcc9e2d51, 0x1b873593
+    length = len(data)
+    h = seed & 0xffffffff
+    rounded = length & ~3
+    for start in range(0, rounded, 4):
+        k = int.from_bytes(data[start:start + 4], 'little')
+        k = (k * c1) & 0xffffffff
+        k = ((k << 15) | (k >> 17)) & 0xffffffff
+        h ^= (k * c2) & 0xffffffff
+        h = ((h << 13) | (h >> 19)) & 0xffffffff
+        h = (h * 5 + 0xe6546b64) & 0xffffffff
+    tail = data[rounded:]
+    if tail:
+        k = int.from_bytes(tail, 'little')
+        k = (k * c1) & 0xffffffff
+        k = ((k << 15) | (k >> 17)) & 0xffffffff
+        h ^= (k * c2) & 0xffffffff
+    h ^= length
+    h ^= h >> 16
+    h = (h * 0x85ebca6b) & 0xffffffff
+    h ^= h >> 13
+    h = (h * 0xc2b2ae35) & 0xffffffff
+    h ^= h >> 16
+    return h - (1 << 32) if h & 0x80000000 else h
+
+
+class Featurizer:
+    """Sparse sequence and sentence features of one exported featurizer"""
+
+    def __init__(self, meta: Dict[Text, Any]) -> None:
+        self.size = int(meta['size'])
+        self.has_sentence = bool(meta.get('sentence', True))
+
+    def sequence(self, tokens: Sequence[Text]) -> List[SparseRow]:
+        raise NotImplementedError
+
+    def sentence(self, tokens: Sequence[Text], rows: List[SparseRow]) -> SparseRow:
+        total: SparseRow = {}
+        for row in rows:
+            for column, value in row.items():
+                total[column] = total.get(column, 0.0) + value
+        return total
+
+
+class LexicalSyntacticFeaturizer(Featurizer):
+    """Case, position and affix features of each token and its neighbours"""
+
+    FUNCTIONS = {
+        'low': lambda token: token.islower(),
+        'title': lambda token: token.istitle(),
+        'upper': lambda token: token.isupper(),
+        'digit': lambda token: token.isdigit(),
+        'prefix5': lambda token: token[:5],
+        'prefix2': lambda token: token[:2],
+        'suffix5': lambda token: token[-5:],
+        'suffix3': lambda token: token[-3:],
+        'suffix2': lambda token: token[-2:],
+        'suffix1': lambda token: token[-1:],
+        # The whitespace tokenizer sets no part-of-speech tags
+        'pos': lambda token: None,
+        'pos2': lambda token: None,
+    }
+
+    def __init__(self, meta: Dict[Text, Any]) -> None:
+        super().__init__({**meta, 'sentence': False})
+        # (relative position, feature name, value -> column)
+        self.features: List[Tuple[int, Text, Dict[Text, int]]] = [
+            (int(position), name, columns) for position, name, columns in meta['features']
+        ]
+
+    @classmethod
+    def _value(cls, name: Text, tokens: Sequence[Text], position: int) -> Text:
+        if name == 'BOS':
+            return str(position == 0)
+        if name == 'EOS':
+            return str(position == len(tokens) - 1)
+        return str(cls.FUNCTIONS[name](tokens[position]))
+
+    def sequence(self, tokens: Sequence[Text]) -> List[SparseRow]:
+        rows = []
+        for anchor in range(len(tokens)):
+            row: SparseRow = {}
+            for relative, name, columns in self.features:
+                position = anchor + relative
+                if 0 <= position < len(tokens):
+                    column = columns.get(self._value(name, tokens, position))
+                    if column is not None:
+                        row[column] = 1.0
+            rows.append(row)
+        return rows
+
+
+class CountVectorsFeaturizer(Featurizer):
+    """Counts of the n-grams in a learned vocabulary"""
+
+    def __init__(self, meta: Dict[Text, Any]) -> None:
+        super().__init__(meta)
+        self.analyzer = ANALYZERS[meta['analyzer']]
+        self.min_n = int(meta['min_ngram'])
+        self.max_n = int(meta['max_ngram'])
+        self.lowercase = bool(meta['lowercase'])
+        self.oov_token = meta.get('oov_token')
+        self.vocabulary: Dict[Text, int] = meta['vocabulary']
+
+    def _prepare(self, tokens: Sequence[Text]) -> List[Text]:
+        if self.oov_token:
+            # Rasa replaces the tokens that are not in the vocabulary
+            tokens = [token if token.lower() in self.vocabulary or token in self.vocabulary
+                      else self.oov_token for token in tokens]
+        return [token.lower() for token in tokens] if self.lowercase else list(tokens)
+
+    def _row(self, text: Text) -> SparseRow:
+        row: SparseRow = {}
+        for ngram in self.analyzer(text, self.min_n, self.max_n):
+            column = self.vocabulary.get(ngram)
+            if column is not None:
+                row[column] = row.get(column, 0.0) + 1.0
+        return row
+
+    def sequence(self, tokens: Sequence[Text]) -> List[SparseRow]:
+        return [self._row(token) for token in self._prepare(tokens)]
+
+    def sentence(self, tokens: Sequence[Text], rows: List[SparseRow]) -> SparseRow:
+        return self._row(' '.join(self._prepare(tokens)))
+
+
+class HashingFeaturizer(Featurizer):
+    """N-grams hashed into a fixed number of columns (``addons.hashing_featurizer``)"""
+
+    def __init__(self, meta: Dict[Text, Any]) -> None:
+        super().__init__(meta)
+        self.analyzer = ANALYZERS[meta['analyzer']]
+        self.min_n = int(meta['min_ngram'])
+        self.max_n = int(meta['max_ngram'])
+        self.lowercase = bool(meta['lowercase'])
+        self.alternate_sign = bool(meta['alternate_sign'])
+        self._cache: Dict[Text, Tuple[int, float]] = {}
+
+    def _column(self, ngram: Text) -> Tuple[int, float]:
+        try:
+            return self._cache[ngram]
+        except KeyError:
+            pass
+        h = murmurhash3_32(ngram.encode('utf-8'))
+        column = (2147483647 - (self.size - 1)) % self.size if h == -2147483648 else abs(h) % self.size
+        sign = -1.0 if self.alternate_sign and h < 0 else 1.0
+        if len(self._cache) < 100000:
+            self._cache[ngram] = (column, sign)
+        return column, sign
+
+    def sequence(self, tokens: Sequence[Text]) -> List[SparseRow]:
+        rows = []
+        for token in tokens:
+            row: SparseRow = {}
+            for ngram in self.analyzer(token.lower() if self.lowercase else token,
+                                       self.min_n, self.max_n):
+                column, sign = self._column(ngram)
+                row[column] = row.get(column, 0.0) + sign
+            rows.append(row)
+        return rows
+
+
+FEATURIZERS = {
+    'lexical_syntactic': LexicalSyntacticFeaturizer,
+    'count_vectors': CountVectorsFeaturizer,
+    'hashing': HashingFeaturizer,
+}
+
+
+def _erf(x: np.ndarray) -> np.ndarray:
+    # Abramowitz and Stegun 7.1.26; the error (below 1.5e-7) is under float32 precision
+    sign = np.sign(x)
+    x = np.abs(x)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027
+                                                                        + t * 1.061405429))))
+    return sign * (1.0 - poly * np.exp(-x * x))
+
+
+ACTIVATIONS = {
+    None: lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'gelu': lambda x: 0.5 * x * (1.0 + _erf(x / math.sqrt(2.0))),
+    'gelu_tanh': lambda x: 0.5 * x * (1.0 + np.tanh(
+        math.sqrt(2.0 / math.pi) * (x + 0.044715 * x ** 3)
+    )),
+}
+
+
+def _layer_norm(x: np.ndarray, gamma: np.ndarray, beta: np.ndarray, epsilon: float) -> np.ndarray:
+    mean = x.mean(axis=-1, keepdims=True)
+    variance = ((x - mean) ** 2).mean(axis=-1, keepdims=True)
+    return (x - mean) / np.sqrt(variance + epsilon) * gamma + beta
+
+
+def _softmax(x: np.ndarray) -> np.ndarray:
+    exponent = np.exp(x - x.max(axis=-1, keepdims=True))
+    return exponent / exponent.sum(axis=-1, keepdims=True)
+
+
+def positional_encoding(length: int, units: int) -> np.ndarray:
+    """Sine on even and cosine on odd dimensions, as Rasa's transformer adds it"""
+    angles = 1 / np.power(10000, (2 * (np.arange(units)[np.newaxis, :] // 2)) / np.float32(units))
+    angle_rads = np.arange(length, dtype=np.float32)[:, np.newaxis] * angles
+    encoding = np.zeros((length, units), dtype=np.float32)
+    encoding[:, 0::2] = np.sin(angle_rads[:, 0::2])
+    encoding[:, 1::2] = np.cos(angle_rads[:, 1::2])
+    return encoding
+
+
+class NumpyIntentClassifier:
+    """DIET intent classification on an exported array file"""
+
+    def __init__(self, arrays: Dict[Text, np.ndarray], meta: Dict[Text, Any]) -> None:
+        self.arrays = arrays
+        self.meta = meta
+        self.featurizers = [FEATURIZERS[entry['type']](entry) for entry in meta['featurizers']]
+        diet = meta['diet']
+        self.layers: Dict[Text, Dict[Text, Any]] = diet['layers']
+        self.ffnn: List[Text] = diet['ffnn']
+        self.transformer: Optional[Dict[Text, Any]] = diet['transformer']
+        self.similarity = diet['similarity']
+        self.model_confidence = diet['model_confidence']
+        self.ranking_length = int(diet['ranking_length'])
+        self.renormalize = bool(diet['renormalize'])
+        self.labels: List[Text] = meta['labels']
+        self.fallback: Optional[Dict[Text, float]] = meta.get('fallback')
+        self.label_embeddings = arrays['label_embeddings']
+        if self.similarity == 'cosine':
+            self.label_embeddings = self.label_embeddings / np.linalg.norm(
+                self.label_embeddings, axis=-1, keepdims=True
+            )
+        self._positions = np.zeros((0, 0), dtype=np.float32)
+
+    @classmethod
+    def load(cls, path: Text) -> 'NumpyIntentClassifier':
+        arrays, meta = read_arrays(path)
+        return cls(arrays, meta)
+
+    def features(self, tokens: Sequence[Text]) -> Tuple[List[SparseRow], SparseRow]:
+        """Sparse sequence rows and sentence row of all featurizers, columns concatenated"""
+        sequence: List[SparseRow] = [{} for _ in tokens]
+        sentence: SparseRow = {}
+        sequence_offset = sentence_offset = 0
+        for featurizer in self.featurizers:
+            rows = featurizer.sequence(tokens)
+            for combined, row in zip(sequence, rows):
+                combined.update((sequence_offset + column, value) for column, value in row.items())
+            sequence_offset += featurizer.size
+            if featurizer.has_sentence:
+                sentence.update(
+                    (sentence_offset + column, value)
+                    for column, value in featurizer.sentence(tokens, rows).items()
+                )
+                sentence_offset += featurizer.size
+        return sequence, sentence
+
+    def _dense(self, name: Text, x: np.ndarray) -> np.ndarray:
+        layer = self.layers[name]
+        x = x @ self.arrays[f'{name}.kernel']
+        if layer['bias']:
+            x = x + self.arrays[f'{name}.bias']
+        return ACTIVATIONS[layer['activation']](x).astype(np.float32)
+
+    def _sparse_dense(self, name: Text, rows: Sequence[SparseRow]) -> np.ndarray:
+        """A dense layer on sparse input, reading only the kernel rows of set columns"""
+        kernel = self.arrays[f'{name}.kernel']
+        out = np.zeros((len(rows), kernel.shape[1]), dtype=np.float32)
+        for index, row in enumerate(rows):
+            if row:
+                columns = np.fromiter(row.keys(), dtype=np.int64, count=len(row))
+                values = np.fromiter(row.values(), dtype=np.float32, count=len(row))
+                out[index] = values @ kernel[columns]
+        if self.layers[name]['bias']:
+            out += self.arrays[f'{name}.bias']
+        return out
+
+    def _norm(self, name: Text, x: np.ndarray) -> np.ndarray:
+        return _layer_norm(x, self.arrays[f'{name}.gamma'], self.arrays[f'{name}.beta'],
+                           self.layers[name]['epsilon']).astype(np.float32)
+
+    def _encode(self, x: np.ndarray) -> np.ndarray:
+        transformer = self.transformer
+        units = transformer['units']
+        heads = transformer['heads']
+        depth = units // heads
+        x = self._dense('transformer.embedding', x) * np.float32(math.sqrt(units))
+        if len(self._positions) < len(x):
+            self._positions = positional_encoding(max(len(x), 64), units)
+        x = x + self._positions[:len(x)]
+        for index in range(transformer['layers']):
+            prefix = f'transformer.{index}'
+            normed = self._norm(f'{prefix}.norm', x)
+            query, key, value = (
+                self._dense(f'{prefix}.{part}', normed).reshape(len(x), heads, depth).transpose(1, 0, 2)
+                for part in ('query', 'key', 'value')
+            )
+            weights = _softmax(query @ key.transpose(0, 2, 1) / np.float32(math.sqrt(depth)))
+            attention = (weights @ value).transpose(1, 0, 2).reshape(len(x), units)
+            x = x + self._dense(f'{prefix}.output', attention)
+            feed_forward = x
+            for step in transformer['feed_forward']:
+                name = f'{prefix}.{step}'
+                if self.layers[name]['type'] == 'norm':
+                    feed_forward = self._norm(name, feed_forward)
+                else:
+                    feed_forward = self._dense(name, feed_forward)
+            x = x + feed_forward
+        return ACTIVATIONS['gelu'](self._norm('transformer.norm', x)).astype(np.float32)
+
+    def confidences(self, text: Text) -> np.ndarray:
+        """Confidence of every label in :attr:`labels` for `text`"""
+        tokens = tokenize(text)
+        sequence_rows, sentence_row = self.features(tokens)
+        sequence = self._sparse_dense('sequence', sequence_rows)
+        sentence = self._sparse_dense('sentence', [sentence_row])
+        if 'unify.sequence' in self.layers:
+            sequence = self._dense('unify.sequence', sequence)
+            sentence = self._dense('unify.sentence', sentence)
+        x = np.concatenate([sequence, sentence])
+        for name in self.ffnn:
+            x = self._dense(name, x)
+        if self.transformer is not None:
+            x = self._encode(x)
+        embedded = self._dense('embed', x[-1])
+        if self.similarity == 'cosine':
+            embedded = embedded / np.linalg.norm(embedded)
+        similarities = self.label_embeddings @ embedded
+        if self.model_confidence == 'softmax':
+            return _softmax(similarities)
+        return similarities
+
+    def parse(self, text: Text, message_id: Optional[Text] = None) -> Dict[Text, Any]:
+        """Parse result in the shape of Rasa's ``/model/parse``"""
+        confidences = self.confidences(text)
+        ranked = np.argsort(confidences)[::-1]
+        if self.ranking_length:
+            ranked = ranked[:self.ranking_length]
+            if self.renormalize:
+                kept = np.zeros_like(confidences)
+                kept[ranked] = confidences[ranked]
+                confidences = kept / kept.sum()
+        ranking = [{'name': self.labels[index], 'confidence': float(confidences[index])}
+                   for index in ranked]
+        intent = dict(ranking[0])
+        if self.fallback and self._should_fallback(ranking):
+            intent = {'name': NLU_FALLBACK, 'confidence': self.fallback['threshold']}
+            ranking.insert(0, dict(intent))
+        result = {'text': text, 'intent': intent, 'entities': [], 'intent_ranking': ranking}
+        if message_id is not None:
+            result['message_id'] = message_id
+        return result
+
+    def _should_fallback(self, ranking: List[Dict[Text, Any]]) -> bool:
+        if ranking[0]['confidence'] < self.fallback['threshold']:
+            return True
+        return (len(ranking) >= 2 and ranking[0]['confidence'] - ranking[1]['confidence']
+                < self.fallback['ambiguity_threshold'])
+
+
+class _ParseHandler(BaseHTTPRequestHandler):
+    classifier: NumpyIntentClassifier
+
+    def _reply(self, status: int, body: Any) -> None:
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self) -> None:
+        if self.path.split('?')[0] in ('/', '/status'):
+            self._reply(200, {'model': self.classifier.meta.get('source_model'),
+                              'labels': len(self.classifier.labels)})
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def do_POST(self) -> None:
+        if self.path.split('?')[0] != '/model/parse':
+            self._reply(404, {'error': 'not found'})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+            text = request['text']
+        except (ValueError, KeyError, TypeError):
+            self._reply(400, {'error': "expected a JSON body with 'text'"})
+            return
+        self._reply(200, self.classifier.parse(text, request.get('message_id')))
+
+    def log_message(self, format: Text, *args: Any) -> None:
+        logger.debug(format % args)
+
+
+def serve(classifier: NumpyIntentClassifier, host: Text = '0.0.0.0', port: int = 5002) -> None:
+    """Answer ``POST /model/parse`` with `classifier` until interrupted"""
+    handler = type('ParseHandler', (_ParseHandler,), {'classifier': classifier})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    logger.info(f"Serving NumPy NLU on http://{host}:{port}/model/parse")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv: Optional[Sequence[Text]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    parse_command = commands.add_parser('parse', help='print the parse result of each text')
+    parse_command.add_argument('model', help='file written by addons.numpy_export')
+    parse_command.add_argument('texts', nargs='+')
+    serve_command = commands.add_parser('serve', help='answer POST /model/parse over HTTP')
+    serve_command.add_argument('model', help='file written by addons.numpy_export')
+    serve_command.add_argument('--host', default='0.0.0.0')
+    serve_command.add_argument('--port', type=int, default=5002)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    classifier = NumpyIntentClassifier.load(args.model)
+    if args.command == 'parse':
+        for text in args.texts:
+            print(json.dumps(classifier.parse(text)))
+        return 0
+    serve(classifier, args.host, args.port)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,388 @@
+"""Known-utterance and recent-parse cache in front of the NLU pipeline
+
+``ParseCache`` goes first in the pipeline. It answers a message from
+
+* an exact-match table of the training examples, built at training time and
+  stored with the model, or
+* a bounded LRU of recent parse results, keyed by model fingerprint and
+  normalized text (lowercased, whitespace collapsed).
+
+Messages it answers are marked, and the ``Cached*`` variants of the stock
+components below skip marked messages, so a hit never reaches the
+featurizers or DIET. ``ParseCacheRecorder`` goes last and stores the result of
+every miss. The LRU is keyed by the fingerprint of the loaded model and
+entries for any other model are dropped when a model loads, so a new model
+never serves an old model's answers.
+
+``VASPX_PARSE_CACHE`` switches the cache at runtime, without retraining:
+``on`` (default), ``recent`` (recent parses only, no exact-match table) or
+``off`` (every message goes through the pipeline). Evaluations and NLU
+benchmarks set it to ``off``, since every training example is an exact-match
+hit answered with confidence 1.0. Answered messages carry
+``parse_cache_hit`` (``exact`` or ``recent``) in their parse result.
+
+    pipeline:
+      - name: addons.parse_cache.ParseCache
+        max_size: 10000
+        ttl: 3600
+      - name: addons.parse_cache.CachedWhitespaceTokenizer
+      ...
+      - name: addons.parse_cache.ParseCacheRecorder
+"""
+import copy
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Text, Tuple
+
+from rasa.engine.graph import ExecutionContext, GraphComponent
+from rasa.engine.recipes.default_recipe import DefaultV1Recipe
+from rasa.engine.storage.resource import Resource
+from rasa.engine.storage.storage import ModelStorage
+from rasa.nlu.classifiers.fallback_classifier import FallbackClassifier
+from rasa.nlu.extractors.entity_synonyms import EntitySynonymMapper
+from rasa.nlu.featurizers.sparse_featurizer.count_vectors_featurizer import CountVectorsFeaturizer
+from rasa.nlu.featurizers.sparse_featurizer.lexical_syntactic_featurizer import (
+    LexicalSyntacticFeaturizer,
+)
+from rasa.nlu.featurizers.sparse_featurizer.regex_featurizer import RegexFeaturizer
+from rasa.nlu.tokenizers.whitespace_tokenizer import WhitespaceTokenizer
+from rasa.shared.nlu.constants import (
+    ENTITIES, INTENT, INTENT_NAME_KEY, INTENT_RANKING_KEY, PREDICTED_CONFIDENCE_KEY, TEXT,
+)
+from rasa.shared.nlu.training_data.message import Message
+from rasa.shared.nlu.training_data.training_data import TrainingData
+
+from .batching import BatchedDIETClassifier
+from .hashing_featurizer import HashingFeaturizer
+
+logger = logging.getLogger(__name__)
+
+# Message property set on messages the cache answered
+PARSE_CACHE_HIT = 'parse_cache_hit'
+
+EXACT_MATCH_FILE = 'exact_match.json'
+
+_WHITESPACE = re.compile(r'\s+')
+
+CACHE_ON = 'on'
+CACHE_RECENT = 'recent'
+CACHE_OFF = 'off'
+
+
+def parse_cache_mode() -> Text:
+    """``VASPX_PARSE_CACHE`` as one of on, recent or off, read when a model loads"""
+    mode = os.environ.get('VASPX_PARSE_CACHE', CACHE_ON).strip().lower()
+    if mode in ('0', 'off', 'false', 'no'):
+        return CACHE_OFF
+    if mode == CACHE_RECENT:
+        return CACHE_RECENT
+    return CACHE_ON
+
+
+def normalize(text: Text) -> Text:
+    return _WHITESPACE.sub(' ', text.strip().lower())
+
+
+# Intent, intent ranking and entities of one parsed message
+ParseResult = Dict[Text, Any]
+
+
+class ParseResultCache:
+    """Bounded LRU of parse results with TTL and hit-rate counters"""
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Text, Tuple[float, Text, ParseResult]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Text, text: Text) -> Optional[ParseResult]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, source_text, result = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return None
+            # Entity offsets only hold for the exact text they were found in
+            if result[ENTITIES] and source_text != text:
+                return None
+            self._entries.move_to_end(key)
+            return result
+
+    def put(self, key: Text, text: Text, result: ParseResult) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, text, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def record(self, hit: bool, exact: bool = False) -> None:
+        with self._lock:
+            if not hit:
+                self.misses += 1
+            elif exact:
+                self.exact_hits += 1
+            else:
+                self.hits += 1
+
+    def stats(self) -> Dict[Text, Any]:
+        with self._lock:
+            lookups = self.hits + self.exact_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'exact_hits': self.exact_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.exact_hits) / lookups if lookups else 0.0,
+            }
+
+
+# One cache per loaded model fingerprint, shared by ParseCache and the recorder
+_caches: Dict[Text, ParseResultCache] = {}
+_caches_lock = threading.Lock()
+
+
+def cache_for(fingerprint: Text, max_size: int = 10000, ttl: float = 3600) -> ParseResultCache:
+    with _caches_lock:
+        cache = _caches.get(fingerprint)
+        if cache is None:
+            cache = _caches[fingerprint] = ParseResultCache(max_size, ttl)
+        return cache
+
+
+def invalidate_other_models(fingerprint: Text) -> None:
+    """Drop the caches of every model except the one with `fingerprint`"""
+    with _caches_lock:
+        for stale in [key for key in _caches if key != fingerprint]:
+            del _caches[stale]
+
+
+def _fingerprint(resource: Resource, execution_context: ExecutionContext) -> Text:
+    return execution_context.model_id or resource.name
+
+
+@DefaultV1Recipe.register(
+    [DefaultV1Recipe.ComponentType.INTENT_CLASSIFIER], is_trainable=True
+)
+class ParseCache(GraphComponent):
+    """Answers known and recently seen messages before the rest of the pipeline runs"""
+
+    @staticmethod
+    def get_default_config() -> Dict[Text, Any]:
+        return {
+            # Most recent parse results kept per model
+            'max_size': 10000,
+            # Seconds a recent parse result stays valid
+            'ttl': 3600,
+            # Answer exact (normalized) training examples with their label
+            'exact_match': True,
+            # Log hit-rate statistics every this many messages (0 disables)
+            'stats_interval': 1000,
+        }
+
+    def __init__(self, config: Dict[Text, Any], model_storage: ModelStorage,
+                 resource: Resource, execution_context: ExecutionContext,
+                 exact: Optional[Dict[Text, Text]] = None) -> None:
+        self._config = {**self.get_default_config(), **config}
+        self._model_storage = model_storage
+        self._resource = resource
+        self._exact = exact or {}
+        self._fingerprint = _fingerprint(resource, execution_context)
+        self._cache = cache_for(self._fingerprint, self._config['max_size'], self._config['ttl'])
+        self._cache.max_size = self._config['max_size']
+        self._cache.ttl = self._config['ttl']
+        self._seen = 0
+        self._mode = parse_cache_mode()
+        if self._mode != CACHE_ON:
+            logger.info(f"Parse cache is '{self._mode}' (VASPX_PARSE_CACHE).")
+
+    @classmethod
+    def create(cls, config: Dict[Text, Any], model_storage: ModelStorage,
+               resource: Resource, execution_context: ExecutionContext) -> 'ParseCache':
+        return cls(config, model_storage, resource, execution_context)
+
+    @classmethod
+    def load(cls, config: Dict[Text, Any], model_storage: ModelStorage,
+             resource: Resource, execution_context: ExecutionContext,
+             **kwargs: Any) -> 'ParseCache':
+        exact: Dict[Text, Text] = {}
+        try:
+            with model_storage.read_from(resource) as directory:
+                exact = json.loads((directory / EXACT_MATCH_FILE).read_text(encoding='utf-8'))
+        except (ValueError, FileNotFoundError):
+            logger.debug(f"No exact-match table stored for '{resource.name}'.")
+        component = cls(config, model_storage, resource, execution_context, exact)
+        invalidate_other_models(component._fingerprint)
+        return component
+
+    def train(self, training_data: TrainingData) -> Resource:
+        """Build the exact-match table from examples with one unambiguous label"""
+        table: Dict[Text, Text] = {}
+        ambiguous = set()
+        for example in training_data.intent_examples:
+            # Annotated examples would need their entity offsets remapped
+            if example.get(ENTITIES):
+                continue
+            key = normalize(example.get(TEXT))
+            intent = example.get(INTENT)
+            if table.get(key, intent) != intent:
+                ambiguous.add(key)
+            table[key] = intent
+        for key in ambiguous:
+            del table[key]
+
+        with self._model_storage.write_to(self._resource) as directory:
+            (directory / EXACT_MATCH_FILE).write_text(json.dumps(table), encoding='utf-8')
+        return self._resource
+
+    def process_training_data(self, training_data: TrainingData) -> TrainingData:
+        return training_data
+
+    def process(self, messages: List[Message]) -> List[Message]:
+        if self._mode == CACHE_OFF:
+            return messages
+        use_exact = self._config['exact_match'] and self._mode == CACHE_ON
+        for message in messages:
+            text = message.get(TEXT)
+            if not text:
+                continue
+            key = normalize(text)
+            result = self._cache.get(key, text)
+            exact = False
+            if result is None and use_exact and key in self._exact:
+                result = _exact_result(self._exact[key])
+                exact = True
+            self._cache.record(result is not None, exact)
+            if result is not None:
+                # Later components and the tracker may change what they are given
+                for name, value in copy.deepcopy(result).items():
+                    message.set(name, value, add_to_output=True)
+                message.set(PARSE_CACHE_HIT, 'exact' if exact else 'recent', add_to_output=True)
+            self._log_stats()
+        return messages
+
+    def _log_stats(self) -> None:
+        interval = self._config['stats_interval']
+        self._seen += 1
+        if interval and self._seen % interval == 0:
+            logger.info(f"Parse cache for model '{self._fingerprint}': {self._cache.stats()}")
+
+
+def _exact_result(intent: Text) -> ParseResult:
+    return {
+        INTENT: {INTENT_NAME_KEY: intent, PREDICTED_CONFIDENCE_KEY: 1.0},
+        INTENT_RANKING_KEY: [{INTENT_NAME_KEY: intent, PREDICTED_CONFIDENCE_KEY: 1.0}],
+        ENTITIES: [],
+    }
+
+
+@DefaultV1Recipe.register(
+    [DefaultV1Recipe.ComponentType.INTENT_CLASSIFIER], is_trainable=False
+)
+class ParseCacheRecorder(GraphComponent):
+    """Stores the parse result of every message the cache did not answer"""
+
+    @classmethod
+    def create(cls, config: Dict[Text, Any], model_storage: ModelStorage,
+               resource: Resource, execution_context: ExecutionContext) -> 'ParseCacheRecorder':
+        return cls(_fingerprint(resource, execution_context))
+
+    def __init__(self, fingerprint: Text) -> None:
+        self._fingerprint = fingerprint
+        self._enabled = parse_cache_mode() != CACHE_OFF
+
+    def process(self, messages: List[Message]) -> List[Message]:
+        if not self._enabled:
+            return messages
+        cache = cache_for(self._fingerprint)
+        for message in messages:
+            text = message.get(TEXT)
+            if not text or message.get(PARSE_CACHE_HIT):
+                continue
+            cache.put(normalize(text), text, copy.deepcopy({
+                INTENT: message.get(INTENT),
+                INTENT_RANKING_KEY: message.get(INTENT_RANKING_KEY) or [],
+                ENTITIES: message.get(ENTITIES) or [],
+            }))
+        return messages
+
+
+class SkipCachedMixin:
+    """Runs the wrapped component only on messages the parse cache did not answer"""
+
+    def process(self, messages: List[Message]) -> List[Message]:
+        misses = [message for message in messages if not message.get(PARSE_CACHE_HIT)]
+        if misses:
+            super().process(misses)  # type: ignore[misc]
+        return messages
+
+
+@DefaultV1Recipe.register(
+    [DefaultV1Recipe.ComponentType.MESSAGE_TOKENIZER], is_trainable=False
+)
+class CachedWhitespaceTokenizer(SkipCachedMixin, WhitespaceTokenizer):
+    """WhitespaceTokenizer that skips messages answered by the parse cache"""
+
+
+@DefaultV1Recipe.register(
+    [DefaultV1Recipe.ComponentType.MESSAGE_FEATURIZER], is_trainable=True
+)
+class CachedRegexFeaturizer(SkipCachedMixin, RegexFeaturizer):
+    """RegexFeaturizer that skips messages answered by the parse cache"""
+
+
+@DefaultV1Recipe.register(
+    [DefaultV1Recipe.ComponentType.MESSAGE_FEATURIZER], is_trainable=True
+)
+class CachedLexicalSyntacticFeaturizer(SkipCachedMixin, LexicalSyntacticFeaturizer):
+    """LexicalSyntacticFeaturizer that skips messages answered by the parse cache"""
+
+
+@DefaultV1Recipe.register(
+    [DefaultV1Recipe.ComponentType.MESSAGE_FEATURIZER], is_trainable=True
+)
+class CachedCountVectorsFeaturizer(SkipCachedMixin, CountVectorsFeaturizer):
+    """CountVectorsFeaturizer that skips messages answered by the parse cache"""
+
+
+@DefaultV1Recipe.register(
+    [DefaultV1Recipe.ComponentType.MESSAGE_FEATURIZER], is_trainable=False
+)
+class CachedHashingFeaturizer(SkipCachedMixin, HashingFeaturizer):
+    """HashingFeaturizer that skips messages answered by the parse cache"""
+
+
+@DefaultV1Recipe.register(
+    [
+        DefaultV1Recipe.ComponentType.INTENT_CLASSIFIER,
+        DefaultV1Recipe.ComponentType.ENTITY_EXTRACTOR,
+    ],
+    is_trainable=True,
+)
+class CachedDIETClassifier(SkipCachedMixin, BatchedDIETClassifier):
+    """Batched DIETClassifier that skips messages answered by the parse cache"""
+
+
+@DefaultV1Recipe.register(
+    [DefaultV1Recipe.ComponentType.ENTITY_EXTRACTOR], is_trainable=True
+)
+class CachedEntitySynonymMapper(SkipCachedMixin, EntitySynonymMapper):
+    """EntitySynonymMapper that skips messages answered by the parse cache"""
+
+
+@DefaultV1Recipe.register(
+    [DefaultV1Recipe.ComponentType.INTENT_CLASSIFIER], is_trainable=False
+)
+class CachedFallbackClassifier(SkipCachedMixin, FallbackClassifier):
+    """FallbackClassifier that skips messages answered by the parse cache"""
@@ -0,0 +1,269 @@
+"""Opt-in per-component trace spans written as Chrome trace files
+
+With ``VASPX_TRACE_DIR`` set, a sample of the messages the Rasa server
+handles (``VASPX_TRACE_SAMPLE``, a fraction, default 0.1) is traced. Each
+traced message gets
+
+* a ``handle_message`` span for the whole turn, tagged with the sender, the
+  predicted intent and the actions run, custom actions listed separately,
+* ``parse_message`` and ``predict_next_action`` spans for NLU and each
+  policy prediction,
+* a span per graph node run inside those: every pipeline component and
+  policy from config.yml (plus Rasa's own helper nodes), with the size of
+  its input and output (messages, features, events or probabilities), and
+* an ``action`` span per action, which for custom actions covers the call to
+  the action server.
+
+Spans are appended to ``trace-<UTC time>-<pid>-<n>.json`` files in the
+directory, in the Chrome trace event format; a new file starts after
+``VASPX_TRACE_MAX_BYTES`` (default 64 MiB). Open them in
+``chrome://tracing`` or https://ui.perfetto.dev, where every message is its
+own row:
+
+    VASPX_TRACE_DIR=traces VASPX_TRACE_SAMPLE=0.05 python -m addons.warm_start run --enable-api
+
+The server entry point ``addons.warm_start`` installs the tracing hooks
+when ``VASPX_TRACE_DIR`` is set; anything else can call ``install()``.
+A micro-batched graph run (see ``batching.py``) happens on a worker thread
+in the context of the message that opened the batch, so its node spans land
+in that message's trace, if it is traced, and the other messages of the
+batch only show the time as their ``parse_message`` span.
+"""
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Text
+
+from rasa.core.actions.action import RemoteAction
+from rasa.core.processor import MessageProcessor
+from rasa.engine.graph import GraphNode
+
+logger = logging.getLogger(__name__)
+
+TRACE_DIR = os.environ.get('VASPX_TRACE_DIR', '')
+TRACE_SAMPLE = float(os.environ.get('VASPX_TRACE_SAMPLE', 0.1))
+TRACE_MAX_BYTES = int(os.environ.get('VASPX_TRACE_MAX_BYTES', 64 * 1024 * 1024))
+
+FILE_PREFIX = 'trace-'
+FILE_SUFFIX = '.json'
+
+# Trace timestamps are microseconds on the wall clock, measured with the
+# monotonic performance counter
+_EPOCH_US = time.time() * 1e6 - time.perf_counter() * 1e6
+
+
+def _now_us() -> float:
+    return _EPOCH_US + time.perf_counter() * 1e6
+
+
+def _size(value: Any) -> Optional[int]:
+    """Rough size of a node's input or output, for the span arguments"""
+    if isinstance(value, (list, tuple, dict, set)):
+        return len(value)
+    for attribute in ('features', 'events', 'probabilities'):
+        inner = getattr(value, attribute, None)
+        if hasattr(inner, '__len__'):
+            return len(inner)
+    return None
+
+
+class Trace:
+    """Spans of one traced message, kept until the message is handled"""
+
+    __slots__ = ('trace_id', 'events', 'tags')
+
+    def __init__(self, trace_id: int) -> None:
+        self.trace_id = trace_id
+        self.events: List[Dict[Text, Any]] = []
+        self.tags: Dict[Text, Any] = {'actions': [], 'custom_actions': []}
+
+    def add(self, name: Text, category: Text, started_us: float, ended_us: float,
+            args: Optional[Dict[Text, Any]] = None) -> None:
+        self.events.append({
+            'name': name, 'cat': category, 'ph': 'X',
+            'ts': round(started_us, 3), 'dur': round(ended_us - started_us, 3),
+            'pid': os.getpid(), 'tid': self.trace_id,
+            'args': {key: value for key, value in (args or {}).items() if value is not None},
+        })
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar('vaspx_trace', default=None)
+
+
+@contextmanager
+def span(name: Text, category: Text, **args: Any) -> Iterator[Dict[Text, Any]]:
+    """Record a span in the current message's trace; does nothing outside one
+
+    The yielded dictionary is added to the span's arguments when it ends.
+    """
+    trace = _current.get()
+    if trace is None:
+        yield args
+        return
+    started = _now_us()
+    try:
+        yield args
+    except BaseException as error:
+        args['error'] = type(error).__name__
+        raise
+    finally:
+        trace.add(name, category, started, _now_us(), args)
+
+
+class TraceWriter:
+    """Appends finished traces to size-rotated Chrome trace files"""
+
+    def __init__(self, directory: Text, max_bytes: int = TRACE_MAX_BYTES) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._file = None
+        self._sequence = 0
+        self._next_trace_id = 0
+        self.written = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def next_trace_id(self) -> int:
+        with self._lock:
+            self._next_trace_id += 1
+            return self._next_trace_id
+
+    def _open(self) -> None:
+        self._sequence += 1
+        stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime())
+        name = f'{FILE_PREFIX}{stamp}-{os.getpid()}-{self._sequence:04d}{FILE_SUFFIX}'
+        self._file = open(os.path.join(self.directory, name), 'w', encoding='utf-8')
+        # The JSON array format, whose closing bracket trace viewers do not
+        # require, so the file can be opened while it is still being written
+        self._file.write('[\n')
+
+    def write(self, trace: Trace) -> None:
+        lines = ''.join(
+            json.dumps(event, separators=(',', ':'), default=str) + ',\n'
+            for event in trace.events
+        )
+        with self._lock:
+            if self._file is None:
+                self._open()
+            self._file.write(lines)
+            self._file.flush()
+            self.written += 1
+            if self._file.tell() >= self.max_bytes:
+                self._file.close()
+                self._file = None
+
+
+_writer: Optional[TraceWriter] = None
+
+
+def _node_call(original: Callable) -> Callable:
+    @functools.wraps(original)
+    def traced(self: GraphNode, *inputs: Any) -> Any:
+        if _current.get() is None:
+            return original(self, *inputs)
+        component = getattr(self, '_component_class', None)
+        # Inputs arrive as (node name, value) pairs from the parent nodes
+        input_sizes = [_size(item[1]) for item in inputs if isinstance(item, tuple)]
+        with span(getattr(component, '__name__', None) or 'node', 'component',
+                  node=getattr(self, '_node_name', None),
+                  input_size=sum(size for size in input_sizes if size is not None)) as args:
+            result = original(self, *inputs)
+            args['output_size'] = _size(result[1]) if isinstance(result, tuple) else None
+            return result
+
+    return traced
+
+
+def _processor_step(original: Callable, name: Text, category: Text) -> Callable:
+    """Wrap a MessageProcessor method, sync or async, in a span"""
+    if inspect.iscoroutinefunction(original):
+        @functools.wraps(original)
+        async def traced_async(self: MessageProcessor, *args: Any, **kwargs: Any) -> Any:
+            with span(name, category):
+                return await original(self, *args, **kwargs)
+
+        return traced_async
+
+    @functools.wraps(original)
+    def traced(self: MessageProcessor, *args: Any, **kwargs: Any) -> Any:
+        with span(name, category):
+            return original(self, *args, **kwargs)
+
+    return traced
+
+
+def _run_action(original: Callable) -> Callable:
+    @functools.wraps(original)
+    async def traced(self: MessageProcessor, action: Any, *args: Any, **kwargs: Any) -> Any:
+        trace = _current.get()
+        if trace is None:
+            return await original(self, action, *args, **kwargs)
+        name = action.name()
+        remote = isinstance(action, RemoteAction)
+        trace.tags['actions'].append(name)
+        if remote:
+            trace.tags['custom_actions'].append(name)
+        with span(name, 'action', custom=remote or None):
+            return await original(self, action, *args, **kwargs)
+
+    return traced
+
+
+def _handle_message(original: Callable) -> Callable:
+    @functools.wraps(original)
+    async def traced(self: MessageProcessor, message: Any) -> Any:
+        if _writer is None or _current.get() is not None or random.random() >= TRACE_SAMPLE:
+            return await original(self, message)
+        trace = Trace(_writer.next_trace_id())
+        token = _current.set(trace)
+        started = _now_us()
+        try:
+            return await original(self, message)
+        finally:
+            _current.reset(token)
+            intent = None
+            try:
+                tracker = await self.tracker_store.retrieve(message.sender_id)
+                intent = tracker.latest_message.intent.get('name') if tracker else None
+            except Exception:
+                logger.debug('Could not read the traced turn back from the tracker store.')
+            trace.add('handle_message', 'turn', started, _now_us(), {
+                'sender_id': message.sender_id,
+                'channel': message.input_channel,
+                'intent': intent,
+                'actions': trace.tags['actions'],
+                'custom_actions': trace.tags['custom_actions'],
+            })
+            _writer.write(trace)
+
+    return traced
+
+
+def install(directory: Text = TRACE_DIR) -> None:
+    """Trace a sample of the messages handled by this process into `directory`"""
+    global _writer
+    if _writer is not None:
+        return
+    _writer = TraceWriter(directory)
+    GraphNode.__call__ = _node_call(GraphNode.__call__)
+    MessageProcessor.handle_message = _handle_message(MessageProcessor.handle_message)
+    MessageProcessor.parse_message = _processor_step(
+        MessageProcessor.parse_message, 'parse_message', 'nlu'
+    )
+    MessageProcessor._predict_next_with_tracker = _processor_step(
+        MessageProcessor._predict_next_with_tracker, 'predict_next_action', 'policy'
+    )
+    MessageProcessor._run_action = _run_action(MessageProcessor._run_action)
+    logger.info(f"Tracing {TRACE_SAMPLE:.0%} of messages into '{directory}'.")
+
+
+def trace_stats() -> Dict[Text, Any]:
+    return {'enabled': _writer is not None, 'written': _writer.written if _writer else 0}
+
@@ -0,0 +1,312 @@
+"""Tracker store backed by a local SQLite database
+
+``LocalTrackerStore`` keeps conversations durable across restarts on a single
+node without an outside database:
+
+* trackers are stored in a SQLite file in WAL mode, one row per sender,
+* recently used trackers are served from an in-process LRU,
+* saves are queued and written by a background thread in batched
+  transactions (write-behind), so a turn never waits for the disk; repeated
+  saves of one conversation between flushes are written once,
+* stored trackers are compacted: events before the current session start are
+  dropped, and turns older than the last ``keep_turns`` user messages are
+  replaced by the slot values, active loop and paused state they left behind.
+  The policies only look ``max_history: 5`` turns back, so predictions do not
+  change, and memory and row size stay bounded however long a conversation
+  runs.
+
+Configure it in ``endpoints.yml``:
+
+    tracker_store:
+      type: addons.tracker_store.LocalTrackerStore
+      path: trackers.db
+
+A crash loses at most the saves of the last ``flush_interval`` seconds.
+Compacted events are gone from the store; stream them to an event broker to
+keep the full history.
+
+With several server workers (``SANIC_WORKERS`` above 1, see
+``addons/lock_store.py``) the next message of a conversation may reach
+another process, so the store is ``shared``: the LRU and the write-behind
+queue are skipped, every retrieve reads the file and every save is written
+before the conversation's lock is released. Reads and writes of the file run
+on the default executor, never on the event loop.
+"""
+import asyncio
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Text, TypeVar
+
+from rasa.core.brokers.broker import EventBroker
+from rasa.core.tracker_store import SerializedTrackerAsText, TrackerStore
+from rasa.shared.core.constants import ACTION_LISTEN_NAME, ACTION_SESSION_START_NAME
+from rasa.shared.core.domain import Domain
+from rasa.shared.core.events import (
+    ActionExecuted, ActiveLoop, ConversationPaused, Event, Restarted, SessionStarted, SlotSet,
+    UserUttered,
+)
+from rasa.shared.core.trackers import DialogueStateTracker
+
+logger = logging.getLogger(__name__)
+
+Result = TypeVar('Result')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS trackers (
+    sender_id TEXT PRIMARY KEY,
+    tracker TEXT NOT NULL,
+    updated_at REAL NOT NULL
+)
+'''
+
+
+def _is_session_header(event: Event) -> bool:
+    if isinstance(event, ActionExecuted):
+        return event.action_name == ACTION_SESSION_START_NAME
+    return isinstance(event, (SessionStarted, Restarted))
+
+
+def _session_start(events: List[Event]) -> int:
+    """Index where the current session (or conversation after a restart) begins"""
+    for index in range(len(events) - 1, -1, -1):
+        if isinstance(events[index], (SessionStarted, Restarted)):
+            if index and _is_session_header(events[index - 1]):
+                return index - 1
+            return index
+    return 0
+
+
+def compact_events(sender_id: Text, events: List[Event], domain: Domain,
+                   keep_turns: int) -> Optional[List[Event]]:
+    """`events` with everything before the last `keep_turns` user turns summarized
+
+    Returns None when there is nothing to compact.
+    """
+    start = _session_start(events)
+    users = [
+        index for index in range(start, len(events)) if isinstance(events[index], UserUttered)
+    ]
+    if start == 0 and len(users) <= keep_turns:
+        return None
+
+    header_end = start
+    while header_end < len(events) and _is_session_header(events[header_end]):
+        header_end += 1
+
+    if len(users) <= keep_turns:
+        return events[start:]
+
+    cut = users[-keep_turns]
+    previous = events[cut - 1]
+    if isinstance(previous, ActionExecuted) and previous.action_name == ACTION_LISTEN_NAME:
+        cut -= 1
+
+    # State the dropped turns left behind, replayed on a scratch tracker
+    before = DialogueStateTracker.from_events(sender_id, events[start:cut], slots=domain.slots)
+    timestamp = events[cut - 1].timestamp
+    summary: List[Event] = [
+        SlotSet(name, slot.value, timestamp=timestamp)
+        for name, slot in before.slots.items()
+        if slot.value != slot.initial_value
+    ]
+    if before.active_loop_name:
+        summary.append(ActiveLoop(before.active_loop_name, timestamp=timestamp))
+    if before.is_paused():
+        summary.append(ConversationPaused(timestamp=timestamp))
+    return events[start:header_end] + summary + events[cut:]
+
+
+class LocalTrackerStore(SerializedTrackerAsText, TrackerStore):
+    """Stores trackers in a local SQLite file with an LRU in front and write-behind saves"""
+
+    def __init__(self, domain: Optional[Domain] = None, path: Text = 'trackers.db',
+                 max_trackers: int = 10000, flush_interval: float = 0.2,
+                 batch_size: int = 500, keep_turns: int = 5, compact_after: int = 10,
+                 shared: Optional[bool] = None,
+                 event_broker: Optional[EventBroker] = None, **kwargs: Dict[Text, Any]) -> None:
+        super().__init__(domain, event_broker, **kwargs)
+        self.path = path
+        self.max_trackers = max_trackers
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.keep_turns = keep_turns
+        # Compact once a session holds this many user turns, not on every save
+        self.compact_after = max(compact_after, keep_turns)
+        if shared is None:
+            shared = int(os.environ.get('SANIC_WORKERS', 1)) > 1
+        self.shared = shared
+
+        self._cache: 'OrderedDict[Text, Text]' = OrderedDict()
+        self._pending: Dict[Text, Text] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self.compactions = 0
+
+        self._reader = self._connect()
+        with self._reader:
+            self._reader.execute(SCHEMA)
+        self._reader_lock = threading.Lock()
+        self._writer_thread = threading.Thread(
+            target=self._write_behind, name='vaspx-tracker-store', daemon=True
+        )
+        self._writer_thread.start()
+        atexit.register(self.close)
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        # With WAL, NORMAL only risks the last transactions on power loss
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    async def save(self, tracker: DialogueStateTracker) -> None:
+        if self.event_broker:
+            await self.stream_events(tracker)
+
+        events = list(tracker.events)
+        turns = sum(1 for event in events if isinstance(event, UserUttered))
+        compacted = None
+        if turns > self.compact_after or _session_start(events) > 0:
+            compacted = compact_events(tracker.sender_id, events, self.domain, self.keep_turns)
+        if compacted is not None:
+            self.compactions += 1
+            tracker = DialogueStateTracker.from_events(
+                tracker.sender_id, compacted, slots=self.domain.slots,
+                max_event_history=self.max_event_history,
+            )
+        serialised = self.serialise_tracker(tracker)
+
+        if self.shared:
+            await self._off_loop(self._write, tracker.sender_id, serialised)
+            return
+
+        with self._lock:
+            self._remember(tracker.sender_id, serialised)
+            self._pending[tracker.sender_id] = serialised
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    async def retrieve(self, sender_id: Text) -> Optional[DialogueStateTracker]:
+        serialised = None if self.shared else self._cached(sender_id)
+        if serialised is None:
+            serialised = await self._off_loop(self._read, sender_id)
+        if serialised is None:
+            return None
+        return self.deserialise_tracker(sender_id, serialised)
+
+    async def keys(self) -> Iterable[Text]:
+        stored = await self._off_loop(self._stored_keys)
+        with self._lock:
+            return list(set(stored) | set(self._pending))
+
+    @staticmethod
+    async def _off_loop(function: Callable[..., Result], *args: Any) -> Result:
+        """Run a database call on the default executor"""
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    def _cached(self, sender_id: Text) -> Optional[Text]:
+        """The tracker from the LRU or the write-behind queue, if it is there"""
+        with self._lock:
+            cached = self._cache.get(sender_id)
+            if cached is not None:
+                self._cache.move_to_end(sender_id)
+                self.hits += 1
+                return cached
+            pending = self._pending.get(sender_id)
+            if pending is None:
+                self.misses += 1
+            return pending
+
+    def _read(self, sender_id: Text) -> Optional[Text]:
+        with self._reader_lock:
+            row = self._reader.execute(
+                'SELECT tracker FROM trackers WHERE sender_id = ?', (sender_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        if not self.shared:
+            with self._lock:
+                # A save may have raced the read; the newer tracker wins
+                if sender_id not in self._pending:
+                    self._remember(sender_id, row[0])
+        return row[0]
+
+    def _write(self, sender_id: Text, serialised: Text) -> None:
+        with self._reader_lock:
+            self._reader.execute(
+                'INSERT OR REPLACE INTO trackers (sender_id, tracker, updated_at) '
+                'VALUES (?, ?, ?)',
+                (sender_id, serialised, time.time()),
+            )
+
+    def _stored_keys(self) -> List[Text]:
+        with self._reader_lock:
+            return [row[0] for row in self._reader.execute('SELECT sender_id FROM trackers')]
+
+    def _remember(self, sender_id: Text, serialised: Text) -> None:
+        self._cache[sender_id] = serialised
+        self._cache.move_to_end(sender_id)
+        while len(self._cache) > self.max_trackers:
+            self._cache.popitem(last=False)
+
+    def _write_behind(self) -> None:
+        writer = self._connect()
+        try:
+            while not self._closed:
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                self._flush(writer)
+            self._flush(writer)
+        finally:
+            writer.close()
+
+    def _flush(self, writer: sqlite3.Connection) -> None:
+        with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+        now = time.time()
+        try:
+            with writer:
+                writer.execute('BEGIN')
+                writer.executemany(
+                    'INSERT OR REPLACE INTO trackers (sender_id, tracker, updated_at) '
+                    'VALUES (?, ?, ?)',
+                    [(sender_id, serialised, now) for sender_id, serialised in batch.items()],
+                )
+        except sqlite3.Error:
+            logger.exception(f"Writing {len(batch)} trackers to '{self.path}' failed; will retry.")
+            with self._lock:
+                # Keep saves that arrived since, they are newer
+                self._pending = {**batch, **self._pending}
+            return
+        self.flushes += 1
+
+    def close(self) -> None:
+        """Write every queued save and stop the background writer"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._writer_thread.join()
+
+    def stats(self) -> Dict[Text, Any]:
+        with self._lock:
+            return {
+                'cached': len(self._cache),
+                'pending': len(self._pending),
+                'hits': self.hits,
+                'misses': self.misses,
+                'flushes': self.flushes,
+                'compactions': self.compactions,
+            }
@@ -0,0 +1,267 @@
+"""Warm-start launcher for the Rasa server
+
+``rasa run`` unpacks the model tarball into a fresh temporary directory on
+every start and then loads each pipeline component and policy one after the
+other. Started through this module instead,
+
+    python -m addons.warm_start run --enable-api --port 5005
+
+the server
+
+* unpacks each model once into ``$VASPX_MODEL_CACHE/<model id>`` (default
+  ``.model_cache``) and reuses that directory on later starts, so a restarted
+  or scaled-out container with the cache on a volume skips the unpacking,
+* loads the graph's components in parallel on ``VASPX_MODEL_LOAD_WORKERS``
+  threads (default 4), except the TensorFlow-backed ones (DIET and its
+  subclasses, TED), which load one after the other on the calling thread
+  while the rest load on the pool, since building Keras models is not
+  thread-safe, and
+* logs how long unpacking and each component took, and writes the same
+  breakdown to ``load_times.json`` next to the cached model, and
+* with ``VASPX_TRACE_DIR`` set, traces a sample of the messages it handles
+  (see ``tracing.py``).
+
+All other arguments are passed to the ``rasa`` command line unchanged.
+``python -m addons.warm_start prepare [MODEL]`` only fills the cache, e.g.
+while building an image. Only the ``VASPX_MODEL_CACHE_KEEP`` most recently
+used models are kept (default 3).
+"""
+import json
+import logging
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional, Text, Tuple, Union
+
+from rasa.core.processor import MessageProcessor
+from rasa.engine.graph import ExecutionContext, GraphNode
+from rasa.engine.runner.dask import DaskGraphRunner
+from rasa.engine.runner.interface import GraphRunner
+from rasa.engine.storage.local_model_storage import LocalModelStorage
+from rasa.engine.storage.storage import ModelMetadata, ModelStorage
+from rasa.exceptions import ModelNotFound
+from rasa.model import get_latest_model
+
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.environ.get('VASPX_MODEL_CACHE', '.model_cache')
+LOAD_WORKERS = int(os.environ.get('VASPX_MODEL_LOAD_WORKERS', 4))
+CACHE_KEEP = int(os.environ.get('VASPX_MODEL_CACHE_KEEP', 3))
+
+INDEX_FILE = 'index.json'
+METADATA_FILE = 'metadata.json'
+COMPONENTS_DIR = 'components'
+LOAD_TIMES_FILE = 'load_times.json'
+
+# Rasa components whose loading builds a TensorFlow model, by class name
+TENSORFLOW_COMPONENTS = ('DIETClassifier', 'TEDPolicy')
+
+
+def loads_tensorflow(component_class: type) -> bool:
+    """Whether `component_class` is, or derives from, a TensorFlow-backed Rasa component"""
+    return any(
+        cls.__name__ in TENSORFLOW_COMPONENTS and cls.__module__.startswith('rasa.')
+        for cls in component_class.__mro__
+    )
+
+
+class ModelCache:
+    """Model tarballs unpacked once into directories named after the model id"""
+
+    def __init__(self, directory: Text = CACHE_DIR, keep: int = CACHE_KEEP) -> None:
+        self.directory = Path(directory)
+        self.keep = keep
+
+    def _archive_key(self, archive: Path) -> Text:
+        stat = archive.stat()
+        return f'{archive.resolve()}:{stat.st_size}:{stat.st_mtime_ns}'
+
+    def _read_index(self) -> Dict[Text, Text]:
+        try:
+            return json.loads((self.directory / INDEX_FILE).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self, index: Dict[Text, Text]) -> None:
+        # Written aside and renamed, so concurrent starts never read half a file
+        partial = self.directory / f'{INDEX_FILE}.{os.getpid()}'
+        partial.write_text(json.dumps(index, indent=2), encoding='utf-8')
+        os.replace(partial, self.directory / INDEX_FILE)
+
+    def lookup(self, archive: Path) -> Optional[Path]:
+        """Cached directory of `archive`, if it was unpacked before"""
+        model_id = self._read_index().get(self._archive_key(archive))
+        if model_id and (self.directory / model_id / METADATA_FILE).is_file():
+            return self.directory / model_id
+        return None
+
+    def unpack(self, archive: Path) -> Path:
+        """Unpack `archive` into the cache and return its directory"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(prefix='unpacking-', dir=self.directory))
+        try:
+            (staging / COMPONENTS_DIR).mkdir()
+            _, metadata = LocalModelStorage.from_model_archive(staging / COMPONENTS_DIR, archive)
+            (staging / METADATA_FILE).write_text(json.dumps(metadata.as_dict()), encoding='utf-8')
+            target = self.directory / metadata.model_id
+            try:
+                os.rename(staging, target)
+            except OSError:
+                # Another process unpacked the same model first
+                if not (target / METADATA_FILE).is_file():
+                    raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        index = self._read_index()
+        index[self._archive_key(archive)] = metadata.model_id
+        self._write_index(index)
+        self._evict(keep=target)
+        return target
+
+    def _evict(self, keep: Path) -> None:
+        models = sorted(
+            (path for path in self.directory.iterdir()
+             if path.is_dir() and (path / METADATA_FILE).is_file()),
+            key=lambda path: path.stat().st_mtime, reverse=True,
+        )
+        for stale in models[self.keep:]:
+            if stale != keep:
+                logger.info(f"Removing cached model '{stale.name}'.")
+                shutil.rmtree(stale, ignore_errors=True)
+
+    def load(self, directory: Path) -> Tuple[ModelStorage, ModelMetadata]:
+        metadata = ModelMetadata.from_dict(
+            json.loads((directory / METADATA_FILE).read_text(encoding='utf-8'))
+        )
+        # Marks the model as recently used for eviction
+        os.utime(directory)
+        return LocalModelStorage(directory / COMPONENTS_DIR), metadata
+
+
+class ParallelGraphRunner(DaskGraphRunner):
+    """DaskGraphRunner that instantiates (and so loads) its nodes on a thread pool
+
+    TensorFlow-backed nodes are loaded serially on the calling thread instead,
+    while the pool works through the others.
+    """
+
+    # Seconds each node took to load, for the most recent graph
+    load_times: Dict[Text, float] = {}
+
+    @staticmethod
+    def _instantiate_nodes(graph_schema: Any, model_storage: ModelStorage,
+                           execution_context: ExecutionContext,
+                           hooks: Optional[Any] = None) -> Dict[Text, GraphNode]:
+        def instantiate(item: Tuple[Text, Any]) -> Tuple[Text, GraphNode, float]:
+            node_name, schema_node = item
+            started = time.perf_counter()
+            node = GraphNode.from_schema_node(
+                node_name, schema_node, model_storage, execution_context, hooks
+            )
+            return node_name, node, time.perf_counter() - started
+
+        serial = [item for item in graph_schema.nodes.items() if loads_tensorflow(item[1].uses)]
+        parallel = [item for item in graph_schema.nodes.items()
+                    if not loads_tensorflow(item[1].uses)]
+        with ThreadPoolExecutor(max_workers=max(1, LOAD_WORKERS),
+                                thread_name_prefix='vaspx-model-load') as pool:
+            loading = pool.map(instantiate, parallel)
+            results = [instantiate(item) for item in serial]
+            results += list(loading)
+        ParallelGraphRunner.load_times = {name: seconds for name, _, seconds in results}
+        return {name: node for name, node, _ in results}
+
+
+def _model_archive(model_path: Union[Text, Path]) -> Path:
+    if os.path.isfile(model_path):
+        return Path(model_path)
+    try:
+        latest = get_latest_model(model_path)
+    except TypeError:
+        latest = None
+    if not latest:
+        raise ModelNotFound(f"No model found at path '{model_path}'.")
+    return Path(latest)
+
+
+def load_model(model_path: Union[Text, Path],
+               cache: Optional[ModelCache] = None) -> Tuple[Text, ModelMetadata, GraphRunner]:
+    """Load the model at `model_path` from the warm-start cache, unpacking it on a miss"""
+    cache = cache or ModelCache()
+    archive = _model_archive(model_path)
+    started = time.perf_counter()
+    directory = cache.lookup(archive)
+    timings: Dict[Text, Any] = {'cache_hit': directory is not None}
+    if directory is None:
+        logger.info(f"Unpacking model {archive} into {cache.directory}...")
+        try:
+            directory = cache.unpack(archive)
+        except tarfile.ReadError:
+            raise ModelNotFound(f"Model {model_path} can not be loaded.")
+    timings['unpack_s'] = time.perf_counter() - started
+
+    model_storage, metadata = cache.load(directory)
+    loading = time.perf_counter()
+    runner = ParallelGraphRunner.create(
+        graph_schema=metadata.predict_schema,
+        model_storage=model_storage,
+        execution_context=ExecutionContext(
+            graph_schema=metadata.predict_schema, model_id=metadata.model_id
+        ),
+    )
+    timings['load_s'] = time.perf_counter() - loading
+    timings['total_s'] = time.perf_counter() - started
+    timings['components_s'] = dict(sorted(
+        ParallelGraphRunner.load_times.items(), key=lambda item: item[1], reverse=True
+    ))
+    _report(archive, directory, timings)
+    return archive.name, metadata, runner
+
+
+def _report(archive: Path, directory: Path, timings: Dict[Text, Any]) -> None:
+    source = 'cache' if timings['cache_hit'] else 'freshly unpacked'
+    lines = [
+        f"Loaded model {archive.name} ({source}) in {timings['total_s']:.2f}s: "
+        f"unpack {timings['unpack_s']:.2f}s, components {timings['load_s']:.2f}s "
+        f"on {LOAD_WORKERS} threads, TensorFlow components serially"
+    ]
+    lines += [f"  {seconds:8.3f}s  {name}" for name, seconds in timings['components_s'].items()]
+    logger.info('\n'.join(lines))
+    try:
+        (directory / LOAD_TIMES_FILE).write_text(json.dumps(timings, indent=2), encoding='utf-8')
+    except OSError as error:
+        logger.debug(f"Could not write load times: {error}")
+
+
+def install() -> None:
+    """Make every model the Rasa server loads go through the warm-start cache"""
+    MessageProcessor._load_model = staticmethod(load_model)
+
+
+def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == 'prepare':
+        logging.basicConfig(level=logging.INFO)
+        archive = _model_archive(sys.argv[2] if len(sys.argv) > 2 else 'models')
+        cache = ModelCache()
+        directory = cache.lookup(archive) or cache.unpack(archive)
+        print(directory)
+        return
+
+    install()
+    if tracing.TRACE_DIR:
+        tracing.install()
+    from rasa.__main__ import main as rasa_main
+
+    rasa_main()
+
+
+if __name__ == '__main__':
+    main()
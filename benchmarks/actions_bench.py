@@ -0,0 +1,292 @@
+"""Benchmark the custom action server hot path
+
+In-process mode builds synthetic trackers from the utterances in
+``data/nlu.yml`` and drives every action's ``run`` with a
+``CollectingDispatcher``, reporting throughput, p50/p95/p99 latency and the
+peak bytes allocated per call (measured with tracemalloc in a separate pass,
+so it does not distort the timings).
+
+End-to-end mode posts webhook payloads to an action server on port 5055 at a
+configurable concurrency; ``--start-server`` launches one locally first.
+
+Results are written as JSON. Passing ``--baseline`` compares against an
+earlier results file and exits non-zero on regressions beyond
+``--tolerance``, so the script can gate a deploy:
+
+    python -m benchmarks.actions_bench --output bench.json
+    python -m benchmarks.actions_bench --baseline bench.json --e2e --start-server
+"""
+import argparse
+import asyncio
+import inspect
+import itertools
+import subprocess
+import sys
+import time
+import tracemalloc
+import uuid
+from typing import Any, Dict, List, Optional, Sequence, Text, Tuple, Type
+
+from rasa_sdk import Action, Tracker
+from rasa_sdk.executor import CollectingDispatcher
+
+from benchmarks.common import (
+    PROJECT_ROOT, compare_to_baseline, environment, load_domain, load_nlu_examples,
+    load_results, summarize, wait_for_url, write_results,
+)
+
+ACTION_SERVER_URL = 'http://localhost:5055/webhook'
+
+REGRESSION_METRICS = ('throughput_per_s', 'p95_ms', 'p99_ms', 'alloc_peak_bytes')
+
+
+def action_classes() -> List[Type[Action]]:
+    """Every custom action defined in actions/actions.py"""
+    from actions import actions as module
+
+    return [
+        member for _, member in inspect.getmembers(module, inspect.isclass)
+        if issubclass(member, Action) and member is not Action and member.__module__ == module.__name__
+    ]
+
+
+def latest_message(intent: Text, text: Text, message_id: Text) -> Dict[Text, Any]:
+    return {
+        'text': text,
+        'intent': {'name': intent, 'confidence': 1.0},
+        'entities': [],
+        'message_id': message_id,
+    }
+
+
+def make_tracker(sender_id: Text, intent: Text, text: Text, message_id: Text) -> Tracker:
+    return Tracker(
+        sender_id, {}, latest_message(intent, text, message_id), [], False, None, {}, 'action_listen'
+    )
+
+
+def make_trackers(examples: Sequence[Tuple[Text, Text]], count: int, warm: bool) -> List[Tracker]:
+    """`count` trackers cycling through `examples`
+
+    Cold trackers get a fresh message id each, so every call misses the
+    per-turn analysis cache; warm trackers reuse one id per utterance.
+    """
+    trackers = []
+    for index, (intent, text) in zip(range(count), itertools.cycle(examples)):
+        message_id = f'bench-{text}' if warm else uuid.uuid4().hex
+        trackers.append(make_tracker(f'bench-{index % 64}', intent, text, message_id))
+    return trackers
+
+
+def _call(action: Action, tracker: Tracker, loop: asyncio.AbstractEventLoop) -> Any:
+    result = action.run(CollectingDispatcher(), tracker, {})
+    if inspect.isawaitable(result):
+        result = loop.run_until_complete(result)
+    return result
+
+
+def bench_action(action: Action, trackers: Sequence[Tracker], alloc_trackers: Sequence[Tracker],
+                 loop: asyncio.AbstractEventLoop) -> Dict[Text, Any]:
+    """Latency, throughput and allocation figures for one action"""
+    durations = []
+    started = time.perf_counter()
+    for tracker in trackers:
+        call_started = time.perf_counter()
+        _call(action, tracker, loop)
+        durations.append(time.perf_counter() - call_started)
+    result = summarize(durations, time.perf_counter() - started)
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for tracker in alloc_trackers:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            _call(action, tracker, loop)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+    peaks.sort()
+    result['alloc_peak_bytes'] = peaks[len(peaks) // 2] if peaks else 0
+    return result
+
+
+def run_in_process(iterations: int, names: Optional[Sequence[Text]], warm: bool,
+                   alloc_samples: int) -> Dict[Text, Dict[Text, Any]]:
+    examples = load_nlu_examples()
+    loop = asyncio.new_event_loop()
+    results = {}
+    try:
+        for action_class in action_classes():
+            action = action_class()
+            if names and action.name() not in names:
+                continue
+            # One untimed pass so import-time and first-render costs stay out
+            for tracker in make_trackers(examples, len(examples), warm):
+                _call(action, tracker, loop)
+            results[action.name()] = bench_action(
+                action,
+                make_trackers(examples, iterations, warm),
+                make_trackers(examples, alloc_samples, warm),
+                loop,
+            )
+    finally:
+        loop.close()
+    return results
+
+
+def webhook_payload(action_name: Text, intent: Text, text: Text, sender_id: Text,
+                    domain: Dict[Text, Any]) -> Dict[Text, Any]:
+    """Request body the Rasa server sends to the action server"""
+    return {
+        'next_action': action_name,
+        'sender_id': sender_id,
+        'version': '3.6.21',
+        'domain': domain,
+        'tracker': {
+            'sender_id': sender_id,
+            'slots': {},
+            'latest_message': latest_message(intent, text, uuid.uuid4().hex),
+            'events': [],
+            'paused': False,
+            'followup_action': None,
+            'active_loop': {},
+            'latest_action_name': 'action_listen',
+        },
+    }
+
+
+async def _post_all(url: Text, payloads: Sequence[Tuple[Text, Dict[Text, Any]]],
+                    concurrency: int) -> Dict[Text, Dict[Text, Any]]:
+    import aiohttp
+
+    durations: Dict[Text, List[float]] = {}
+    errors: Dict[Text, int] = {}
+    queue: 'asyncio.Queue[Tuple[Text, Dict[Text, Any]]]' = asyncio.Queue()
+    for item in payloads:
+        queue.put_nowait(item)
+
+    async def worker(session: 'aiohttp.ClientSession') -> None:
+        while not queue.empty():
+            action_name, payload = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                async with session.post(url, json=payload) as response:
+                    await response.read()
+                    ok = response.status == 200
+            except aiohttp.ClientError:
+                ok = False
+            if ok:
+                durations.setdefault(action_name, []).append(time.perf_counter() - started)
+            else:
+                errors[action_name] = errors.get(action_name, 0) + 1
+
+    started = time.perf_counter()
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    for action_name in sorted(set(durations) | set(errors)):
+        samples = durations.get(action_name, [])
+        # Actions share the connection pool, so throughput is per wall clock
+        results[action_name] = summarize(samples, elapsed)
+        results[action_name]['errors'] = errors.get(action_name, 0)
+    total = [sample for samples in durations.values() for sample in samples]
+    results['all'] = summarize(total, elapsed)
+    results['all']['errors'] = sum(errors.values())
+    results['all']['concurrency'] = concurrency
+    return results
+
+
+def wait_for_server(url: Text, timeout: float) -> None:
+    wait_for_url(url.rsplit('/', 1)[0] + '/health', timeout)
+
+
+def start_action_server(port: int) -> 'subprocess.Popen[bytes]':
+    return subprocess.Popen(
+        [sys.executable, '-m', 'rasa_sdk', '--actions', 'actions', '--port', str(port)],
+        cwd=PROJECT_ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def run_end_to_end(url: Text, requests: int, concurrency: int,
+                   names: Optional[Sequence[Text]]) -> Dict[Text, Dict[Text, Any]]:
+    domain = load_domain()
+    action_names = [action_class().name() for action_class in action_classes()]
+    if names:
+        action_names = [name for name in action_names if name in names]
+    examples = itertools.cycle(load_nlu_examples())
+    payloads = [
+        (action_name, webhook_payload(action_name, intent, text, f'bench-{index % 256}', domain))
+        for index, action_name, (intent, text) in zip(
+            range(requests), itertools.cycle(action_names), examples
+        )
+    ]
+    return asyncio.run(_post_all(url, payloads, concurrency))
+
+
+def main(argv: Optional[Sequence[Text]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--iterations', type=int, default=2000,
+                        help='calls per action in process (default: 2000)')
+    parser.add_argument('--alloc-samples', type=int, default=200,
+                        help='calls per action traced for allocations (default: 200)')
+    parser.add_argument('--actions', nargs='*', help='only benchmark these action names')
+    parser.add_argument('--warm', action='store_true',
+                        help='reuse message ids so the per-turn analysis cache hits')
+    parser.add_argument('--skip-in-process', action='store_true')
+    parser.add_argument('--e2e', action='store_true', help='also post webhooks to an action server')
+    parser.add_argument('--url', default=ACTION_SERVER_URL)
+    parser.add_argument('--start-server', action='store_true',
+                        help='start an action server for the end-to-end run')
+    parser.add_argument('--requests', type=int, default=2000, help='webhook calls in total')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    parser.add_argument('--baseline', help='earlier results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative regression per metric (default: 0.25)')
+    args = parser.parse_args(argv)
+
+    results: Dict[Text, Any] = {'environment': environment()}
+    if not args.skip_in_process:
+        results['in_process'] = run_in_process(
+            args.iterations, args.actions, args.warm, args.alloc_samples
+        )
+
+    if args.e2e:
+        server = None
+        if args.start_server:
+            port = int(args.url.split(':')[-1].split('/')[0])
+            server = start_action_server(port)
+        try:
+            wait_for_server(args.url, timeout=60)
+            results['end_to_end'] = run_end_to_end(
+                args.url, args.requests, args.concurrency, args.actions
+            )
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    write_results(results, args.output)
+
+    if not args.baseline:
+        return 0
+    baseline = load_results(args.baseline)
+    regressions = []
+    for section in ('in_process', 'end_to_end'):
+        if section in results and section in baseline:
+            regressions += compare_to_baseline(
+                results[section], baseline[section], REGRESSION_METRICS, args.tolerance
+            )
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""Helpers shared by the benchmark and load-testing scripts"""
+import json
+import os
+import platform
+import re
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Text, Tuple
+
+import yaml
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NLU_PATH = os.path.join(PROJECT_ROOT, 'data', 'nlu.yml')
+DOMAIN_PATH = os.path.join(PROJECT_ROOT, 'domain.yml')
+
+# [text](entity) and [text]{"entity": ...} annotations in training examples
+_ANNOTATION = re.compile(r'\[([^\]]+)\](?:\([^)]*\)|\{[^}]*\})')
+
+# Metrics where a higher value is a regression; everything else compared by
+# compare_to_baseline is treated as higher-is-better
+LOWER_IS_BETTER = ('p50_ms', 'p95_ms', 'p99_ms', 'mean_ms', 'alloc_peak_bytes')
+
+
+def load_nlu_examples(path: Text = NLU_PATH) -> List[Tuple[Text, Text]]:
+    """(intent, text) pairs from a Rasa NLU training file, annotations stripped"""
+    with open(path, encoding='utf-8') as nlu_file:
+        data = yaml.safe_load(nlu_file) or {}
+
+    examples = []
+    for block in data.get('nlu') or []:
+        intent = block.get('intent')
+        if not intent:
+            continue
+        for line in (block.get('examples') or '').splitlines():
+            line = line.strip()
+            if line.startswith('- '):
+                examples.append((intent, _ANNOTATION.sub(r'\1', line[2:].strip())))
+    return examples
+
+
+def load_domain(path: Text = DOMAIN_PATH) -> Dict[Text, Any]:
+    with open(path, encoding='utf-8') as domain_file:
+        return yaml.safe_load(domain_file) or {}
+
+
+def percentile(sorted_samples: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted samples"""
+    if not sorted_samples:
+        return 0.0
+    rank = max(0, min(len(sorted_samples) - 1, int(round(fraction * len(sorted_samples))) - 1))
+    return sorted_samples[rank]
+
+
+def summarize(durations_s: Iterable[float], elapsed_s: Optional[float] = None) -> Dict[Text, Any]:
+    """Throughput and latency percentiles for a list of per-call durations"""
+    samples = sorted(durations_s)
+    total = elapsed_s if elapsed_s is not None else sum(samples)
+    return {
+        'calls': len(samples),
+        'throughput_per_s': len(samples) / total if total else 0.0,
+        'mean_ms': 1000 * sum(samples) / len(samples) if samples else 0.0,
+        'p50_ms': 1000 * percentile(samples, 0.50),
+        'p95_ms': 1000 * percentile(samples, 0.95),
+        'p99_ms': 1000 * percentile(samples, 0.99),
+        'max_ms': 1000 * samples[-1] if samples else 0.0,
+    }
+
+
+def environment() -> Dict[Text, Any]:
+    """Where and when a run happened, stored next to its results"""
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def write_results(results: Dict[Text, Any], path: Optional[Text]) -> None:
+    """Write `results` as JSON to `path`, or to stdout when no path is given"""
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if path:
+        with open(path, 'w', encoding='utf-8') as results_file:
+            results_file.write(text + '\n')
+    else:
+        print(text)
+
+
+def load_results(path: Text) -> Dict[Text, Any]:
+    with open(path, encoding='utf-8') as results_file:
+        return json.load(results_file)
+
+
+def wait_for_url(url: Text, timeout: float) -> None:
+    """Poll `url` until it answers 200 or `timeout` seconds have passed"""
+    import urllib.error
+    import urllib.request
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.25)
+    raise TimeoutError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def compare_to_baseline(current: Dict[Text, Dict[Text, Any]],
+                        baseline: Dict[Text, Dict[Text, Any]],
+                        metrics: Sequence[Text],
+                        tolerance: float) -> List[Text]:
+    """Human-readable regressions of `current` against `baseline`
+
+    Both arguments map a benchmark name to its metrics. A metric regresses
+    when it is worse than the baseline by more than `tolerance` (a fraction).
+    Benchmarks missing from either side are skipped.
+    """
+    regressions = []
+    for name, old in sorted(baseline.items()):
+        new = current.get(name)
+        if not new:
+            continue
+        for metric in metrics:
+            if metric not in old or metric not in new or not old[metric]:
+                continue
+            change = (new[metric] - old[metric]) / old[metric]
+            worse = change > tolerance if metric in LOWER_IS_BETTER else change < -tolerance
+            if worse:
+                regressions.append(
+                    f"{name}: {metric} {old[metric]:.4g} -> {new[metric]:.4g} ({change:+.1%})"
+                )
+    return regressions
@@ -0,0 +1,111 @@
+"""Measure how many policy predictions the fast path answers and what it saves
+
+Loads the trained model in process (it must use
+``addons.fast_path_policy.FastPathTEDPolicy``, as config.yml does), replays
+the stories from ``data/stories.yml`` and ``tests/test_stories.yml`` once
+with the fast path and once with every prediction going to TED, and reports
+for each run the share of predictions taken by the fast path, the mean time
+of a fast-path and a model prediction, the policy time saved and the
+end-to-end time per message:
+
+    python -m benchmarks.fast_path_bench --rounds 5 --output fast_path.json
+
+Custom actions are sent to the action server at ``--action-server``; start
+one first (``rasa run actions``) or the stories using them count errors.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence, Text
+
+from benchmarks.common import PROJECT_ROOT, environment, summarize, write_results
+from benchmarks.replay_bench import ACTION_SERVER_URL, STORY_PATHS, Script, load_scripts
+
+
+async def _replay(agent: Any, scripts: Sequence[Script], rounds: int,
+                  label: Text) -> Dict[Text, Any]:
+    from rasa.core.channels.channel import UserMessage
+
+    durations: List[float] = []
+    errors = 0
+    started = time.perf_counter()
+    for round_index in range(rounds):
+        for script_index, (_, turns) in enumerate(scripts):
+            sender_id = f'fast-path-{label}-{round_index}-{script_index}'
+            for text, _ in turns:
+                message_started = time.perf_counter()
+                try:
+                    await agent.handle_message(UserMessage(text, sender_id=sender_id))
+                except Exception:
+                    errors += 1
+                    continue
+                durations.append(time.perf_counter() - message_started)
+    result = summarize(durations, time.perf_counter() - started)
+    result['errors'] = errors
+    return result
+
+
+def run(model: Optional[Text], action_server: Text, rounds: int,
+        stories: Sequence[Text]) -> Dict[Text, Any]:
+    from rasa.core.agent import Agent
+    from rasa.model import get_latest_model
+    from rasa.utils.endpoints import EndpointConfig
+
+    from addons import fast_path_policy
+
+    agent = Agent.load(model or get_latest_model(os.path.join(PROJECT_ROOT, 'models')),
+                       action_endpoint=EndpointConfig(action_server))
+    scripts = load_scripts(stories)
+    # One untimed pass so lazily built TensorFlow functions stay out of the runs
+    asyncio.run(_replay(agent, scripts, 1, 'warmup'))
+
+    results = {}
+    for label, enabled in (('fast_path', True), ('model_only', False)):
+        fast_path_policy.ENABLED = enabled
+        fast_path_policy.STATS.reset()
+        messages = asyncio.run(_replay(agent, scripts, rounds, label))
+        results[label] = {'messages': messages, 'policy': fast_path_policy.fast_path_stats()}
+    fast_path_policy.ENABLED = True
+
+    with_fast_path = results['fast_path']['messages']['mean_ms']
+    model_only = results['model_only']['messages']['mean_ms']
+    results['mean_ms_saved_per_message'] = model_only - with_fast_path
+    results['compiled_rules'] = sum(
+        len(getattr(policy, 'fast_path', None) or {})
+        for policy in _policies(agent)
+    )
+    return results
+
+
+def _policies(agent: Any) -> List[Any]:
+    """Loaded FastPathTEDPolicy instances of `agent`'s model"""
+    from addons.fast_path_policy import FastPathTEDPolicy
+
+    nodes = getattr(agent.processor.graph_runner, '_instantiated_nodes', {}) or {}
+    return [
+        node._component for node in nodes.values()
+        if isinstance(getattr(node, '_component', None), FastPathTEDPolicy)
+    ]
+
+
+def main(argv: Optional[Sequence[Text]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--model', help='model to load (default: latest in models/)')
+    parser.add_argument('--action-server', default=ACTION_SERVER_URL,
+                        help=f'action server for custom actions (default: {ACTION_SERVER_URL})')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='times every story is replayed per run (default: 3)')
+    parser.add_argument('--stories', nargs='*', default=list(STORY_PATHS))
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    args = parser.parse_args(argv)
+
+    results = run(args.model, args.action_server, args.rounds, args.stories)
+    results['environment'] = environment()
+    write_results(results, args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
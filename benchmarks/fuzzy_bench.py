@@ -0,0 +1,112 @@
+"""Show that fuzzy product lookup cost stays flat as the alias list grows
+
+Builds the deletion-dictionary index from the real catalog aliases padded with
+seeded random spellings up to each requested size, then times lookups of
+misspelled tokens with the lookup cache disabled. A naive scan that computes
+the edit distance to every alias is timed alongside for the smaller sizes to
+show the linear growth the index avoids.
+
+    python -m benchmarks.fuzzy_bench --sizes 10 100 1000 10000 50000
+"""
+import argparse
+import random
+import string
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence, Text
+
+from actions.catalog import CATALOG
+from actions.fuzzy import FuzzyIndex, edit_distance
+
+from benchmarks.common import environment, write_results
+
+MISSPELLINGS = ['ednekt', 'ednct', 'transtrak', 'trnstrack', 'icebx', 'iecbox', 'desalte', 'desallitte']
+MISSES = ['pricing', 'school', 'hello', 'warehouse', 'features', 'contact']
+
+
+def random_spelling(rng: random.Random) -> Text:
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(6, 12)))
+
+
+def misspell(word: Text, rng: random.Random) -> Text:
+    index = rng.randrange(len(word))
+    return word[:index] + rng.choice(string.ascii_lowercase) + word[index + 1:]
+
+
+def build_terms(size: int, rng: random.Random) -> Dict[Text, Text]:
+    terms = {
+        alias.replace(' ', ''): product
+        for product, aliases in CATALOG.aliases.items()
+        for alias in aliases
+    }
+    while len(terms) < size:
+        terms[random_spelling(rng)] = 'synthetic'
+    return terms
+
+
+def time_lookups(lookup: Any, queries: Sequence[Text], repeats: int) -> float:
+    """Median seconds per lookup over `repeats` passes through `queries`"""
+    passes = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for query in queries:
+            lookup(query)
+        passes.append((time.perf_counter() - started) / len(queries))
+    passes.sort()
+    return passes[len(passes) // 2]
+
+
+def naive_lookup(terms: Dict[Text, Text]) -> Any:
+    def lookup(token: Text) -> Optional[Text]:
+        for term, value in terms.items():
+            if edit_distance(token, term, 2) <= 2:
+                return value
+        return None
+    return lookup
+
+
+def run(sizes: Sequence[int], repeats: int, naive_max: int, seed: int) -> List[Dict[Text, Any]]:
+    results = []
+    for size in sizes:
+        rng = random.Random(seed)
+        terms = build_terms(size, rng)
+        synthetic = [term for term, value in terms.items() if value == 'synthetic']
+        queries = MISSPELLINGS + MISSES + [misspell(term, rng) for term in rng.sample(synthetic, min(20, len(synthetic)))]
+
+        started = time.perf_counter()
+        index = FuzzyIndex(terms, cache_size=0)
+        build_s = time.perf_counter() - started
+
+        row = {
+            'aliases': len(terms),
+            'build_ms': 1000 * build_s,
+            'index_lookup_us': 1e6 * time_lookups(index.lookup, queries, repeats),
+        }
+        if size <= naive_max:
+            row['naive_lookup_us'] = 1e6 * time_lookups(naive_lookup(terms), queries, repeats)
+        results.append(row)
+        print(f"{row['aliases']:>7} aliases  index {row['index_lookup_us']:8.1f} us/lookup"
+              + (f"  naive {row['naive_lookup_us']:10.1f} us/lookup" if 'naive_lookup_us' in row else ''),
+              file=sys.stderr)
+    return results
+
+
+def main(argv: Optional[Sequence[Text]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--naive-max', type=int, default=1000,
+                        help='largest size to also time the naive scan for (default: 1000)')
+    parser.add_argument('--seed', type=int, default=13)
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    args = parser.parse_args(argv)
+
+    write_results(
+        {'environment': environment(), 'fuzzy_lookup': run(args.sizes, args.repeats, args.naive_max, args.seed)},
+        args.output,
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
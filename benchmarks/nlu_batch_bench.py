@@ -0,0 +1,153 @@
+"""Load-test NLU parsing with and without micro-batching
+
+Starts a Rasa server per batching window (``VASPX_NLU_BATCH_WINDOW_MS``; 0 is
+the current one-message-at-a-time path), posts the utterances from
+``data/nlu.yml`` to ``/model/parse`` at a fixed concurrency, and reports
+throughput and p50/p95/p99 latency per window, plus each window's change
+against the unbatched run. The texts are the training examples, so the
+servers run with the parse cache off (``VASPX_PARSE_CACHE``; see
+``addons.parse_cache``) and every message reaches DIET:
+
+    python -m benchmarks.nlu_batch_bench --windows 0 5 10 --concurrency 32
+
+The model must have been trained with the ``addons.parse_cache`` pipeline in
+config.yml (``rasa train``). ``--url`` load-tests an already running server
+instead, as a single run. Every run reports ``cache_hit_rate``, the share
+of answers the parse cache gave; ``--parse-cache`` turns the cache back on.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence, Text
+
+from benchmarks.common import (
+    PROJECT_ROOT, environment, load_nlu_examples, summarize, wait_for_url, write_results,
+)
+
+PARSE_PATH = '/model/parse'
+
+# Set in the parse result of messages addons.parse_cache answered
+PARSE_CACHE_HIT = 'parse_cache_hit'
+
+
+async def _post_all(url: Text, texts: Sequence[Text], concurrency: int) -> Dict[Text, Any]:
+    import aiohttp
+
+    durations: List[float] = []
+    errors = 0
+    cache_hits = 0
+    pending = iter(texts)
+
+    async def worker(session: 'aiohttp.ClientSession') -> None:
+        nonlocal errors, cache_hits
+        for text in pending:
+            started = time.perf_counter()
+            try:
+                async with session.post(url, json={'text': text}) as response:
+                    body = await response.json() if response.status == 200 else None
+                    ok = body is not None
+            except aiohttp.ClientError:
+                ok = False
+            if ok:
+                durations.append(time.perf_counter() - started)
+                cache_hits += bool(body.get(PARSE_CACHE_HIT))
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    result = summarize(durations, time.perf_counter() - started)
+    result['errors'] = errors
+    result['concurrency'] = concurrency
+    result['cache_hit_rate'] = cache_hits / len(durations) if durations else 0.0
+    return result
+
+
+def load_test(base_url: Text, requests: int, concurrency: int, warmup: int) -> Dict[Text, Any]:
+    texts = [text for _, text in load_nlu_examples()]
+    url = base_url.rstrip('/') + PARSE_PATH
+    # The first parses load lazily initialized TensorFlow functions
+    asyncio.run(_post_all(url, texts[:warmup], min(concurrency, warmup or 1)))
+    return asyncio.run(_post_all(url, list(itertools.islice(itertools.cycle(texts), requests)),
+                                 concurrency))
+
+
+def start_rasa_server(port: int, window_ms: float, batch_size: int, model: Optional[Text],
+                      parse_cache: Text = 'off') -> 'subprocess.Popen[bytes]':
+    command = ['rasa', 'run', '--enable-api', '--port', str(port)]
+    if model:
+        command += ['--model', model]
+    env = dict(os.environ, VASPX_NLU_BATCH_WINDOW_MS=str(window_ms),
+               VASPX_NLU_BATCH_SIZE=str(batch_size), VASPX_PARSE_CACHE=parse_cache)
+    return subprocess.Popen(command, cwd=PROJECT_ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def compare(runs: Dict[Text, Dict[Text, Any]], reference: Text) -> Dict[Text, Dict[Text, float]]:
+    """Relative change of every run's throughput and latencies against `reference`"""
+    base = runs[reference]
+    changes = {}
+    for name, run in runs.items():
+        if name == reference:
+            continue
+        changes[name] = {
+            metric: (run[metric] - base[metric]) / base[metric] if base[metric] else 0.0
+            for metric in ('throughput_per_s', 'p50_ms', 'p95_ms', 'p99_ms')
+        }
+    return changes
+
+
+def main(argv: Optional[Sequence[Text]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--windows', type=float, nargs='+', default=[0, 5, 10],
+                        help='batching windows in ms to compare; 0 disables batching '
+                             '(default: 0 5 10)')
+    parser.add_argument('--batch-size', type=int, default=32,
+                        help='most messages per batch (default: 32)')
+    parser.add_argument('--model', help='model to serve (default: latest in models/)')
+    parser.add_argument('--parse-cache', choices=('off', 'recent', 'on'), default='off',
+                        help='VASPX_PARSE_CACHE of the started servers (default: off)')
+    parser.add_argument('--port', type=int, default=5005)
+    parser.add_argument('--url', help='load-test this running server instead of starting one')
+    parser.add_argument('--requests', type=int, default=3000, help='parse calls per run')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--warmup', type=int, default=50, help='untimed calls before each run')
+    parser.add_argument('--startup-timeout', type=float, default=300)
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    args = parser.parse_args(argv)
+
+    runs: Dict[Text, Dict[Text, Any]] = {}
+    if args.url:
+        wait_for_url(args.url, args.startup_timeout)
+        runs['external'] = load_test(args.url, args.requests, args.concurrency, args.warmup)
+    else:
+        base_url = f'http://localhost:{args.port}'
+        for window in args.windows:
+            server = start_rasa_server(args.port, window, args.batch_size, args.model,
+                                       args.parse_cache)
+            try:
+                wait_for_url(base_url, args.startup_timeout)
+                runs[f'window_{window:g}ms'] = load_test(
+                    base_url, args.requests, args.concurrency, args.warmup
+                )
+            finally:
+                server.terminate()
+                server.wait()
+
+    results: Dict[Text, Any] = {'environment': environment(), 'runs': runs}
+    if not args.url:
+        results['parse_cache'] = args.parse_cache
+    if 'window_0ms' in runs and len(runs) > 1:
+        results['change_vs_unbatched'] = compare(runs, 'window_0ms')
+    write_results(results, args.output)
+    return 1 if any(run['errors'] for run in runs.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,234 @@
+"""Evaluate intent classification on a pool of worker processes
+
+By default ``data/nlu.yml`` is split like ``benchmarks.pipeline_bench``
+does (``--training-fraction``, ``--seed``), an NLU model is trained on the
+training part and the held-out part is evaluated. With ``--data`` the
+examples of those files are evaluated on ``--model`` instead. The examples
+are split into shards and parsed by ``--workers`` processes, each of which
+loads the model once, with the parse cache off (``VASPX_PARSE_CACHE``), so
+every message is classified by the model. The results are merged into one
+report with per-intent precision, recall, F1 and latency, the confusion
+matrix (only the cells off the diagonal, as ``{true: {predicted: count}}``)
+and the latency distribution over all messages:
+
+    python -m benchmarks.nlu_eval --output nlu_eval.json
+    python -m benchmarks.nlu_eval --baseline nlu_eval.json
+    python -m benchmarks.nlu_eval --data heldout.yml --model models/current.tar.gz
+
+With ``--baseline`` the intents whose recall or F1 dropped by more than
+``--accuracy-tolerance`` or whose p95 latency rose by more than
+``--latency-tolerance`` (both relative) are listed and the command exits
+non-zero, so it can gate a release. Examples from the training data measure
+fit, not generalization; pass them with ``--data`` only for the former.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Text, Tuple
+
+from benchmarks.common import (
+    NLU_PATH, PROJECT_ROOT, compare_to_baseline, environment, load_nlu_examples, load_results,
+    summarize, write_results,
+)
+from benchmarks.pipeline_bench import CONFIG_PATH, split_nlu
+
+ACCURACY_METRICS = ('recall', 'f1')
+LATENCY_METRICS = ('p95_ms',)
+
+# (true intent, predicted intent, confidence, seconds)
+Prediction = Tuple[Text, Text, float, float]
+
+_agent = None
+_loop = None
+
+
+def _load_worker(model: Optional[Text], threads: int, ready: Any) -> None:
+    """Process pool initializer: load the model once per worker"""
+    global _agent, _loop
+    # Read by Rasa when it configures TensorFlow, so must be set before loading
+    os.environ.setdefault('TF_INTRA_OP_PARALLELISM_THREADS', str(threads))
+    os.environ.setdefault('TF_INTER_OP_PARALLELISM_THREADS', '1')
+    os.environ.setdefault('VASPX_NLU_BATCH_WINDOW_MS', '0')
+    # Read when the model loads; a cached answer is not the model's
+    os.environ['VASPX_PARSE_CACHE'] = 'off'
+    from rasa.core.agent import Agent
+    from rasa.model import get_latest_model
+
+    _agent = Agent.load(model or get_latest_model(os.path.join(PROJECT_ROOT, 'models')))
+    _loop = asyncio.new_event_loop()
+    # The first parse initializes TensorFlow functions lazily
+    _loop.run_until_complete(_agent.parse_message('hello'))
+    # Nothing is timed until every worker got here
+    ready.wait()
+
+
+def _worker_pid(_: int) -> int:
+    return os.getpid()
+
+
+def _parse_shard(shard: Sequence[Tuple[Text, Text]]) -> List[Prediction]:
+    predictions = []
+    for intent, text in shard:
+        started = time.perf_counter()
+        parsed = _loop.run_until_complete(_agent.parse_message(text))
+        elapsed = time.perf_counter() - started
+        predicted = parsed.get('intent') or {}
+        predictions.append(
+            (intent, predicted.get('name') or '', predicted.get('confidence') or 0.0, elapsed)
+        )
+    return predictions
+
+
+def train_nlu(nlu_path: Text, workdir: Text) -> Text:
+    """Path of an NLU-only model trained on `nlu_path` with config.yml"""
+    log_path = os.path.join(workdir, 'train.log')
+    with open(log_path, 'w', encoding='utf-8') as log:
+        returncode = subprocess.call(
+            ['rasa', 'train', 'nlu', '--config', CONFIG_PATH, '--nlu', nlu_path,
+             '--out', workdir, '--fixed-model-name', 'nlu_eval'],
+            cwd=PROJECT_ROOT, stdout=log, stderr=subprocess.STDOUT,
+        )
+    if returncode:
+        raise RuntimeError(f"rasa train nlu failed with {returncode}; see {log_path}")
+    return os.path.join(workdir, 'nlu_eval.tar.gz')
+
+
+def evaluate(examples: Sequence[Tuple[Text, Text]], model: Optional[Text], workers: int,
+             shards_per_worker: int = 4) -> Tuple[List[Prediction], float]:
+    """Predictions for `examples`, parsed on `workers` processes, and the wall time"""
+    count = max(1, workers * shards_per_worker)
+    # Interleaved, so every shard gets a mix of short and long intents
+    shards = [examples[index::count] for index in range(count)]
+    threads = max(1, (os.cpu_count() or 1) // max(1, workers))
+    context = multiprocessing.get_context('spawn')
+    ready = context.Barrier(workers)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_load_worker, initargs=(model, threads, ready)) as pool:
+        # Starts every worker; these only return once all have loaded the model
+        list(pool.map(_worker_pid, range(workers)))
+        started = time.perf_counter()
+        predictions = [
+            prediction for shard in pool.map(_parse_shard, shards) for prediction in shard
+        ]
+        elapsed = time.perf_counter() - started
+    return predictions, elapsed
+
+
+def report(predictions: Sequence[Prediction], elapsed: float) -> Dict[Text, Any]:
+    """Per-intent scores and latencies, confusions and overall figures"""
+    true_positives: Counter = Counter()
+    predicted_counts: Counter = Counter()
+    support: Counter = Counter()
+    confusion: Dict[Text, Counter] = {}
+    latencies: Dict[Text, List[float]] = {}
+    for intent, predicted, _, seconds in predictions:
+        support[intent] += 1
+        predicted_counts[predicted] += 1
+        latencies.setdefault(intent, []).append(seconds)
+        if predicted == intent:
+            true_positives[intent] += 1
+        else:
+            confusion.setdefault(intent, Counter())[predicted] += 1
+
+    intents = {}
+    for intent in sorted(support):
+        precision = (true_positives[intent] / predicted_counts[intent]
+                     if predicted_counts[intent] else 0.0)
+        recall = true_positives[intent] / support[intent]
+        timing = summarize(latencies[intent])
+        intents[intent] = {
+            'support': support[intent],
+            'precision': precision,
+            'recall': recall,
+            'f1': 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+            'p50_ms': timing['p50_ms'],
+            'p95_ms': timing['p95_ms'],
+        }
+
+    correct = sum(true_positives.values())
+    return {
+        'examples': len(predictions),
+        'accuracy': correct / len(predictions) if predictions else 0.0,
+        'macro_f1': (sum(scores['f1'] for scores in intents.values()) / len(intents)
+                     if intents else 0.0),
+        'latency': summarize([seconds for *_, seconds in predictions], elapsed),
+        'intents': intents,
+        'confusion': {
+            intent: dict(predicted.most_common()) for intent, predicted in sorted(confusion.items())
+        },
+    }
+
+
+def flag_changes(current: Dict[Text, Any], baseline: Dict[Text, Any],
+                 accuracy_tolerance: float, latency_tolerance: float) -> List[Text]:
+    """Intents whose accuracy dropped or whose latency rose beyond the tolerances"""
+    return (
+        compare_to_baseline(current['intents'], baseline['intents'], ACCURACY_METRICS,
+                            accuracy_tolerance)
+        + compare_to_baseline(current['intents'], baseline['intents'], LATENCY_METRICS,
+                              latency_tolerance)
+    )
+
+
+def main(argv: Optional[Sequence[Text]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--data', nargs='+',
+                        help='NLU files with the examples to evaluate on --model (default: '
+                             'the held-out split of data/nlu.yml, on a model trained without it)')
+    parser.add_argument('--model',
+                        help='model to evaluate with --data (default: latest in models/)')
+    parser.add_argument('--training-fraction', type=float, default=0.8)
+    parser.add_argument('--seed', type=int, default=42, help='random seed of the NLU split')
+    parser.add_argument('--workdir', help='keep the split, model and logs here (default: a '
+                                          'temporary directory)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='worker processes, each loading the model (default: all cores)')
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    parser.add_argument('--baseline', help='earlier results file to compare against')
+    parser.add_argument('--accuracy-tolerance', type=float, default=0.05,
+                        help='allowed relative drop of an intent\'s recall or F1 (default: 0.05)')
+    parser.add_argument('--latency-tolerance', type=float, default=0.25,
+                        help='allowed relative rise of an intent\'s p95 latency (default: 0.25)')
+    args = parser.parse_args(argv)
+    if args.model and not args.data:
+        parser.error('--model needs --data with examples the model was not trained on')
+
+    if args.data:
+        examples = [example for path in args.data for example in load_nlu_examples(path)]
+        predictions, elapsed = evaluate(examples, args.model, max(1, args.workers))
+        data: Any = [os.path.relpath(path, PROJECT_ROOT) for path in args.data]
+    else:
+        with tempfile.TemporaryDirectory() as temporary:
+            workdir = args.workdir or temporary
+            os.makedirs(workdir, exist_ok=True)
+            nlu_train, nlu_test = split_nlu(workdir, args.training_fraction, args.seed)
+            print(f"Training an NLU model on {nlu_train}", file=sys.stderr)
+            model = train_nlu(nlu_train, workdir)
+            predictions, elapsed = evaluate(load_nlu_examples(nlu_test), model,
+                                            max(1, args.workers))
+        data = {'held_out': os.path.relpath(NLU_PATH, PROJECT_ROOT),
+                'training_fraction': args.training_fraction, 'seed': args.seed}
+    results = report(predictions, elapsed)
+    results['environment'] = environment()
+    results['workers'] = args.workers
+    results['data'] = data
+    write_results(results, args.output)
+
+    if not args.baseline:
+        return 0
+    changes = flag_changes(results, load_results(args.baseline), args.accuracy_tolerance,
+                           args.latency_tolerance)
+    for line in changes:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if changes else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""Check the NumPy intent classifier against the model it was exported from
+
+Parses every example in ``data/nlu.yml`` with the trained Rasa model and
+with the file ``addons.numpy_export`` wrote from it, with the parse cache
+off (``VASPX_PARSE_CACHE``) so every text reaches DIET, and reports how often
+the top intent differs and the largest confidence difference over the
+ranked intents. The run fails when any top intent differs or a confidence
+is off by more than ``--tolerance``:
+
+    python -m addons.numpy_export --output models/nlu.vxnp
+    python -m benchmarks.numpy_nlu_bench --numpy-model models/nlu.vxnp
+
+Both classifiers are also started in fresh child processes to compare
+their cost: seconds to import and load, seconds for the first parse, peak
+RSS, and per-message latency over the same texts. Each child reads its own
+peak RSS (``VmHWM``); ``ru_maxrss`` from ``wait4`` would carry over the
+parent's peak across fork and exec, and the children are started before
+the parent loads anything.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Sequence, Text
+
+from benchmarks.common import (
+    PROJECT_ROOT, environment, load_nlu_examples, load_results, summarize, write_results,
+)
+
+DEFAULT_NUMPY_MODEL = os.path.join(PROJECT_ROOT, 'models', 'nlu.vxnp')
+
+
+def _disable_parse_cache() -> None:
+    # Read when the model loads; the cache answers training examples with
+    # confidence 1.0 instead of DIET's ranking
+    os.environ['VASPX_PARSE_CACHE'] = 'off'
+
+
+def _latest_model() -> Text:
+    from rasa.model import get_latest_model
+
+    return get_latest_model(os.path.join(PROJECT_ROOT, 'models'))
+
+
+def _confidences(result: Dict[Text, Any]) -> Dict[Text, float]:
+    return {ranked['name']: ranked['confidence'] for ranked in result.get('intent_ranking') or []}
+
+
+def parity(model: Text, numpy_model: Text, texts: Sequence[Text],
+           tolerance: float) -> Dict[Text, Any]:
+    """Top-intent agreement and confidence differences over `texts`"""
+    from rasa.core.agent import Agent
+
+    from addons.numpy_nlu import NumpyIntentClassifier
+
+    _disable_parse_cache()
+    agent = Agent.load(model)
+    classifier = NumpyIntentClassifier.load(numpy_model)
+
+    async def parse_all() -> List[Dict[Text, Any]]:
+        return [await agent.parse_message(text) for text in texts]
+
+    mismatches = []
+    max_difference = 0.0
+    over_tolerance = 0
+    for text, expected in zip(texts, asyncio.run(parse_all())):
+        actual = classifier.parse(text)
+        expected_confidences = _confidences(expected)
+        actual_confidences = _confidences(actual)
+        difference = max(
+            (abs(confidence - actual_confidences[name])
+             for name, confidence in expected_confidences.items() if name in actual_confidences),
+            default=0.0,
+        )
+        max_difference = max(max_difference, difference)
+        over_tolerance += difference > tolerance
+        if expected['intent'].get('name') != actual['intent']['name']:
+            mismatches.append({
+                'text': text,
+                'rasa': [expected['intent'].get('name'), expected['intent'].get('confidence')],
+                'numpy': [actual['intent']['name'], actual['intent']['confidence']],
+            })
+    return {
+        'texts': len(texts),
+        'top_intent_agreement': 1 - len(mismatches) / len(texts) if texts else 1.0,
+        'top_intent_mismatches': mismatches,
+        'max_confidence_difference': max_difference,
+        'over_tolerance': over_tolerance,
+        'tolerance': tolerance,
+    }
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """This process's own peak resident set size, from /proc (Linux only)"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def child(kind: Text, model: Text, texts: Sequence[Text], output: Text) -> int:
+    """Load one classifier from scratch and time it; run in a fresh process"""
+    started = time.perf_counter()
+    if kind == 'rasa':
+        from rasa.core.agent import Agent
+
+        _disable_parse_cache()
+        agent = Agent.load(model)
+
+        def parse(text: Text) -> Any:
+            return asyncio.run(agent.parse_message(text))
+    else:
+        from addons.numpy_nlu import NumpyIntentClassifier
+
+        parse = NumpyIntentClassifier.load(model).parse
+    loaded = time.perf_counter()
+    parse(texts[0])
+    first_parse = time.perf_counter()
+
+    durations = []
+    for text in texts:
+        text_started = time.perf_counter()
+        parse(text)
+        durations.append(time.perf_counter() - text_started)
+    result = summarize(durations)
+    result.update(load_s=loaded - started, first_parse_s=first_parse - loaded,
+                  peak_rss_mb=_peak_rss_mb())
+    write_results(result, output)
+    return 0
+
+
+def measure(kind: Text, model: Text, workdir: Text) -> Dict[Text, Any]:
+    """Startup time, peak RSS and latency of `kind` in a child process"""
+    output = os.path.join(workdir, f'{kind}.json')
+    command = [sys.executable, '-m', 'benchmarks.numpy_nlu_bench', '--child', kind,
+               '--child-model', model, '--output', output]
+    started = time.perf_counter()
+    returncode = subprocess.call(command, cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL)
+    if returncode:
+        raise RuntimeError(f"{' '.join(command)} failed with {returncode}")
+    result = load_results(output)
+    result.update(process_s=time.perf_counter() - started)
+    return result
+
+
+def main(argv: Optional[Sequence[Text]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--model', help='trained Rasa model (default: latest in models/)')
+    parser.add_argument('--numpy-model', default=DEFAULT_NUMPY_MODEL,
+                        help='file written by addons.numpy_export')
+    parser.add_argument('--tolerance', type=float, default=1e-4,
+                        help='largest confidence difference allowed (default: 1e-4)')
+    parser.add_argument('--skip-startup', action='store_true',
+                        help='only check parity, without the child process runs')
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    parser.add_argument('--child', choices=('rasa', 'numpy'), help=argparse.SUPPRESS)
+    parser.add_argument('--child-model', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    texts = [text for _, text in load_nlu_examples()]
+    if args.child:
+        return child(args.child, args.child_model, texts, args.output)
+
+    model = args.model or _latest_model()
+    results: Dict[Text, Any] = {'environment': environment(), 'model': os.path.basename(model)}
+    if not args.skip_startup:
+        # Before parity() loads Rasa here, so the children start from a small parent
+        with tempfile.TemporaryDirectory() as workdir:
+            results['startup'] = {
+                'rasa': measure('rasa', model, workdir),
+                'numpy': measure('numpy', args.numpy_model, workdir),
+            }
+    results['parity'] = parity(model, args.numpy_model, texts, args.tolerance)
+    write_results(results, args.output)
+
+    report = results['parity']
+    print(f"Top intent agreement {report['top_intent_agreement']:.2%} over {report['texts']} "
+          f"texts; largest confidence difference {report['max_confidence_difference']:.2e}",
+          file=sys.stderr)
+    for name, run in (results.get('startup') or {}).items():
+        rss = 'n/a' if run['peak_rss_mb'] is None else f"{run['peak_rss_mb']:.0f}MB"
+        print(f"{name}: load {run['load_s']:.2f}s, first parse {run['first_parse_s'] * 1000:.1f}ms, "
+              f"peak RSS {rss}, p50 {run['p50_ms']:.2f}ms, "
+              f"p95 {run['p95_ms']:.2f}ms", file=sys.stderr)
+    return 1 if report['top_intent_mismatches'] or report['over_tolerance'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
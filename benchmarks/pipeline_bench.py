@@ -0,0 +1,281 @@
+"""Compare pipeline and policy variants on cost and accuracy
+
+Each variant declared in ``benchmarks/variants.yml`` is derived from
+``config.yml``, trained on ``data/`` with a held-out NLU split left out, and
+measured for
+
+* training wall time and peak RSS,
+* model tarball size,
+* per-message inference latency and peak RSS of a process serving the model,
+* intent F1 (weighted) on the held-out NLU split, and
+* action F1 (weighted) and conversation accuracy on ``tests/test_stories.yml``.
+
+Training and evaluation run through the ``rasa`` CLI in child processes, so
+every variant is measured from a cold start:
+
+    python -m benchmarks.pipeline_bench --variants baseline epochs_100 --min-f1 0.9
+
+The results are written as JSON plus a markdown table. With ``--min-f1`` the
+fastest variant whose intent F1 meets the bar is named at the end.
+"""
+import argparse
+import copy
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence, Text, Tuple
+
+import yaml
+
+from benchmarks.common import (
+    PROJECT_ROOT, environment, load_nlu_examples, summarize, write_results,
+)
+
+CONFIG_PATH = os.path.join(PROJECT_ROOT, 'config.yml')
+VARIANTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'variants.yml')
+TEST_STORIES_PATH = os.path.join(PROJECT_ROOT, 'tests', 'test_stories.yml')
+
+TABLE_COLUMNS = (
+    ('variant', 'variant', '{}'),
+    ('train_s', 'train s', '{:.1f}'),
+    ('model_mb', 'model MB', '{:.2f}'),
+    ('train_rss_mb', 'train RSS MB', '{:.0f}'),
+    ('serve_rss_mb', 'serve RSS MB', '{:.0f}'),
+    ('p50_ms', 'p50 ms', '{:.2f}'),
+    ('p95_ms', 'p95 ms', '{:.2f}'),
+    ('intent_f1', 'intent F1', '{:.3f}'),
+    ('action_f1', 'action F1', '{:.3f}'),
+    ('conversation_accuracy', 'story acc', '{:.3f}'),
+)
+
+
+def load_variants(path: Text = VARIANTS_PATH) -> Dict[Text, Dict[Text, Any]]:
+    with open(path, encoding='utf-8') as variants_file:
+        return (yaml.safe_load(variants_file) or {}).get('variants') or {}
+
+
+# Prefixes of the addons subclasses that stand in for stock components
+_ADDON_PREFIXES = ('Cached', 'FastPath')
+
+
+def _class_name(entry: Dict[Text, Any]) -> Text:
+    name = str(entry.get('name', '')).rsplit('.', 1)[-1]
+    for prefix in _ADDON_PREFIXES:
+        if name.startswith(prefix):
+            return name[len(prefix):]
+    return name
+
+
+def matches(entry: Dict[Text, Any], selector: Dict[Text, Any]) -> bool:
+    """Whether a pipeline or policy entry is picked by `selector`"""
+    if _class_name(entry) != selector.get('name'):
+        return False
+    return all(entry.get(key) == value for key, value in selector.items() if key != 'name')
+
+
+def apply_variant(config: Dict[Text, Any], variant: Dict[Text, Any]) -> Dict[Text, Any]:
+    """Copy of `config` with the variant's edits applied"""
+    config = copy.deepcopy(config)
+    for section in ('pipeline', 'policies'):
+        entries: List[Dict[Text, Any]] = config.get(section) or []
+        for edit in variant.get('set') or []:
+            for entry in entries:
+                if matches(entry, edit['match']):
+                    entry.update(edit['params'])
+        for selector in variant.get('remove') or []:
+            entries = [entry for entry in entries if not matches(entry, selector)]
+        for edit in variant.get('replace') or []:
+            entries = [
+                dict(edit['with']) if matches(entry, edit['match']) else entry for entry in entries
+            ]
+        if section in config:
+            config[section] = entries
+    return config
+
+
+def _run(command: Sequence[Text], log_path: Text) -> Tuple[float, float]:
+    """Run `command`, returning its wall time in seconds and peak RSS in MB"""
+    started = time.perf_counter()
+    with open(log_path, 'w', encoding='utf-8') as log:
+        process = subprocess.Popen(command, cwd=PROJECT_ROOT, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - started
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode:
+        raise RuntimeError(f"{' '.join(command)} failed with {process.returncode}; see {log_path}")
+    # ru_maxrss is in kilobytes on Linux
+    return elapsed, usage.ru_maxrss / 1024
+
+
+def split_nlu(workdir: Text, training_fraction: float, seed: int) -> Tuple[Text, Text]:
+    """Training and held-out NLU files, split once for all variants"""
+    out = os.path.join(workdir, 'split')
+    _run(['rasa', 'data', 'split', 'nlu', '--nlu', os.path.join(PROJECT_ROOT, 'data', 'nlu.yml'),
+          '--training-fraction', str(training_fraction), '--random-seed', str(seed), '--out', out],
+         os.path.join(workdir, 'split.log'))
+    training = glob.glob(os.path.join(out, 'training_data.*'))
+    test = glob.glob(os.path.join(out, 'test_data.*'))
+    if not training or not test:
+        raise RuntimeError(f"rasa data split wrote no training/test files to {out}")
+    return training[0], test[0]
+
+
+def held_out_texts(path: Text) -> List[Text]:
+    return [text for _, text in load_nlu_examples(path)]
+
+
+def _read_json(path: Text) -> Dict[Text, Any]:
+    try:
+        with open(path, encoding='utf-8') as report:
+            return json.load(report)
+    except (OSError, ValueError):
+        return {}
+
+
+def bench_variant(name: Text, config: Dict[Text, Any], workdir: Text, nlu_train: Text,
+                  nlu_test: Text) -> Dict[Text, Any]:
+    directory = os.path.join(workdir, name)
+    os.makedirs(directory, exist_ok=True)
+    config_path = os.path.join(directory, 'config.yml')
+    with open(config_path, 'w', encoding='utf-8') as config_file:
+        yaml.safe_dump(config, config_file, sort_keys=False)
+
+    result: Dict[Text, Any] = {'variant': name}
+    train_s, train_rss = _run(
+        ['rasa', 'train', '--config', config_path,
+         '--domain', os.path.join(PROJECT_ROOT, 'domain.yml'),
+         '--data', nlu_train, os.path.join(PROJECT_ROOT, 'data', 'stories.yml'),
+         os.path.join(PROJECT_ROOT, 'data', 'rules.yml'),
+         '--out', directory, '--fixed-model-name', name],
+        os.path.join(directory, 'train.log'),
+    )
+    model = os.path.join(directory, f'{name}.tar.gz')
+    result.update(train_s=train_s, train_rss_mb=train_rss,
+                  model_mb=os.path.getsize(model) / (1024 * 1024))
+
+    latency_path = os.path.join(directory, 'latency.json')
+    _, serve_rss = _run(
+        [sys.executable, '-m', 'benchmarks.pipeline_bench', '--infer', model,
+         '--texts', nlu_test, '--output', latency_path],
+        os.path.join(directory, 'infer.log'),
+    )
+    latency = _read_json(latency_path)
+    result.update(serve_rss_mb=serve_rss, p50_ms=latency.get('p50_ms'),
+                  p95_ms=latency.get('p95_ms'), p99_ms=latency.get('p99_ms'))
+
+    nlu_out = os.path.join(directory, 'nlu_results')
+    _run(['rasa', 'test', 'nlu', '--model', model, '--nlu', nlu_test, '--out', nlu_out],
+         os.path.join(directory, 'test_nlu.log'))
+    intent_report = _read_json(os.path.join(nlu_out, 'intent_report.json'))
+    result['intent_f1'] = (intent_report.get('weighted avg') or {}).get('f1-score')
+
+    core_out = os.path.join(directory, 'core_results')
+    _run(['rasa', 'test', 'core', '--model', model, '--stories', TEST_STORIES_PATH,
+          '--out', core_out], os.path.join(directory, 'test_core.log'))
+    story_report = _read_json(os.path.join(core_out, 'story_report.json'))
+    result['action_f1'] = (story_report.get('weighted avg') or {}).get('f1-score')
+    result['conversation_accuracy'] = (
+        story_report.get('conversation_accuracy') or {}
+    ).get('accuracy')
+    return result
+
+
+def infer(model: Text, texts_path: Text, output: Text) -> int:
+    """Parse every held-out text once with `model`, recording per-message latency"""
+    import asyncio
+
+    from rasa.core.agent import Agent
+
+    agent = Agent.load(model)
+    texts = held_out_texts(texts_path)
+
+    async def parse_all() -> List[float]:
+        # One untimed parse builds TensorFlow's inference functions
+        await agent.parse_message(texts[0])
+        durations = []
+        for text in texts:
+            started = time.perf_counter()
+            await agent.parse_message(text)
+            durations.append(time.perf_counter() - started)
+        return durations
+
+    write_results(summarize(asyncio.run(parse_all())), output)
+    return 0
+
+
+def markdown_table(rows: Sequence[Dict[Text, Any]]) -> Text:
+    lines = [
+        '| ' + ' | '.join(title for _, title, _ in TABLE_COLUMNS) + ' |',
+        '|' + '|'.join('---' for _ in TABLE_COLUMNS) + '|',
+    ]
+    for row in rows:
+        cells = [
+            '-' if row.get(key) is None else template.format(row[key])
+            for key, _, template in TABLE_COLUMNS
+        ]
+        lines.append('| ' + ' | '.join(cells) + ' |')
+    return '\n'.join(lines)
+
+
+def pick_fastest(rows: Sequence[Dict[Text, Any]], min_f1: float) -> Optional[Dict[Text, Any]]:
+    """Lowest p95 latency among variants whose intent F1 is at least `min_f1`"""
+    eligible = [
+        row for row in rows
+        if row.get('intent_f1') is not None and row['intent_f1'] >= min_f1
+        and row.get('p95_ms') is not None
+    ]
+    return min(eligible, key=lambda row: row['p95_ms'], default=None)
+
+
+def main(argv: Optional[Sequence[Text]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--variants', nargs='*', help='only these variants (default: all)')
+    parser.add_argument('--variants-file', default=VARIANTS_PATH)
+    parser.add_argument('--workdir', default=os.path.join(PROJECT_ROOT, 'pipeline_bench'),
+                        help='where configs, models, logs and reports go')
+    parser.add_argument('--training-fraction', type=float, default=0.8)
+    parser.add_argument('--seed', type=int, default=42, help='random seed of the NLU split')
+    parser.add_argument('--min-f1', type=float, help='accuracy bar for picking a variant')
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    parser.add_argument('--infer', metavar='MODEL', help=argparse.SUPPRESS)
+    parser.add_argument('--texts', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.infer:
+        return infer(args.infer, args.texts, args.output)
+
+    with open(CONFIG_PATH, encoding='utf-8') as config_file:
+        base_config = yaml.safe_load(config_file)
+    variants = load_variants(args.variants_file)
+    names = args.variants or list(variants)
+    unknown = [name for name in names if name not in variants]
+    if unknown:
+        parser.error(f"unknown variant(s): {', '.join(unknown)}")
+
+    os.makedirs(args.workdir, exist_ok=True)
+    nlu_train, nlu_test = split_nlu(args.workdir, args.training_fraction, args.seed)
+    rows = []
+    for name in names:
+        print(f"Benchmarking variant '{name}'", file=sys.stderr)
+        rows.append(bench_variant(
+            name, apply_variant(base_config, variants[name]), args.workdir, nlu_train, nlu_test
+        ))
+
+    results: Dict[Text, Any] = {'environment': environment(), 'variants': rows}
+    if args.min_f1 is not None:
+        best = pick_fastest(rows, args.min_f1)
+        results['fastest_meeting_bar'] = best['variant'] if best else None
+    write_results(results, args.output)
+
+    print(markdown_table(rows), file=sys.stderr)
+    if args.min_f1 is not None:
+        choice = results['fastest_meeting_bar'] or 'none'
+        print(f"Fastest variant with intent F1 >= {args.min_f1}: {choice}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
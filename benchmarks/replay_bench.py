@@ -0,0 +1,450 @@
+"""Replay the stories as conversation load against a running assistant
+
+Every story in ``data/stories.yml`` and ``tests/test_stories.yml`` becomes a
+script of user turns, each with the bot actions the story expects after it.
+Steps that only name an intent are given an utterance of that intent from
+``data/nlu.yml`` (or sent as ``/intent`` with ``--direct-intents``, which
+skips NLU). Each session replays one script under a fresh sender id over the
+REST channel configured in ``credentials.yml``:
+
+    python -m benchmarks.replay_bench --sessions 500 --concurrency 32 --ramp-up 10
+    python -m benchmarks.replay_bench --start-servers --output replay.json
+
+``--concurrency`` sessions run at once; they start evenly spread over
+``--ramp-up`` seconds. After a session its tracker is fetched from
+``/conversations/<sender>/tracker`` (outside the timings) to check the
+executed actions against the story and to split every turn's latency using
+the event timestamps:
+
+* ``nlu`` from sending the message to the user event, which includes
+  fetching the tracker and starting the session,
+* ``policy`` for predicting the next actions and running the ones handled
+  inside the Rasa server (responses, ``action_listen``),
+* ``action_server`` for the calls to the custom action server, and
+* ``other`` for the rest of the request, mostly sending the reply.
+
+The action server time is measured by a small proxy the tester puts in front
+of the action server. ``--start-servers`` points the Rasa server at it; for a
+server started separately set ``ACTIONS_SERVER_URL`` to
+``http://localhost:<--proxy-port>/webhook``. Without the proxy the time of a
+custom action's prediction and call both count as ``action_server``. The
+clocks only agree when the servers run on this machine.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Sequence, Text, Tuple
+
+import yaml
+
+from benchmarks.common import (
+    PROJECT_ROOT, environment, load_domain, load_nlu_examples, summarize, wait_for_url,
+    write_results,
+)
+
+STORY_PATHS = (
+    os.path.join(PROJECT_ROOT, 'data', 'stories.yml'),
+    os.path.join(PROJECT_ROOT, 'tests', 'test_stories.yml'),
+)
+CREDENTIALS_PATH = os.path.join(PROJECT_ROOT, 'credentials.yml')
+
+SERVER_URL = 'http://localhost:5005'
+ACTION_SERVER_URL = 'http://localhost:5055/webhook'
+
+# Run by the Rasa server around the story's own actions
+IGNORED_ACTIONS = ('action_listen', 'action_session_start', 'action_unlikely_intent')
+PHASES = ('nlu', 'policy', 'action_server', 'other')
+
+Turn = Tuple[Text, List[Text]]
+Script = Tuple[Text, List[Turn]]
+
+
+def _user_text(step: Dict[Text, Any], examples: Dict[Text, Iterable[Text]],
+               direct_intents: bool) -> Text:
+    if step.get('user'):
+        return str(step['user']).strip()
+    intent = step['intent']
+    if not direct_intents and intent in examples:
+        return next(examples[intent])
+    return f'/{intent}'
+
+
+def load_scripts(paths: Sequence[Text] = STORY_PATHS, direct_intents: bool = False,
+                 seed: int = 0) -> List[Script]:
+    """(story name, [(user text, expected actions), ...]) for every story in `paths`
+
+    ``or`` steps replay their first alternative; checkpoints, slot and loop
+    steps are not sent. Actions a story expects before its first user turn
+    are dropped, since nothing triggers them over the channel.
+    """
+    rng = random.Random(seed)
+    by_intent: Dict[Text, List[Text]] = {}
+    for intent, text in load_nlu_examples():
+        by_intent.setdefault(intent, []).append(text)
+    examples = {}
+    for intent, texts in by_intent.items():
+        rng.shuffle(texts)
+        examples[intent] = itertools.cycle(texts)
+
+    scripts = []
+    for path in paths:
+        with open(path, encoding='utf-8') as story_file:
+            data = yaml.safe_load(story_file) or {}
+        for story in data.get('stories') or []:
+            turns: List[Turn] = []
+            for step in story.get('steps') or []:
+                if 'or' in step:
+                    step = step['or'][0]
+                if 'intent' in step or 'user' in step:
+                    turns.append((_user_text(step, examples, direct_intents), []))
+                elif 'action' in step and turns and step['action'] not in IGNORED_ACTIONS:
+                    turns[-1][1].append(step['action'])
+            if turns:
+                scripts.append((story['story'], turns))
+    return scripts
+
+
+def rest_webhook_url(base_url: Text, credentials_path: Text = CREDENTIALS_PATH) -> Text:
+    """URL of the REST channel, which must be enabled in credentials.yml"""
+    with open(credentials_path, encoding='utf-8') as credentials_file:
+        credentials = yaml.safe_load(credentials_file) or {}
+    if 'rest' not in credentials:
+        raise ValueError(f"The rest channel is not enabled in {credentials_path}")
+    return base_url.rstrip('/') + '/webhooks/rest/webhook'
+
+
+class ActionProxy:
+    """Forwards action server calls and remembers how long each one took per sender"""
+
+    def __init__(self, upstream: Text, port: int) -> None:
+        self.upstream = upstream
+        self.port = port
+        self.durations: Dict[Text, Deque[Tuple[Text, float]]] = {}
+        self._runner = None
+        self._session = None
+
+    async def start(self) -> None:
+        import aiohttp
+        from aiohttp import web
+
+        self._session = aiohttp.ClientSession()
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route('*', '/{path:.*}', self._forward)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, 'localhost', self.port).start()
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+        if self._session is not None:
+            await self._session.close()
+
+    async def _forward(self, request: Any) -> Any:
+        from aiohttp import web
+
+        body = await request.read()
+        url = self.upstream.rsplit('/', 1)[0] + request.path_qs
+        started = time.perf_counter()
+        async with self._session.request(request.method, url, data=body,
+                                          headers={'Content-Type': 'application/json'}) as response:
+            payload = await response.read()
+            status = response.status
+        elapsed = time.perf_counter() - started
+        if request.method == 'POST' and request.path.endswith('/webhook'):
+            call = await request.json()
+            self.durations.setdefault(call.get('sender_id'), deque()).append(
+                (call.get('next_action'), elapsed)
+            )
+        return web.Response(body=payload, status=status, content_type='application/json')
+
+    def take(self, sender_id: Text, action_name: Text) -> Optional[float]:
+        """Duration of the next recorded call of `action_name` for `sender_id`"""
+        calls = self.durations.get(sender_id)
+        if calls and calls[0][0] == action_name:
+            return calls.popleft()[1]
+        return None
+
+
+def split_turns(events: List[Dict[Text, Any]], sent_at: Sequence[float],
+                custom_actions: Sequence[Text], proxy: Optional[ActionProxy],
+                sender_id: Text) -> List[Dict[Text, Any]]:
+    """Executed actions and per-phase seconds for each turn of a finished session"""
+    turns: List[Dict[Text, Any]] = []
+    previous = 0.0
+    for event in events:
+        kind = event.get('event')
+        if kind == 'user':
+            if len(turns) == len(sent_at):
+                break
+            previous = event['timestamp']
+            turns.append({
+                'actions': [],
+                'nlu': max(0.0, previous - sent_at[len(turns)]),
+                'policy': 0.0,
+                'action_server': 0.0,
+            })
+        elif kind == 'action' and turns:
+            name = event.get('name')
+            gap = max(0.0, event['timestamp'] - previous)
+            previous = event['timestamp']
+            if name not in IGNORED_ACTIONS:
+                turns[-1]['actions'].append(name)
+            if name in custom_actions:
+                called = proxy.take(sender_id, name) if proxy is not None else None
+                called = gap if called is None else min(called, gap)
+                turns[-1]['action_server'] += called
+                turns[-1]['policy'] += gap - called
+            else:
+                turns[-1]['policy'] += gap
+    return turns
+
+
+class Replay:
+    """Sessions replaying the scripts, with their timings and mismatches"""
+
+    def __init__(self, server_url: Text, scripts: Sequence[Script], sessions: int,
+                 concurrency: int, ramp_up: float, think_time: float,
+                 proxy: Optional[ActionProxy], max_mismatches: int = 20) -> None:
+        self.server_url = server_url.rstrip('/')
+        self.webhook_url = rest_webhook_url(server_url)
+        self.scripts = scripts
+        self.sessions = sessions
+        self.concurrency = max(1, concurrency)
+        self.ramp_up = ramp_up
+        self.think_time = think_time
+        self.proxy = proxy
+        self.max_mismatches = max_mismatches
+        self.custom_actions = [
+            name for name in load_domain().get('actions') or [] if not name.startswith('utter_')
+        ]
+        self.run_id = uuid.uuid4().hex[:8]
+
+        self.latencies: List[float] = []
+        self.steady_latencies: List[float] = []
+        self.phases: Dict[Text, List[float]] = {phase: [] for phase in PHASES}
+        self.checked = 0
+        self.mismatches: List[Dict[Text, Any]] = []
+        self.mismatched = 0
+        self.errors = 0
+        self.completed_sessions = 0
+        self._started = 0.0
+
+    async def run(self) -> Dict[Text, Any]:
+        import aiohttp
+
+        queue: 'asyncio.Queue[Tuple[int, Script]]' = asyncio.Queue()
+        for index, script in zip(range(self.sessions), itertools.cycle(self.scripts)):
+            queue.put_nowait((index, script))
+
+        async def worker(delay: float, session: 'aiohttp.ClientSession') -> None:
+            await asyncio.sleep(delay)
+            while not queue.empty():
+                index, script = queue.get_nowait()
+                await self._session(session, f'replay-{self.run_id}-{index}', script)
+
+        self._started = time.perf_counter()
+        connector = aiohttp.TCPConnector(limit=self.concurrency + 4)
+        timeout = aiohttp.ClientTimeout(total=120)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            await asyncio.gather(*(
+                worker(self.ramp_up * slot / self.concurrency, session)
+                for slot in range(self.concurrency)
+            ))
+        return self.report(time.perf_counter() - self._started)
+
+    async def _session(self, session: Any, sender_id: Text, script: Script) -> None:
+        try:
+            await self._converse(session, sender_id, script)
+        finally:
+            if self.proxy is not None:
+                self.proxy.durations.pop(sender_id, None)
+
+    async def _converse(self, session: Any, sender_id: Text, script: Script) -> None:
+        import aiohttp
+
+        name, turns = script
+        sent_at = []
+        latencies = []
+        for text, _ in turns:
+            sent_at.append(time.time())
+            started = time.perf_counter()
+            try:
+                async with session.post(self.webhook_url,
+                                        json={'sender': sender_id, 'message': text}) as response:
+                    await response.read()
+                    ok = response.status == 200
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                ok = False
+            if not ok:
+                self.errors += 1
+                return
+            latency = time.perf_counter() - started
+            latencies.append(latency)
+            self.latencies.append(latency)
+            if started - self._started >= self.ramp_up:
+                self.steady_latencies.append(latency)
+            if self.think_time:
+                await asyncio.sleep(self.think_time)
+
+        url = f'{self.server_url}/conversations/{sender_id}/tracker'
+        try:
+            async with session.get(url) as response:
+                tracker = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            self.errors += 1
+            return
+        self.completed_sessions += 1
+
+        executed = split_turns(tracker.get('events') or [], sent_at, self.custom_actions,
+                               self.proxy, sender_id)
+        for number, ((text, expected), turn, latency) in enumerate(
+                zip(turns, executed, latencies), start=1):
+            for phase in ('nlu', 'policy', 'action_server'):
+                self.phases[phase].append(turn[phase])
+            self.phases['other'].append(
+                max(0.0, latency - turn['nlu'] - turn['policy'] - turn['action_server'])
+            )
+            self.checked += 1
+            if turn['actions'] != expected:
+                self.mismatched += 1
+                if len(self.mismatches) < self.max_mismatches:
+                    self.mismatches.append({
+                        'story': name, 'turn': number, 'text': text,
+                        'expected': expected, 'actual': turn['actions'],
+                    })
+
+    def report(self, elapsed: float) -> Dict[Text, Any]:
+        steady_elapsed = elapsed - self.ramp_up
+        result = {
+            'sessions': self.completed_sessions,
+            'sessions_per_s': self.completed_sessions / elapsed if elapsed else 0.0,
+            'errors': self.errors,
+            'concurrency': self.concurrency,
+            'ramp_up_s': self.ramp_up,
+            'elapsed_s': elapsed,
+            'turns': summarize(self.latencies, elapsed),
+            'phases': {phase: summarize(samples) for phase, samples in self.phases.items()},
+            'expected_actions': {
+                'checked_turns': self.checked,
+                'mismatched_turns': self.mismatched,
+                'examples': self.mismatches,
+            },
+        }
+        if self.ramp_up and steady_elapsed > 0:
+            result['after_ramp_up'] = summarize(self.steady_latencies, steady_elapsed)
+        for phase in result['phases'].values():
+            # Phase samples are per turn, not a rate
+            del phase['throughput_per_s']
+        return result
+
+
+async def _replay(replays: Sequence[Replay], proxy: Optional[ActionProxy]) -> Dict[Text, Any]:
+    """Run `replays` one after the other and return the results of the last"""
+    if proxy is not None:
+        await proxy.start()
+    try:
+        for replay in replays:
+            result = await replay.run()
+        return result
+    finally:
+        if proxy is not None:
+            await proxy.stop()
+
+
+def start_servers(port: int, action_url: Text, actions_via: Text, model: Optional[Text],
+                  workers: int = 1) -> List['subprocess.Popen[bytes]']:
+    """A local action server behind `actions_via` and a Rasa server using it
+
+    `workers` Rasa server processes share the port; more than one needs the
+    local lock store from endpoints.yml.
+    """
+    action_port = action_url.split(':')[-1].split('/')[0]
+    command = ['rasa', 'run', '--enable-api', '--port', str(port)]
+    if model:
+        command += ['--model', model]
+    return [
+        subprocess.Popen(
+            [sys.executable, '-m', 'actions.server', '--actions', 'actions', '--port', action_port],
+            cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ),
+        subprocess.Popen(
+            command, cwd=PROJECT_ROOT,
+            env=dict(os.environ, ACTIONS_SERVER_URL=actions_via, SANIC_WORKERS=str(workers)),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ),
+    ]
+
+
+def main(argv: Optional[Sequence[Text]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', default=SERVER_URL, help=f'Rasa server (default: {SERVER_URL})')
+    parser.add_argument('--sessions', type=int, default=200,
+                        help='conversations to replay, cycling through the stories (default: 200)')
+    parser.add_argument('--concurrency', type=int, default=16,
+                        help='conversations in flight at once (default: 16)')
+    parser.add_argument('--ramp-up', type=float, default=0.0,
+                        help='seconds over which the concurrent conversations start (default: 0)')
+    parser.add_argument('--think-time', type=float, default=0.0,
+                        help='seconds between a reply and the next message (default: 0)')
+    parser.add_argument('--stories', nargs='*', default=list(STORY_PATHS),
+                        help='story files to replay (default: data/stories.yml and '
+                             'tests/test_stories.yml)')
+    parser.add_argument('--direct-intents', action='store_true',
+                        help="send intent-only steps as '/intent' instead of an NLU example")
+    parser.add_argument('--seed', type=int, default=0, help='seed for picking NLU examples')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed sessions before the run')
+    parser.add_argument('--action-server', default=ACTION_SERVER_URL,
+                        help=f'action server behind the proxy (default: {ACTION_SERVER_URL})')
+    parser.add_argument('--proxy-port', type=int, default=5054,
+                        help='port of the timing proxy for the action server (default: 5054)')
+    parser.add_argument('--no-proxy', action='store_true',
+                        help='do not measure action server calls separately')
+    parser.add_argument('--start-servers', action='store_true',
+                        help='start a local Rasa server and action server for the run')
+    parser.add_argument('--model', help='model for --start-servers (default: latest in models/)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Rasa server processes for --start-servers (default: 1)')
+    parser.add_argument('--startup-timeout', type=float, default=300)
+    parser.add_argument('--max-mismatches', type=int, default=20,
+                        help='mismatched turns listed in the results (default: 20)')
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    args = parser.parse_args(argv)
+
+    scripts = load_scripts(args.stories, args.direct_intents, args.seed)
+    proxy_url = f'http://localhost:{args.proxy_port}/webhook'
+    servers = []
+    if args.start_servers:
+        port = int(args.url.split(':')[-1].split('/')[0])
+        servers = start_servers(port, args.action_server,
+                                args.action_server if args.no_proxy else proxy_url, args.model,
+                                args.workers)
+    try:
+        wait_for_url(args.action_server.rsplit('/', 1)[0] + '/health', args.startup_timeout)
+        wait_for_url(args.url, args.startup_timeout)
+        proxy = None if args.no_proxy else ActionProxy(args.action_server, args.proxy_port)
+        # Untimed sessions first, so lazily initialized models stay out of the run
+        replays = [Replay(args.url, scripts, args.warmup, 1, 0.0, 0.0, proxy)] if args.warmup else []
+        replays.append(Replay(args.url, scripts, args.sessions, args.concurrency, args.ramp_up,
+                              args.think_time, proxy, args.max_mismatches))
+        result = asyncio.run(_replay(replays, proxy))
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+    result['stories'] = len(scripts)
+    result['direct_intents'] = args.direct_intents
+    write_results({'environment': environment(), 'replay': result}, args.output)
+    return 1 if result['errors'] or result['expected_actions']['mismatched_turns'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,288 @@
+"""Measure how throughput scales with Rasa server worker processes
+
+Two runs, either or both:
+
+* ``--workers`` starts a Rasa server with each number of worker processes
+  (``SANIC_WORKERS``), sharing the local lock store and tracker store from
+  ``endpoints.yml``, plus an action server, and replays the stories against
+  it at a fixed concurrency (see ``replay_bench.py``). It reports
+  conversations and turns per second, turn latency, the speedup and
+  efficiency against the first worker count, and errors and turns whose
+  actions differ from the story, which is where two workers handling one
+  conversation at once would show.
+* ``--lock-processes`` runs only ``LocalLockStore``: every process has
+  ``--tasks`` tasks that each take the lock of one of ``--conversations``
+  conversations, read and rewrite a counter file of that conversation
+  across ``--hold-ms`` of waiting, and let go. Fewer conversations means
+  more contention. It reports lock acquisitions per second, how long they
+  waited, and lost counter updates, which must be 0.
+
+    python -m benchmarks.worker_bench --workers 1 2 4 --sessions 400 --concurrency 32
+    python -m benchmarks.worker_bench --lock-processes 1 2 4 8 --conversations 4
+
+The action server is a single process in every replay run, so with many
+workers it can become the limit; check its share in the ``action_server``
+phase of each run.
+"""
+import argparse
+import asyncio
+import glob
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Sequence, Text, Tuple
+
+from benchmarks.common import (
+    PROJECT_ROOT, environment, load_results, summarize, wait_for_url, write_results,
+)
+from benchmarks.replay_bench import (
+    ACTION_SERVER_URL, SERVER_URL, STORY_PATHS, Replay, _replay, load_scripts, start_servers,
+)
+
+REPLAY_COLUMNS = (
+    ('workers', 'workers', '{}'),
+    ('sessions_per_s', 'sessions/s', '{:.1f}'),
+    ('turns_per_s', 'turns/s', '{:.1f}'),
+    ('speedup', 'speedup', '{:.2f}x'),
+    ('efficiency', 'efficiency', '{:.0%}'),
+    ('p50_ms', 'p50 ms', '{:.1f}'),
+    ('p95_ms', 'p95 ms', '{:.1f}'),
+    ('errors', 'errors', '{}'),
+    ('mismatched_turns', 'mismatched', '{}'),
+)
+
+LOCK_COLUMNS = (
+    ('processes', 'processes', '{}'),
+    ('acquisitions_per_s', 'locks/s', '{:.0f}'),
+    ('speedup', 'speedup', '{:.2f}x'),
+    ('waited', 'waited', '{:.0%}'),
+    ('wait_p50_ms', 'wait p50 ms', '{:.1f}'),
+    ('wait_p95_ms', 'wait p95 ms', '{:.1f}'),
+    ('lost_updates', 'lost updates', '{}'),
+)
+
+
+def markdown_table(rows: Sequence[Dict[Text, Any]],
+                   columns: Sequence[Tuple[Text, Text, Text]]) -> Text:
+    lines = [
+        '| ' + ' | '.join(title for _, title, _ in columns) + ' |',
+        '|' + '|'.join('---' for _ in columns) + '|',
+    ]
+    for row in rows:
+        cells = [
+            '-' if row.get(key) is None else template.format(row[key])
+            for key, _, template in columns
+        ]
+        lines.append('| ' + ' | '.join(cells) + ' |')
+    return '\n'.join(lines)
+
+
+def add_speedup(rows: List[Dict[Text, Any]], rate: Text, scale: Text) -> None:
+    """Speedup and efficiency of every row against the first one"""
+    if not rows or not rows[0].get(rate):
+        return
+    base = rows[0]
+    for row in rows:
+        row['speedup'] = row[rate] / base[rate]
+        row['efficiency'] = row['speedup'] * base[scale] / row[scale]
+
+
+def replay_run(workers: int, args: argparse.Namespace,
+               scripts: Sequence[Any]) -> Dict[Text, Any]:
+    """Replay the stories against a fresh server with `workers` processes"""
+    port = int(args.url.split(':')[-1].split('/')[0])
+    servers = start_servers(port, args.action_server, args.action_server, args.model, workers)
+    try:
+        wait_for_url(args.action_server.rsplit('/', 1)[0] + '/health', args.startup_timeout)
+        wait_for_url(args.url, args.startup_timeout)
+        # Every worker loads its models lazily, so each gets warm-up sessions
+        replays = []
+        if args.warmup:
+            replays.append(Replay(args.url, scripts, args.warmup * workers, workers,
+                                  0.0, 0.0, None))
+        replays.append(Replay(args.url, scripts, args.sessions, args.concurrency, 0.0, 0.0,
+                              None, args.max_mismatches))
+        result = asyncio.run(_replay(replays, None))
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+    return {
+        'workers': workers,
+        'sessions_per_s': result['sessions_per_s'],
+        'turns_per_s': result['turns']['throughput_per_s'],
+        'p50_ms': result['turns']['p50_ms'],
+        'p95_ms': result['turns']['p95_ms'],
+        'p99_ms': result['turns']['p99_ms'],
+        'errors': result['errors'],
+        'mismatched_turns': result['expected_actions']['mismatched_turns'],
+        'replay': result,
+    }
+
+
+def lock_child(args: argparse.Namespace) -> int:
+    """One contending process of the lock run"""
+    from addons.lock_store import LocalLockStore
+
+    store = LocalLockStore(path=args.lock_path)
+    rng = random.Random(os.getpid())
+    hold = args.hold_ms / 1000
+    waits: List[float] = []
+
+    async def task(rounds: int) -> None:
+        for _ in range(rounds):
+            conversation = f'conversation-{rng.randrange(args.conversations)}'
+            counter = os.path.join(args.counter_dir, conversation)
+            requested = time.perf_counter()
+            async with store.lock(conversation):
+                waits.append(time.perf_counter() - requested)
+                try:
+                    with open(counter, encoding='utf-8') as counter_file:
+                        count = int(counter_file.read() or 0)
+                except FileNotFoundError:
+                    count = 0
+                # Another holder of the lock would overwrite this update
+                await asyncio.sleep(hold)
+                with open(counter, 'w', encoding='utf-8') as counter_file:
+                    counter_file.write(str(count + 1))
+
+    async def run() -> Tuple[float, float]:
+        await asyncio.sleep(max(0.0, args.start_at - time.time()))
+        started = time.time()
+        rounds = [args.rounds // args.tasks + (index < args.rounds % args.tasks)
+                  for index in range(args.tasks)]
+        await asyncio.gather(*(task(count) for count in rounds))
+        return started, time.time()
+
+    started, finished = asyncio.run(run())
+    write_results({
+        'started_at': started,
+        'finished_at': finished,
+        'waits_s': waits,
+        'store': store.stats(),
+    }, args.output)
+    return 0
+
+
+def lock_run(processes: int, args: argparse.Namespace, workdir: Text) -> Dict[Text, Any]:
+    """`processes` processes contending for the locks of a few conversations"""
+    directory = os.path.join(workdir, f'locks-{processes}')
+    counters = os.path.join(directory, 'counters')
+    os.makedirs(counters)
+    # Every child starts at the same moment, once all have imported Rasa
+    start_at = time.time() + args.lock_startup
+    outputs = [os.path.join(directory, f'child-{index}.json') for index in range(processes)]
+    children = [
+        subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.worker_bench', '--lock-child',
+             '--lock-path', os.path.join(directory, 'locks.db'), '--counter-dir', counters,
+             '--start-at', str(start_at), '--rounds', str(args.rounds), '--tasks', str(args.tasks),
+             '--conversations', str(args.conversations), '--hold-ms', str(args.hold_ms),
+             '--output', output],
+            cwd=PROJECT_ROOT,
+        )
+        for output in outputs
+    ]
+    for child in children:
+        if child.wait():
+            raise RuntimeError(f"Lock benchmark process failed with {child.returncode}")
+    results = [load_results(output) for output in outputs]
+    if max(result['started_at'] for result in results) > start_at + 1:
+        print(f"Lock processes were not all ready after {args.lock_startup:.0f}s; "
+              f"raise --lock-startup", file=sys.stderr)
+
+    waits = [wait for result in results for wait in result['waits_s']]
+    waited = sum(result['store']['waits'] for result in results)
+    elapsed = max(result['finished_at'] for result in results) - start_at
+    counted = 0
+    for path in glob.glob(os.path.join(counters, '*')):
+        with open(path, encoding='utf-8') as counter_file:
+            counted += int(counter_file.read() or 0)
+    wait_summary = summarize(waits)
+    return {
+        'processes': processes,
+        'acquisitions': len(waits),
+        'acquisitions_per_s': len(waits) / elapsed if elapsed else 0.0,
+        # Share of acquisitions that found the lock held by another task
+        'waited': waited / len(waits) if waits else 0.0,
+        'wait_p50_ms': wait_summary['p50_ms'],
+        'wait_p95_ms': wait_summary['p95_ms'],
+        'wait_p99_ms': wait_summary['p99_ms'],
+        'lost_updates': len(waits) - counted,
+        'elapsed_s': elapsed,
+    }
+
+
+def main(argv: Optional[Sequence[Text]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--workers', type=int, nargs='*', default=[],
+                        help='Rasa server worker counts to replay the stories against')
+    parser.add_argument('--url', default=SERVER_URL, help=f'Rasa server (default: {SERVER_URL})')
+    parser.add_argument('--action-server', default=ACTION_SERVER_URL)
+    parser.add_argument('--model', help='model to serve (default: latest in models/)')
+    parser.add_argument('--sessions', type=int, default=400,
+                        help='conversations per worker count (default: 400)')
+    parser.add_argument('--concurrency', type=int, default=32,
+                        help='conversations in flight at once (default: 32)')
+    parser.add_argument('--warmup', type=int, default=5,
+                        help='untimed sessions per worker before each run (default: 5)')
+    parser.add_argument('--stories', nargs='*', default=list(STORY_PATHS))
+    parser.add_argument('--startup-timeout', type=float, default=300)
+    parser.add_argument('--max-mismatches', type=int, default=20)
+
+    parser.add_argument('--lock-processes', type=int, nargs='*', default=[],
+                        help='process counts contending for the lock store alone')
+    parser.add_argument('--conversations', type=int, default=4,
+                        help='conversations whose locks the processes share (default: 4)')
+    parser.add_argument('--rounds', type=int, default=500,
+                        help='lock acquisitions per process (default: 500)')
+    parser.add_argument('--tasks', type=int, default=4,
+                        help='concurrent tasks per process (default: 4)')
+    parser.add_argument('--hold-ms', type=float, default=2.0,
+                        help='how long each acquisition holds the lock (default: 2)')
+    parser.add_argument('--lock-startup', type=float, default=10.0,
+                        help='seconds the lock processes get to start (default: 10)')
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    parser.add_argument('--lock-child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--lock-path', help=argparse.SUPPRESS)
+    parser.add_argument('--counter-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--start-at', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.lock_child:
+        return lock_child(args)
+    if not args.workers and not args.lock_processes:
+        parser.error('give --workers, --lock-processes or both')
+
+    results: Dict[Text, Any] = {'environment': environment()}
+    failed = False
+    if args.lock_processes:
+        with tempfile.TemporaryDirectory() as workdir:
+            rows = [lock_run(processes, args, workdir) for processes in args.lock_processes]
+        add_speedup(rows, 'acquisitions_per_s', 'processes')
+        results['lock_store'] = {'conversations': args.conversations, 'tasks': args.tasks,
+                                 'hold_ms': args.hold_ms, 'runs': rows}
+        print(markdown_table(rows, LOCK_COLUMNS), file=sys.stderr)
+        failed |= any(row['lost_updates'] for row in rows)
+
+    if args.workers:
+        scripts = load_scripts(args.stories)
+        rows = []
+        for workers in args.workers:
+            print(f"Replaying against {workers} worker(s)", file=sys.stderr)
+            rows.append(replay_run(workers, args, scripts))
+        add_speedup(rows, 'turns_per_s', 'workers')
+        results['replay'] = {'concurrency': args.concurrency, 'sessions': args.sessions,
+                             'runs': rows}
+        print(markdown_table(rows, REPLAY_COLUMNS), file=sys.stderr)
+        failed |= any(row['errors'] or row['mismatched_turns'] for row in rows)
+
+    write_results(results, args.output)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,19 @@
+"""Shared fixtures for the action and add-on tests"""
+from typing import Any, Callable, Dict, List, Optional, Text
+
+import pytest
+
+
+@pytest.fixture
+def make_tracker() -> Callable[..., Any]:
+    """Build a rasa_sdk Tracker from the parts a test cares about"""
+    from rasa_sdk import Tracker
+
+    def build(text: Text = '', sender_id: Text = 'sender', message_id: Optional[Text] = None,
+              events: Optional[List[Dict[Text, Any]]] = None,
+              slots: Optional[Dict[Text, Any]] = None) -> Tracker:
+        latest_message = {'text': text, 'intent': {}, 'entities': [], 'message_id': message_id}
+        return Tracker(sender_id, slots or {}, latest_message, events or [], False, None, {},
+                       'action_listen')
+
+    return build
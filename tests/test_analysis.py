@@ -0,0 +1,53 @@
+"""AnalysisCache: one analysis per turn, bounded by size and TTL"""
+import pytest
+
+pytest.importorskip('rasa_sdk')
+
+from actions.analysis import AnalysisCache  # noqa: E402
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_second_action_of_a_turn_reuses_the_analysis(make_tracker):
+    cache = AnalysisCache(max_size=10, ttl=60)
+    tracker = make_tracker('tell me about ednect', message_id='m1')
+    first = cache.get(tracker)
+    assert cache.get(tracker) is first
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+    assert 'ednect' in first.products
+
+
+def test_key_falls_back_to_the_text_without_a_message_id(make_tracker):
+    same = AnalysisCache.key_for(make_tracker('hello'))
+    assert same == AnalysisCache.key_for(make_tracker('hello'))
+    assert same != AnalysisCache.key_for(make_tracker('hello there'))
+    assert same != AnalysisCache.key_for(make_tracker('hello', sender_id='other'))
+
+
+def test_entries_expire_after_the_ttl(make_tracker):
+    clock = Clock()
+    cache = AnalysisCache(max_size=10, ttl=5, clock=clock)
+    tracker = make_tracker('hello', message_id='m1')
+    first = cache.get(tracker)
+    clock.now = 6
+    assert cache.get(tracker) is not first
+    assert cache.stats()['expirations'] == 1
+
+
+def test_least_recently_used_entry_is_evicted(make_tracker):
+    cache = AnalysisCache(max_size=2, ttl=60)
+    first, second, third = (make_tracker('hello', message_id=f'm{index}') for index in range(3))
+    kept = cache.get(first)
+    cache.get(second)
+    cache.get(first)
+    cache.get(third)
+    stats = cache.stats()
+    assert stats['size'] == 2 and stats['evictions'] == 1
+    assert cache.get(first) is kept
+    assert cache.stats()['misses'] == 3
@@ -0,0 +1,68 @@
+"""Incremental conversation context"""
+import pytest
+
+pytest.importorskip('rasa_sdk')
+
+from actions.context import ContextStore, new_events  # noqa: E402
+
+ACTION = 'action_extract_context'
+
+
+def _user(text, timestamp):
+    return {'event': 'user', 'text': text, 'timestamp': timestamp, 'parse_data': {}}
+
+
+def _action(name, timestamp):
+    return {'event': 'action', 'name': name, 'timestamp': timestamp}
+
+
+def test_new_events_walks_back_to_the_cursor():
+    events = [_user('a', 1), _action('utter_a', 2), _user('b', 3), _action('utter_b', 4)]
+    found, newest = new_events(events, cursor=2)
+    assert [event['text'] for event in found] == ['b']
+    assert newest == 4
+    assert new_events(events, cursor=4) == ([], 4)
+
+
+def test_new_events_stops_at_the_previous_run_and_the_limit():
+    events = [_user('a', 1), _action(ACTION, 2), _user('b', 3),
+              {'event': 'restart', 'timestamp': 4}, _user('c', 5)]
+    found, _ = new_events(events, cursor=0, stop_action=ACTION)
+    assert [event['event'] for event in found] == ['user', 'restart', 'user']
+    found, _ = new_events(events, cursor=0, limit=2)
+    assert [event.get('text') for event in found] == [None, 'c']
+
+
+def test_only_changed_slots_are_returned(make_tracker):
+    store = ContextStore()
+    events = [_user('we are a school with 1200 students, tell me about ednect', 1)]
+    slots = store.extract(make_tracker(events=events), ACTION)
+    assert slots['product_name'] == 'ednect'
+    assert slots['institute_type'] == 'school'
+    assert slots['size_hint'] == '1200 students'
+
+    events += [_action(ACTION, 2), _user('and icebox?', 3)]
+    changed = store.extract(make_tracker(events=events, slots=slots), ACTION)
+    assert changed == {'product_name': 'icebox', 'products_mentioned': ['icebox', 'ednect']}
+    assert store.stats()['hits'] == 1
+
+
+def test_evicted_context_is_rebuilt_from_the_slots(make_tracker):
+    store = ContextStore(max_size=1)
+    events = [_user('tell me about ednect', 1)]
+    slots = store.extract(make_tracker(events=events), ACTION)
+    store.extract(make_tracker(events=[_user('hi', 1)], sender_id='other'), ACTION)
+
+    events += [_action(ACTION, 2), _user('thanks', 3)]
+    assert store.extract(make_tracker(events=events, slots=slots), ACTION) == {}
+    assert store.stats()['misses'] == 3
+
+
+def test_restart_clears_the_slots(make_tracker):
+    store = ContextStore()
+    events = [_user('a college running ednect', 1)]
+    slots = store.extract(make_tracker(events=events), ACTION)
+    events += [_action(ACTION, 2), {'event': 'restart', 'timestamp': 3}, _user('hello', 4)]
+    cleared = store.extract(make_tracker(events=events, slots=slots), ACTION)
+    assert set(cleared) == set(slots)
+    assert all(value is None for value in cleared.values())
@@ -0,0 +1,129 @@
+"""Event files: writing, rotation and drops in the broker, reading them back"""
+import asyncio
+import gzip
+import json
+import os
+import time
+
+import pytest
+
+from addons.event_reader import FILE_PREFIX, FILE_SUFFIX, event_files, iter_events, summarize
+
+
+def _write_file(directory, name, lines):
+    path = os.path.join(directory, f'{FILE_PREFIX}{name}{FILE_SUFFIX}')
+    with gzip.open(path, 'wt', encoding='utf-8') as events_file:
+        events_file.write(lines)
+    return path
+
+
+def _event(sender_id, event='action', **fields):
+    return {'sender_id': sender_id, 'event': event, **fields}
+
+
+def test_reader_filters_and_reads_files_oldest_first(tmp_path):
+    directory = str(tmp_path)
+    _write_file(directory, '20260102T000000-1-0001', json.dumps(_event('b', name='utter_b')) + '\n')
+    _write_file(directory, '20260101T000000-1-0001', ''.join(
+        json.dumps(event) + '\n' for event in (
+            _event('a', name='utter_a'),
+            _event('a', 'slot', name='product_name', value='ednect'),
+            _event('a', 'user', parse_data={'intent': {'name': 'greet'}}),
+        )
+    ))
+    assert [event['sender_id'] for event in iter_events(directory)] == ['a', 'a', 'a', 'b']
+    assert [event['name'] for event in iter_events(directory, types=['action'])] == [
+        'utter_a', 'utter_b',
+    ]
+    assert len(list(iter_events(directory, sender_id='b'))) == 1
+
+    summary = summarize(iter_events(directory))
+    assert summary['events'] == 4 and summary['conversations'] == 2
+    assert summary['intents'] == {'greet': 1}
+    assert summary['slots'] == {'product_name': {'ednect': 1}}
+
+
+def test_reader_stops_at_a_truncated_end(tmp_path):
+    directory = str(tmp_path)
+    lines = ''.join(json.dumps(_event('a', index=index)) + '\n' for index in range(200))
+    path = _write_file(directory, '20260101T000000-1-0001', lines + '{"partial": ')
+    assert len(list(iter_events(directory))) == 200
+
+    with open(path, 'rb') as events_file:
+        data = events_file.read()
+    with open(path, 'wb') as events_file:
+        events_file.write(data[:len(data) // 2])
+    read = list(iter_events(directory))
+    assert read == [_event('a', index=index) for index in range(len(read))]
+
+
+@pytest.fixture
+def make_broker(tmp_path):
+    pytest.importorskip('rasa')
+    from addons.event_broker import LocalEventBroker
+
+    brokers = []
+
+    def build(**kwargs):
+        settings = dict(directory=str(tmp_path), batch_size=10, flush_interval=0.01)
+        settings.update(kwargs)
+        broker = LocalEventBroker(**settings)
+        brokers.append(broker)
+        return broker
+
+    yield build
+    for broker in brokers:
+        broker._stop()
+
+
+def test_broker_rotates_files_and_keeps_the_order(make_broker, tmp_path):
+    broker = make_broker(max_file_bytes=1)
+    for index in range(35):
+        broker.publish(_event('a', index=index))
+    asyncio.run(broker.close())
+
+    assert len(event_files(str(tmp_path))) == 4
+    assert [event['index'] for event in iter_events(str(tmp_path))] == list(range(35))
+    assert broker.stats() == {'buffered': 0, 'published': 35, 'written': 35, 'dropped': 0}
+
+
+def test_full_buffer_drops_without_waiting(make_broker):
+    broker = make_broker(max_buffer=5)
+    broker._write_with_retry = lambda batch: time.sleep(0.5)
+    started = time.perf_counter()
+    for index in range(50):
+        broker.publish(_event('a', index=index))
+    assert time.perf_counter() - started < 0.2
+    assert broker.stats()['dropped'] >= 35
+
+
+def test_closed_broker_drops_events(make_broker):
+    broker = make_broker()
+    asyncio.run(broker.close())
+    broker.publish(_event('a'))
+    assert broker.stats()['dropped'] == 1 and broker.stats()['published'] == 0
+
+
+def test_failed_write_is_retried_in_a_new_file(make_broker, tmp_path, monkeypatch):
+    from addons import event_broker
+
+    monkeypatch.setattr(event_broker, 'RETRY_DELAY', 0.01)
+    broker = make_broker()
+    write = broker._write
+    failures = [2]
+
+    def flaky(batch):
+        if failures[0]:
+            failures[0] -= 1
+            raise OSError('disk full')
+        write(batch)
+
+    broker._write = flaky
+    for index in range(5):
+        broker.publish(_event('a', index=index))
+    deadline = time.monotonic() + 5
+    while broker.stats()['written'] < 5 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    asyncio.run(broker.close())
+    assert failures == [0]
+    assert [event['index'] for event in iter_events(str(tmp_path))] == list(range(5))
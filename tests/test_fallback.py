@@ -0,0 +1,58 @@
+"""Fallback routing and the ring buffer of fallback messages"""
+import json
+import os
+
+import pytest
+
+pytest.importorskip('rasa_sdk')
+
+from actions.analysis import analyze_text  # noqa: E402
+from actions.fallback import HELP_MENU, PRODUCT_HELP, ROUTER, FallbackLog, log_files  # noqa: E402
+
+
+@pytest.mark.parametrize('text, route', [
+    ('are you hiring? I want to apply for a job', 'job'),
+    ('how do I buy it, can I get a quote', 'purchase'),
+    ('my laptop is broken', 'tech_support'),
+    ('hmm ok', HELP_MENU),
+])
+def test_best_scoring_route_answers(text, route):
+    assert ROUTER.route(analyze_text(text)) == route
+
+
+def test_off_topic_route_gives_way_when_a_product_is_named():
+    assert ROUTER.route(analyze_text('ednect is not working')) == PRODUCT_HELP
+    assert ROUTER.route(analyze_text('ednect is not working, can I buy a demo')) == 'purchase'
+
+
+def test_route_templates_come_from_the_catalog():
+    assert ROUTER.template('job') == 'careers'
+    assert ROUTER.template(HELP_MENU) == HELP_MENU
+
+
+def test_ring_buffer_counts_overwritten_unwritten_entries(make_tracker):
+    log = FallbackLog(directory='', capacity=3)
+    for index in range(5):
+        log.record(make_tracker(f'message {index}'), HELP_MENU)
+    assert [entry['text'] for entry in log.recent()] == ['message 2', 'message 3', 'message 4']
+    assert [entry['text'] for entry in log.recent(1)] == ['message 4']
+    stats = log.stats()
+    assert (stats['recorded'], stats['dropped'], stats['buffered']) == (5, 2, 3)
+    assert log.flush() == 0
+
+
+def test_flush_appends_only_the_unwritten_entries(make_tracker, tmp_path):
+    log = FallbackLog(directory=str(tmp_path), capacity=10, flush_interval=3600)
+    log.record(make_tracker('first'), HELP_MENU)
+    assert log.flush() == 1
+    log.record(make_tracker('second'), 'job')
+    assert log.flush() == 1
+    assert log.flush() == 0
+
+    [path] = log_files(str(tmp_path))
+    with open(path, encoding='utf-8') as log_file:
+        entries = [json.loads(line) for line in log_file]
+    assert [(entry['text'], entry['route']) for entry in entries] == [
+        ('first', HELP_MENU), ('second', 'job'),
+    ]
+    assert os.path.basename(path).endswith('.jsonl')
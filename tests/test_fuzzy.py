@@ -0,0 +1,70 @@
+"""Typo-tolerant product name lookup"""
+import pytest
+
+from actions.fuzzy import FuzzyIndex, deletes, edit_distance
+from actions.matcher import scan
+
+
+@pytest.mark.parametrize('source, target, distance', [
+    ('ednect', 'ednect', 0),
+    ('ednet', 'ednect', 1),
+    ('ednetc', 'ednect', 1),
+    ('transtrak', 'transtrack', 1),
+    ('trnstrak', 'transtrack', 2),
+])
+def test_edit_distance_counts_transpositions_as_one_edit(source, target, distance):
+    assert edit_distance(source, target, 2) == distance
+
+
+def test_edit_distance_stops_past_the_limit():
+    assert edit_distance('icebox', 'desalite', 2) == 3
+    assert edit_distance('ab', 'abcdef', 2) == 3
+
+
+def test_deletes_include_the_word_itself():
+    assert deletes('abc', 1) == {'abc', 'bc', 'ac', 'ab'}
+    assert 'a' in deletes('abc', 2)
+
+
+@pytest.fixture
+def index():
+    return FuzzyIndex.from_aliases({
+        'ednect': ['ednect'],
+        'transtrack': ['transtrack', 'trans track'],
+        'icebox': ['icebox'],
+    })
+
+
+def test_exact_and_run_together_spellings(index):
+    assert index.lookup('ednect').distance == 0
+    assert index.lookup('transtrack').value == 'transtrack'
+    assert len(index) == 3
+
+
+def test_short_tokens_allow_one_edit_and_long_ones_two(index):
+    assert index.lookup('ednet').value == 'ednect'
+    assert index.lookup('icbx') is None
+    assert index.lookup('trnstrak') is None
+    match = index.lookup('tarnstrak')
+    assert (match.value, match.distance) == ('transtrack', 2)
+
+
+def test_tokens_below_the_minimum_length_only_match_exactly():
+    index = FuzzyIndex({'erp': 'erp'})
+    assert index.lookup('erp').value == 'erp'
+    assert index.lookup('erv') is None
+
+
+@pytest.mark.parametrize('text, products', [
+    ('ice bx please', ['icebox']),
+    ('trans trak', ['transtrack']),
+    ('a nice box of chocolates', []),
+])
+def test_only_a_word_that_starts_a_name_is_joined_with_the_next(text, products):
+    assert scan(text).products() == products
+
+
+def test_prefixes_of_indexed_spellings_start_a_term(index):
+    assert index.starts_term('ice') and index.starts_term('trans')
+    assert not index.starts_term('nice')
+    assert not index.starts_term('ic')
@@ -0,0 +1,82 @@
+"""Ticket locks shared through a SQLite file"""
+import asyncio
+import os
+import time
+
+import pytest
+
+pytest.importorskip('rasa')
+
+from addons.lock_store import LocalLockStore  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalLockStore(path=os.path.join(str(tmp_path), 'locks.db'), poll_interval=0.005)
+
+
+def test_tickets_are_issued_in_order_and_returned(store):
+    first = store.issue_ticket('conversation')
+    second = store.issue_ticket('conversation')
+    assert second == first + 1
+    lock = store.get_lock('conversation')
+    assert not lock.is_locked(first) and lock.is_locked(second)
+
+    store.cleanup('conversation', first)
+    assert not store.get_lock('conversation').is_locked(second)
+    store.cleanup('conversation', second)
+    assert store.get_lock('conversation') is None
+
+
+def test_second_store_on_the_same_file_sees_the_tickets(store):
+    other = LocalLockStore(path=store.path)
+    ticket = store.issue_ticket('conversation')
+    assert other.issue_ticket('conversation') == ticket + 1
+    assert other.get_lock('conversation').is_locked(ticket + 1)
+
+
+def test_messages_of_one_conversation_are_handled_in_ticket_order(store):
+    handled = []
+
+    async def handle(number):
+        async with store.lock('conversation'):
+            handled.append(('start', number))
+            await asyncio.sleep(0.01)
+            handled.append(('end', number))
+
+    async def main():
+        tasks = []
+        for number in range(4):
+            tasks.append(asyncio.ensure_future(handle(number)))
+            # Lets each message take its ticket before the next arrives
+            await asyncio.sleep(0.005)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert handled == [(step, number) for number in range(4) for step in ('start', 'end')]
+    assert store.get_lock('conversation') is None
+    assert store.stats()['waits'] == 3
+
+
+def test_other_conversations_do_not_wait(store):
+    async def main():
+        async with store.lock('first'):
+            async with store.lock('second'):
+                return True
+
+    assert asyncio.run(main())
+    assert store.stats()['waits'] == 0
+
+
+def test_holder_that_never_returns_its_ticket_is_skipped_once_expired(store):
+    # Taken by a worker that died before handing it back
+    store.issue_ticket('conversation', lock_lifetime=0.05)
+    started = time.monotonic()
+
+    async def main():
+        async with store.lock('conversation', lock_lifetime=5):
+            return time.monotonic() - started
+
+    assert asyncio.run(main()) >= 0.05
+    stats = store.stats()
+    assert (stats['waits'], stats['held']) == (1, 0)
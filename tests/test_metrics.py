@@ -0,0 +1,66 @@
+"""Action metrics in the Prometheus text format"""
+import pytest
+
+pytest.importorskip('rasa_sdk')
+
+from rasa_sdk import Action  # noqa: E402
+from rasa_sdk.executor import CollectingDispatcher  # noqa: E402
+
+from actions.metrics import REGISTRY, MetricsRegistry, instrumented  # noqa: E402
+
+
+def test_counter_renders_help_type_and_escaped_labels():
+    registry = MetricsRegistry()
+    registry.counter('calls_total', 'Calls.')
+    registry.inc('calls_total', (('action', 'say "hi"\n'),))
+    registry.inc('calls_total', (('action', 'say "hi"\n'),), 2)
+    assert registry.render() == (
+        '# HELP calls_total Calls.\n'
+        '# TYPE calls_total counter\n'
+        'calls_total{action="say \\"hi\\"\\n"} 3\n'
+    )
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    registry.histogram('latency_seconds', 'Latency.', (0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        registry.observe('latency_seconds', (('action', 'a'),), value)
+    lines = registry.render().splitlines()
+    assert lines[2:] == [
+        'latency_seconds_bucket{action="a",le="0.1"} 1',
+        'latency_seconds_bucket{action="a",le="1"} 3',
+        'latency_seconds_bucket{action="a",le="+Inf"} 4',
+        'latency_seconds_sum{action="a"} 4.05',
+        'latency_seconds_count{action="a"} 4',
+    ]
+
+
+def test_failing_gauge_is_left_out():
+    registry = MetricsRegistry()
+    registry.gauge('size', 'Size.', lambda: {(): 5})
+    registry.gauge('broken', 'Broken.', lambda: 1 / 0)
+    text = registry.render()
+    assert 'size 5\n' in text
+    assert not any(line.startswith('broken') for line in text.splitlines())
+
+
+def test_instrumented_action_counts_runs_errors_and_bytes():
+    @instrumented
+    class ActionTestMetrics(Action):
+        def name(self):
+            return 'action_test_metrics'
+
+        def run(self, dispatcher, tracker, domain):
+            if tracker == 'fail':
+                raise ValueError(tracker)
+            dispatcher.utter_message(text='héllo')
+            return []
+
+    labels = (('action', 'action_test_metrics'),)
+    ActionTestMetrics().run(CollectingDispatcher(), None, {})
+    with pytest.raises(ValueError):
+        ActionTestMetrics().run(CollectingDispatcher(), 'fail', {})
+    assert REGISTRY.value('vaspx_action_calls_total', labels) == 2
+    assert REGISTRY.value('vaspx_action_errors_total', labels) == 1
+    assert 'vaspx_action_response_bytes_sum{action="action_test_metrics"} 6' in REGISTRY.render()
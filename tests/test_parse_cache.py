@@ -0,0 +1,118 @@
+"""Parse cache keying, expiry and the runtime switch"""
+import pytest
+
+pytest.importorskip('rasa')
+
+from rasa.engine.graph import ExecutionContext, GraphSchema  # noqa: E402
+from rasa.engine.storage.resource import Resource  # noqa: E402
+from rasa.shared.nlu.constants import ENTITIES, INTENT, INTENT_RANKING_KEY, TEXT  # noqa: E402
+from rasa.shared.nlu.training_data.message import Message  # noqa: E402
+
+from addons import parse_cache  # noqa: E402
+from addons.parse_cache import (  # noqa: E402
+    PARSE_CACHE_HIT, ParseCache, ParseCacheRecorder, ParseResultCache, normalize,
+)
+
+
+def _result(intent, entities=()):
+    return {
+        INTENT: {'name': intent, 'confidence': 0.9},
+        INTENT_RANKING_KEY: [{'name': intent, 'confidence': 0.9}],
+        ENTITIES: list(entities),
+    }
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches(monkeypatch):
+    monkeypatch.delenv('VASPX_PARSE_CACHE', raising=False)
+    parse_cache._caches.clear()
+    yield
+    parse_cache._caches.clear()
+
+
+def _components(model_id='model-1', exact=None):
+    context = ExecutionContext(GraphSchema({}), model_id=model_id)
+    resource = Resource('parse_cache')
+    return (ParseCache({}, None, resource, context, exact or {}),
+            ParseCacheRecorder.create({}, None, resource, context))
+
+
+def test_normalize_lowercases_and_collapses_whitespace():
+    assert normalize('  Tell me\tabout   EDNECT ') == 'tell me about ednect'
+
+
+def test_key_ignores_case_but_entities_need_the_exact_text():
+    cache = ParseResultCache(max_size=10, ttl=60)
+    cache.put(normalize('Hello'), 'Hello', _result('greet'))
+    assert cache.get(normalize('hello '), 'hello ')[INTENT]['name'] == 'greet'
+
+    entities = [{'entity': 'product_name', 'start': 6, 'end': 12, 'value': 'ednect'}]
+    cache.put(normalize('About EDNECT'), 'About EDNECT', _result('ask_product', entities))
+    assert cache.get(normalize('about ednect'), 'about ednect') is None
+    assert cache.get(normalize('About EDNECT'), 'About EDNECT') is not None
+
+
+def test_entries_expire_and_the_oldest_is_evicted(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(parse_cache.time, 'monotonic', lambda: now[0])
+    cache = ParseResultCache(max_size=2, ttl=10)
+    for text in ('a', 'b', 'c'):
+        cache.put(text, text, _result(text))
+    assert cache.get('a', 'a') is None
+    assert cache.get('b', 'b') is not None
+    now[0] = 11
+    assert cache.get('c', 'c') is None
+
+
+def test_recorded_miss_is_answered_next_time_as_a_copy():
+    cache, recorder = _components()
+    message = Message(data={TEXT: 'Hi there'})
+    cache.process([message])
+    assert not message.get(PARSE_CACHE_HIT)
+    message.set(INTENT, {'name': 'greet', 'confidence': 0.8})
+    recorder.process([message])
+
+    first, second = Message(data={TEXT: 'hi  there'}), Message(data={TEXT: 'hi there'})
+    cache.process([first, second])
+    assert first.get(PARSE_CACHE_HIT) == 'recent'
+    assert first.get(INTENT)['name'] == 'greet'
+    first.get(INTENT)['name'] = 'changed'
+    assert second.get(INTENT)['name'] == 'greet'
+
+
+def test_exact_match_answers_training_examples():
+    cache, _ = _components(exact={'hello': 'greet'})
+    message = Message(data={TEXT: 'Hello'})
+    cache.process([message])
+    assert message.get(PARSE_CACHE_HIT) == 'exact'
+    assert message.get(INTENT) == {'name': 'greet', 'confidence': 1.0}
+
+
+def test_caches_are_kept_per_model():
+    _, recorder = _components('model-1')
+    message = Message(data={TEXT: 'hi'})
+    message.set(INTENT, {'name': 'greet', 'confidence': 0.8})
+    recorder.process([message])
+    other, _ = _components('model-2')
+    fresh = Message(data={TEXT: 'hi'})
+    other.process([fresh])
+    assert not fresh.get(PARSE_CACHE_HIT)
+
+
+@pytest.mark.parametrize('mode, hit', [('off', None), ('0', None), ('recent', None),
+                                       ('on', 'exact')])
+def test_switch_is_read_when_the_model_loads(monkeypatch, mode, hit):
+    monkeypatch.setenv('VASPX_PARSE_CACHE', mode)
+    cache, _ = _components(exact={'hello': 'greet'})
+    message = Message(data={TEXT: 'hello'})
+    cache.process([message])
+    assert message.get(PARSE_CACHE_HIT) == hit
+
+
+def test_recorder_stores_nothing_when_the_cache_is_off(monkeypatch):
+    monkeypatch.setenv('VASPX_PARSE_CACHE', 'off')
+    _, recorder = _components()
+    message = Message(data={TEXT: 'hi'})
+    message.set(INTENT, {'name': 'greet', 'confidence': 0.8})
+    recorder.process([message])
+    assert parse_cache.cache_for('model-1').stats()['size'] == 0
@@ -0,0 +1,36 @@
+"""Industry ranking of action_provide_recommendation"""
+import pytest
+
+pytest.importorskip('rasa_sdk')
+
+from actions.recommender import SCORER, rank_industries  # noqa: E402
+from actions.scoring import KeywordScorer  # noqa: E402
+
+
+def test_school_running_a_fleet_and_a_cold_store_is_education_first():
+    assert rank_industries('school with bus fleet and a cold store') == (
+        'education', 'cold_storage', 'logistics'
+    )
+
+
+def test_extra_keywords_add_a_bonus_not_their_weight():
+    scores = SCORER.scores('we run a fleet of trucks and buses')
+    assert scores == {'logistics': pytest.approx(1.2)}
+
+
+def test_phrase_is_not_matched_again_as_its_tokens():
+    assert SCORER.scores('a cold storage unit') == {'cold_storage': pytest.approx(1.5)}
+
+
+def test_plural_counts_as_the_keyword():
+    assert rank_industries('software for schools') == ('education',)
+
+
+def test_below_minimum_score_is_not_ranked():
+    assert rank_industries('our inventory') == ()
+
+
+def test_without_bonus_keywords_add_up():
+    scorer = KeywordScorer({'a': {'x': 0.5, 'y': 0.5}, 'b': {'z': 0.8}}, ('a', 'b'))
+    assert scorer.scores('x y z') == {'a': 1.0, 'b': 0.8}
+    assert scorer.rank('x y z') == ('a', 'b')
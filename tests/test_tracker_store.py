@@ -0,0 +1,169 @@
+"""Saving, retrieving and compacting trackers in the local store"""
+import asyncio
+import os
+
+import pytest
+
+pytest.importorskip('rasa')
+
+from rasa.core.tracker_store import FailSafeTrackerStore  # noqa: E402
+from rasa.shared.core.constants import ACTION_LISTEN_NAME, ACTION_SESSION_START_NAME  # noqa: E402
+from rasa.shared.core.domain import Domain  # noqa: E402
+from rasa.shared.core.events import (  # noqa: E402
+    ActionExecuted, ActiveLoop, SessionStarted, SlotSet, UserUttered,
+)
+from rasa.shared.core.trackers import DialogueStateTracker  # noqa: E402
+
+from addons.tracker_store import LocalTrackerStore, compact_events  # noqa: E402
+
+DOMAIN = Domain.from_dict({
+    'intents': ['greet'],
+    'slots': {
+        'product_name': {'type': 'text', 'influence_conversation': False,
+                         'mappings': [{'type': 'custom'}]},
+    },
+})
+
+
+def _turn(number, *extra):
+    return [
+        UserUttered(f'message {number}', {'name': 'greet'}, timestamp=number),
+        *extra,
+        ActionExecuted('utter_greet', timestamp=number + 0.1),
+        ActionExecuted(ACTION_LISTEN_NAME, timestamp=number + 0.2),
+    ]
+
+
+def _session(timestamp):
+    return [
+        ActionExecuted(ACTION_SESSION_START_NAME, timestamp=timestamp),
+        SessionStarted(timestamp=timestamp),
+        ActionExecuted(ACTION_LISTEN_NAME, timestamp=timestamp),
+    ]
+
+
+def _users(events):
+    return [event.text for event in events if isinstance(event, UserUttered)]
+
+
+def test_short_conversation_is_left_alone():
+    events = [ActionExecuted(ACTION_LISTEN_NAME, timestamp=0)] + _turn(1) + _turn(2)
+    assert compact_events('sender', events, DOMAIN, keep_turns=5) is None
+
+
+def test_old_turns_become_the_state_they_left_behind():
+    events = [ActionExecuted(ACTION_LISTEN_NAME, timestamp=0)]
+    events += _turn(1, SlotSet('product_name', 'ednect', timestamp=1.05))
+    events += _turn(2, ActiveLoop('demo_form', timestamp=2.05))
+    for number in range(3, 8):
+        events += _turn(number)
+
+    compacted = compact_events('sender', events, DOMAIN, keep_turns=3)
+
+    assert _users(compacted) == ['message 5', 'message 6', 'message 7']
+    assert [type(event) for event in compacted[:3]] == [SlotSet, ActiveLoop, ActionExecuted]
+    assert (compacted[0].key, compacted[0].value) == ('product_name', 'ednect')
+    assert compacted[1].name == 'demo_form'
+    # The kept turns start after the listen that preceded them
+    assert compacted[2].action_name == ACTION_LISTEN_NAME
+    assert compacted[-3:] == events[-3:]
+
+
+def test_earlier_sessions_are_dropped():
+    events = _session(0) + _turn(1) + _turn(2) + _session(10) + _turn(11)
+
+    compacted = compact_events('sender', events, DOMAIN, keep_turns=5)
+
+    assert compacted == events[-6:]
+    assert compacted[0].action_name == ACTION_SESSION_START_NAME
+    assert _users(compacted) == ['message 11']
+
+
+def test_session_header_stays_in_front_of_the_summary():
+    events = _session(0)
+    events += _turn(1, SlotSet('product_name', 'icebox', timestamp=1.05))
+    for number in range(2, 5):
+        events += _turn(number)
+
+    compacted = compact_events('sender', events, DOMAIN, keep_turns=2)
+
+    assert compacted[:2] == events[:2]
+    assert isinstance(compacted[2], SlotSet) and compacted[2].value == 'icebox'
+    assert _users(compacted) == ['message 3', 'message 4']
+
+
+def _tracker(sender_id, turns):
+    events = [ActionExecuted(ACTION_LISTEN_NAME, timestamp=0)]
+    events += _turn(1, SlotSet('product_name', 'ednect', timestamp=1.05))
+    for number in range(2, turns + 1):
+        events += _turn(number)
+    return DialogueStateTracker.from_events(sender_id, events, slots=DOMAIN.slots)
+
+
+@pytest.fixture
+def make_store(tmp_path):
+    stores = []
+
+    def build(**kwargs):
+        store = LocalTrackerStore(DOMAIN, path=os.path.join(str(tmp_path), 'trackers.db'),
+                                  **kwargs)
+        stores.append(store)
+        return store
+
+    yield build
+    for store in stores:
+        store.close()
+
+
+def test_saved_tracker_is_retrieved_through_the_fail_safe_store(make_store):
+    store = make_store(flush_interval=0.01)
+    fail_safe = FailSafeTrackerStore(store)
+
+    async def round_trip():
+        await fail_safe.save(_tracker('sender', 2))
+        return await fail_safe.retrieve('sender'), await fail_safe.keys()
+
+    retrieved, keys = asyncio.run(round_trip())
+
+    # A failed save would have gone to the fallback store and been lost
+    assert fail_safe._fallback_tracker_store is None
+    assert _users(retrieved.events) == ['message 1', 'message 2']
+    assert retrieved.get_slot('product_name') == 'ednect'
+    assert list(keys) == ['sender']
+    assert store.stats()['hits'] == 1
+
+
+def test_saves_reach_the_file_and_survive_a_restart(make_store):
+    store = make_store()
+    asyncio.run(store.save(_tracker('sender', 3)))
+    store.close()
+    assert store.stats()['pending'] == 0 and store.flushes == 1
+
+    reopened = make_store()
+    retrieved = asyncio.run(reopened.retrieve('sender'))
+    assert _users(retrieved.events) == ['message 1', 'message 2', 'message 3']
+    assert reopened.stats()['misses'] == 1
+    assert asyncio.run(reopened.retrieve('unknown')) is None
+
+
+def test_long_conversation_is_stored_compacted(make_store):
+    store = make_store(keep_turns=3, compact_after=5)
+    asyncio.run(store.save(_tracker('sender', 8)))
+
+    retrieved = asyncio.run(store.retrieve('sender'))
+    assert _users(retrieved.events) == ['message 6', 'message 7', 'message 8']
+    assert retrieved.get_slot('product_name') == 'ednect'
+    assert store.stats()['compactions'] == 1
+
+
+def test_shared_stores_write_through_to_the_file(make_store):
+    first, second = make_store(shared=True), make_store(shared=True)
+
+    async def save_and_read():
+        await first.save(_tracker('sender', 2))
+        return await second.retrieve('sender'), await second.keys()
+
+    retrieved, keys = asyncio.run(save_and_read())
+    assert _users(retrieved.events) == ['message 1', 'message 2']
+    assert list(keys) == ['sender']
+    assert first.stats()['cached'] == 0 and first.stats()['pending'] == 0